@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Offline analytics over the answer history (needs NumPy).
+
+Streams answer logs (see answer_log.py) in chunks of CHUNK_SIZE events
+into NumPy columns keyed by the VerbEngine table cell (verb, tense, person)
+and adds every chunk into count arrays, so memory depends on the size of
+the verb table and the number of users, not on the length of the history:
+
+- error rates per verb, per tense, per (tense, person) and per form
+- cohorts: users by the week of their first answer, and answers by how
+  many the user had given before
+- confusion pairs: which form was typed instead of which (wrong answers
+  are matched to a table cell with VerbEngine.diagnose)
+
+Usage:
+    python analytics.py                                 # ANSWER_LOG_PATH and its shards
+    python analytics.py answers.jsonl --top 30 --min-answers 50 --output report.json
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from answer_log import STATS_GROUPS, iter_events, shard_path
+from config import ANSWER_LOG_PATH, VERB_DB_PATH, PERSONS, TENSES, TENSE_GROUPS
+from verb_engine import VerbEngine, Diagnosis, TENSE_LIST, TENSE_INDEX, PERSON_COUNT
+
+# Events converted to columns at a time
+CHUNK_SIZE = 1 << 16
+
+# Distinct (cell, wrong answer) diagnoses remembered across chunks
+DIAGNOSIS_CACHE_SIZE = 1 << 16
+
+WEEK = 7 * 24 * 3600
+# The Unix epoch is a Thursday; cohort weeks start on Monday
+_WEEK_OFFSET = 3 * 24 * 3600
+
+# Experience buckets by answers given before (lower bounds)
+EXPERIENCE_BUCKETS = (0, 50, 200, 1000, 5000)
+
+# Mistake kinds, stored as codes ("unknown": not close to any form)
+MISTAKE_KINDS = (Diagnosis.TYPO, Diagnosis.WRONG_PERSON, Diagnosis.WRONG_TENSE,
+                 Diagnosis.WRONG_FORM, Diagnosis.OTHER_VERB, 'unknown')
+_KIND_CODE = {kind: code for code, kind in enumerate(MISTAKE_KINDS)}
+
+# Tense index -> index in STATS_GROUPS
+_TENSE_GROUP = np.array([
+    next(index for index, group_key in enumerate(STATS_GROUPS) if tense in TENSE_GROUPS[group_key]['tenses'])
+    for tense in TENSE_LIST
+], dtype=np.int64)
+
+
+def history_paths(path):
+    """The log at path plus the per-user shards of webhook_server.py next to it."""
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.shard(\d+)(\.\d+)?' + re.escape(extension))
+    shards = set()
+    for candidate in glob.glob(glob.escape(root) + '.shard*'):
+        match = pattern.match(candidate)
+        if match:
+            shards.add(int(match.group(1)))
+    return [path] + [shard_path(path, shard) for shard in sorted(shards)]
+
+
+def _rates(errors, totals):
+    """errors / totals, 0 where there are no answers."""
+    return np.divide(errors, totals, out=np.zeros(np.shape(totals)), where=np.asarray(totals) > 0)
+
+
+class SparseCounts:
+    """Counts for int64 keys from an open-ended range, merged chunk by chunk.
+
+    Memory grows with the number of distinct keys, not with the number of events.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, keys):
+        """Count every key in the array once."""
+        if not len(keys):
+            return
+        keys, counts = np.unique(keys, return_counts=True)
+        merged, inverse = np.unique(np.concatenate((self.keys, keys)), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate((self.counts, counts)),
+                                  minlength=len(merged)).astype(np.int64)
+        self.keys = merged
+
+    def lookup(self, keys):
+        """Counts of the given keys (0 for keys never added)."""
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=np.int64)
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[position] == keys, self.counts[position], 0)
+
+    def top(self, limit):
+        """The limit most frequent (keys, counts), most frequent first."""
+        order = np.argsort(-self.counts, kind='stable')[:limit]
+        return self.keys[order], self.counts[order]
+
+
+class UserTable:
+    """First answer time and answer count per user, as arrays sorted by user ID."""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.first_seen = np.empty(0, dtype=np.float64)
+        self.answers = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, users, ts):
+        """Add a chunk of answers in log order.
+
+        Returns, per answer, the user's first answer time and how many
+        answers the user had given before it.
+        """
+        order = np.argsort(users, kind='stable')
+        ids, start, counts = np.unique(users[order], return_index=True, return_counts=True)
+        chunk_first = np.minimum.reduceat(ts[order], start)
+
+        position = np.searchsorted(self.ids, ids)
+        known = position < len(self.ids)
+        known[known] = self.ids[position[known]] == ids[known]
+        rows = position[known]
+        self.first_seen[rows] = np.minimum(self.first_seen[rows], chunk_first[known])
+        first_seen = chunk_first.copy()
+        first_seen[known] = self.first_seen[rows]
+        before = np.zeros(len(ids), dtype=np.int64)
+        before[known] = self.answers[rows]
+        self.answers[rows] += counts[known]
+
+        new = ~known
+        self.ids = np.insert(self.ids, position[new], ids[new])
+        self.first_seen = np.insert(self.first_seen, position[new], chunk_first[new])
+        self.answers = np.insert(self.answers, position[new], counts[new])
+
+        # Back from user order to log order
+        answer_first = np.empty(len(users))
+        answer_first[order] = np.repeat(first_seen, counts)
+        ordinal = np.empty(len(users), dtype=np.int64)
+        ordinal[order] = np.arange(len(users)) - np.repeat(start, counts) + np.repeat(before, counts)
+        return answer_first, ordinal
+
+
+class AnswerColumns:
+    """One chunk of answer events as NumPy columns."""
+
+    __slots__ = ('cell', 'correct', 'user', 'ts', 'typed', 'kind')
+
+    def __init__(self, cell, correct, user, ts, typed, kind):
+        self.cell = np.array(cell, dtype=np.int64)
+        self.correct = np.array(correct, dtype=bool)
+        self.user = np.array(user, dtype=np.int64)
+        self.ts = np.array(ts, dtype=np.float64)
+        # Cell the wrong answer matches (-1 if none; the cell itself for correct answers)
+        self.typed = np.array(typed, dtype=np.int64)
+        # Code in MISTAKE_KINDS (-1 for correct answers)
+        self.kind = np.array(kind, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.cell)
+
+
+class AnswerReader:
+    """Turns answer events into AnswerColumns chunks.
+
+    Events for verbs or tenses the engine doesn't know are counted in skipped.
+    """
+
+    def __init__(self, engine, chunk_size=CHUNK_SIZE):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.skipped = 0
+        self._diagnose = functools.lru_cache(maxsize=DIAGNOSIS_CACHE_SIZE)(self._diagnosis)
+
+    def _diagnosis(self, cell, answer):
+        """(cell typed, mistake kind code) for a wrong answer to a cell."""
+        verb_idx, rest = divmod(cell, len(TENSE_LIST) * PERSON_COUNT)
+        tense_idx, person_index = divmod(rest, PERSON_COUNT)
+        diagnosis = self.engine.diagnose(self.engine.make_challenge(verb_idx, tense_idx, person_index), answer)
+        if diagnosis is None:
+            return -1, _KIND_CODE['unknown']
+        return diagnosis.cell, _KIND_CODE[diagnosis.kind]
+
+    def chunks(self, events):
+        """Yield AnswerColumns of up to chunk_size events each."""
+        verb_index = self.engine.verb_index
+        columns = ([], [], [], [], [], [])
+        cells, correct, users, ts, typed, kinds = columns
+        for event in events:
+            verb_idx = verb_index.get(event.get('verb'))
+            tense_idx = TENSE_INDEX.get(event.get('tense'))
+            person_index = event.get('person')
+            if verb_idx is None or tense_idx is None or person_index not in PERSONS:
+                self.skipped += 1
+                continue
+            cell = (verb_idx * len(TENSE_LIST) + tense_idx) * PERSON_COUNT + person_index
+            cells.append(cell)
+            correct.append(event['correct'])
+            users.append(event['user'])
+            ts.append(event['ts'])
+            if event['correct']:
+                typed.append(cell)
+                kinds.append(-1)
+            else:
+                typed_cell, kind = self._diagnose(cell, event.get('answer') or '')
+                typed.append(typed_cell)
+                kinds.append(kind)
+            if len(cells) >= self.chunk_size:
+                yield AnswerColumns(*columns)
+                for column in columns:
+                    column.clear()
+        if cells:
+            yield AnswerColumns(*columns)
+
+
+class Analytics:
+    """Error counts over the verb table, cohorts and confusion pairs, added up chunk by chunk."""
+
+    def __init__(self, engine):
+        self.verb_count = len(engine.verb_list)
+        self.cell_count = self.verb_count * len(TENSE_LIST) * PERSON_COUNT
+        self.answers = 0
+        self.total = np.zeros(self.cell_count, dtype=np.int64)
+        self.errors = np.zeros(self.cell_count, dtype=np.int64)
+        self.kinds = np.zeros(len(MISTAKE_KINDS), dtype=np.int64)
+        # expected cell * cell_count + typed cell
+        self.confusions = SparseCounts()
+        self.users = UserTable()
+        # first week * len(STATS_GROUPS) + group
+        self.cohort_total = SparseCounts()
+        self.cohort_errors = SparseCounts()
+        experience_shape = (len(EXPERIENCE_BUCKETS), len(STATS_GROUPS))
+        self.experience_total = np.zeros(experience_shape, dtype=np.int64)
+        self.experience_errors = np.zeros(experience_shape, dtype=np.int64)
+
+    def add(self, chunk):
+        """Add one AnswerColumns chunk."""
+        self.answers += len(chunk)
+        wrong = ~chunk.correct
+        self.total += np.bincount(chunk.cell, minlength=self.cell_count)
+        self.errors += np.bincount(chunk.cell[wrong], minlength=self.cell_count)
+        self.kinds += np.bincount(chunk.kind[wrong], minlength=len(MISTAKE_KINDS))
+
+        # Typos (the right cell, misspelled) and unrecognized answers are not confusions
+        confused = wrong & (chunk.typed >= 0) & (chunk.typed != chunk.cell)
+        self.confusions.add(chunk.cell[confused] * self.cell_count + chunk.typed[confused])
+
+        groups = len(STATS_GROUPS)
+        group = _TENSE_GROUP[(chunk.cell // PERSON_COUNT) % len(TENSE_LIST)]
+        first_seen, ordinal = self.users.add(chunk.user, chunk.ts)
+        cohort = ((first_seen + _WEEK_OFFSET) // WEEK).astype(np.int64) * groups + group
+        self.cohort_total.add(cohort)
+        self.cohort_errors.add(cohort[wrong])
+
+        bucket = np.searchsorted(EXPERIENCE_BUCKETS, ordinal, side='right') - 1
+        experience = bucket * groups + group
+        size = self.experience_total.size
+        self.experience_total += np.bincount(experience, minlength=size).reshape(self.experience_total.shape)
+        self.experience_errors += np.bincount(experience[wrong], minlength=size).reshape(self.experience_total.shape)
+
+    # Report
+
+    def _cell(self, engine, cell):
+        verb_idx, rest = divmod(int(cell), len(TENSE_LIST) * PERSON_COUNT)
+        tense_idx, person_index = divmod(rest, PERSON_COUNT)
+        return {
+            "verb": engine.verb_list[verb_idx],
+            "tense": TENSE_LIST[tense_idx],
+            "person": PERSONS[person_index],
+            "form": engine.get_form(verb_idx, tense_idx, person_index),
+        }
+
+    @staticmethod
+    def _ranked(totals, errors, min_answers, limit):
+        """Indices with at least min_answers answers, highest error rate first."""
+        rates = _rates(errors, totals)
+        eligible = np.flatnonzero(totals >= max(1, min_answers))
+        return eligible[np.argsort(-rates[eligible], kind='stable')][:limit], rates
+
+    def report(self, engine, top=20, min_answers=20):
+        """The analysis as a JSON-friendly dict."""
+        shape = (self.verb_count, len(TENSE_LIST), PERSON_COUNT)
+        total, errors = self.total.reshape(shape), self.errors.reshape(shape)
+
+        verb_total, verb_errors = total.sum(axis=(1, 2)), errors.sum(axis=(1, 2))
+        verbs, verb_rates = self._ranked(verb_total, verb_errors, min_answers, top)
+        tense_total, tense_errors = total.sum(axis=(0, 2)), errors.sum(axis=(0, 2))
+        tense_rates = _rates(tense_errors, tense_total)
+        matrix = _rates(errors.sum(axis=0), total.sum(axis=0))
+        forms, form_rates = self._ranked(self.total, self.errors, min_answers, top)
+
+        # Cohorts: (week, group) counts folded into one row per week
+        groups = len(STATS_GROUPS)
+        cohort_errors = self.cohort_errors.lookup(self.cohort_total.keys)
+        weeks, week_rows = np.unique(self.cohort_total.keys // groups, return_inverse=True)
+        week_groups = np.zeros((len(weeks), groups), dtype=np.int64)
+        week_group_errors = np.zeros((len(weeks), groups), dtype=np.int64)
+        np.add.at(week_groups, (week_rows, self.cohort_total.keys % groups), self.cohort_total.counts)
+        np.add.at(week_group_errors, (week_rows, self.cohort_total.keys % groups), cohort_errors)
+        user_weeks = np.sort(((self.users.first_seen + _WEEK_OFFSET) // WEEK).astype(np.int64))
+        cohort_users = (np.searchsorted(user_weeks, weeks, side='right')
+                        - np.searchsorted(user_weeks, weeks, side='left'))
+
+        def breakdown(totals, errors):
+            return {
+                "answers": int(totals.sum()),
+                "error_rate": round(float(_rates(errors.sum(), totals.sum())), 4),
+                "groups": {group_key: round(float(rate), 4) if count else None
+                           for group_key, count, rate in zip(STATS_GROUPS, totals, _rates(errors, totals))},
+            }
+
+        confusion_keys, confusion_counts = self.confusions.top(top)
+        return {
+            "answers": self.answers,
+            "users": len(self.users),
+            "error_rate": round(float(_rates(self.errors.sum(), self.answers)), 4),
+            "verbs": [
+                {"verb": engine.verb_list[verb_idx], "translation": engine.translation_list[verb_idx],
+                 "answers": int(verb_total[verb_idx]), "errors": int(verb_errors[verb_idx]),
+                 "error_rate": round(float(verb_rates[verb_idx]), 4)}
+                for verb_idx in verbs
+            ],
+            "tenses": [
+                {"tense": tense, "answers": int(tense_total[tense_idx]), "errors": int(tense_errors[tense_idx]),
+                 "error_rate": round(float(tense_rates[tense_idx]), 4)}
+                for tense_idx, tense in enumerate(TENSE_LIST)
+            ],
+            "tense_person": {
+                tense: [round(float(rate), 4) for rate in matrix[tense_idx]]
+                for tense_idx, tense in enumerate(TENSE_LIST)
+            },
+            "forms": [
+                {**self._cell(engine, cell), "answers": int(self.total[cell]), "errors": int(self.errors[cell]),
+                 "error_rate": round(float(form_rates[cell]), 4)}
+                for cell in forms
+            ],
+            "cohorts": [
+                {"week": time.strftime('%Y-%m-%d', time.gmtime(int(week) * WEEK - _WEEK_OFFSET)),
+                 "users": int(users), **breakdown(week_groups[row], week_group_errors[row])}
+                for row, (week, users) in enumerate(zip(weeks, cohort_users))
+            ],
+            "experience": [
+                {"answers_before": f"{low}+" if high is None else f"{low}-{high - 1}",
+                 **breakdown(self.experience_total[row], self.experience_errors[row])}
+                for row, (low, high) in enumerate(zip(EXPERIENCE_BUCKETS, EXPERIENCE_BUCKETS[1:] + (None,)))
+            ],
+            "mistakes": {kind: int(count) for kind, count in zip(MISTAKE_KINDS, self.kinds)},
+            "confusions": [
+                {"expected": self._cell(engine, key // self.cell_count),
+                 "typed": self._cell(engine, key % self.cell_count), "count": int(count)}
+                for key, count in zip(confusion_keys, confusion_counts)
+            ],
+        }
+
+
+def analyze(paths, engine, chunk_size=CHUNK_SIZE):
+    """Stream the answer logs at paths through Analytics; returns (analytics, skipped events)."""
+    analytics = Analytics(engine)
+    reader = AnswerReader(engine, chunk_size)
+    for path in paths:
+        for chunk in reader.chunks(iter_events(path)):
+            analytics.add(chunk)
+    return analytics, reader.skipped
+
+
+def _percent(rate):
+    return "    -" if rate is None else f"{rate * 100:5.1f}"
+
+
+def print_report(report):
+    """Print a report from Analytics.report() as text."""
+    print(f"📊 {report['answers']} answers from {report['users']} users, "
+          f"{report['error_rate'] * 100:.1f}% wrong")
+
+    print("\n🔥 Hardest verbs:")
+    for row in report['verbs']:
+        print(f"   {row['verb']:16} {row['translation'][:24]:24} {_percent(row['error_rate'])}%  "
+              f"({row['errors']}/{row['answers']})")
+
+    print("\n⏰ Tenses (error rate % by person):")
+    print(f"   {'':24} {'total':>6} " + " ".join(f"{PERSONS[index][:8]:>8}" for index in range(PERSON_COUNT)))
+    for row in report['tenses']:
+        cells = " ".join(f"{_percent(rate):>8}" for rate in report['tense_person'][row['tense']])
+        print(f"   {TENSES[row['tense']][:24]:24} {_percent(row['error_rate']):>6} {cells}")
+
+    print("\n🎯 Hardest forms:")
+    for row in report['forms']:
+        print(f"   {row['form']:20} {row['verb']}, {TENSES[row['tense']]}, {row['person']:12} "
+              f"{_percent(row['error_rate'])}%  ({row['errors']}/{row['answers']})")
+
+    group_header = " ".join(f"{group_key[:10]:>10}" for group_key in STATS_GROUPS)
+    print(f"\n👥 Cohorts by first week:\n   {'week':10} {'users':>7} {'answers':>9} {'total':>6} {group_header}")
+    for row in report['cohorts']:
+        groups = " ".join(f"{_percent(rate):>10}" for rate in row['groups'].values())
+        print(f"   {row['week']:10} {row['users']:>7} {row['answers']:>9} {_percent(row['error_rate']):>6} {groups}")
+
+    print(f"\n📈 By answers given before:\n   {'answers':10} {'':>7} {'answers':>9} {'total':>6} {group_header}")
+    for row in report['experience']:
+        groups = " ".join(f"{_percent(rate):>10}" for rate in row['groups'].values())
+        print(f"   {row['answers_before']:10} {'':>7} {row['answers']:>9} {_percent(row['error_rate']):>6} {groups}")
+
+    wrong = sum(report['mistakes'].values())
+    print("\n❌ Mistakes:")
+    for kind, count in report['mistakes'].items():
+        print(f"   {kind:14} {count:>9}  {_percent(count / wrong if wrong else None)}%")
+
+    print("\n🔀 Top confusions (expected → typed):")
+    for row in report['confusions']:
+        expected, typed = row['expected'], row['typed']
+        print(f"   {row['count']:>7}  {expected['form']} → {typed['form']}   "
+              f"({expected['verb']}, {TENSES[expected['tense']]}, {expected['person']} → "
+              f"{typed['verb']}, {TENSES[typed['tense']]}, {typed['person']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the answer history")
+    parser.add_argument("paths", nargs="*",
+                        help="Answer logs (default: ANSWER_LOG_PATH and its shards)")
+    parser.add_argument("--top", type=int, default=20, help="Rows in each ranking")
+    parser.add_argument("--min-answers", type=int, default=20,
+                        help="Answers a verb or form needs to be ranked")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Events per vectorized pass")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    paths = args.paths or (history_paths(ANSWER_LOG_PATH) if ANSWER_LOG_PATH else [])
+    if not paths:
+        print("❌ No answer log given and ANSWER_LOG_PATH is empty")
+        return 1
+
+    engine = VerbEngine(db_file=VERB_DB_PATH)
+    start = time.perf_counter()
+    analytics, skipped = analyze(paths, engine, max(1, args.chunk_size))
+    elapsed = time.perf_counter() - start
+    if not analytics.answers:
+        print(f"❌ No answers found in {', '.join(paths)}")
+        return 1
+
+    report = analytics.report(engine, args.top, args.min_answers)
+    report["skipped"] = skipped
+    report["elapsed_s"] = round(elapsed, 3)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_report(report)
+    print(f"\n⏱️  {analytics.answers} answers in {elapsed:.2f} s"
+          + (f" ({skipped} for unknown verbs or tenses skipped)" if skipped else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
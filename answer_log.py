@@ -0,0 +1,471 @@
+"""
+Append-only log of answered challenges with per-user statistics.
+
+Every checked answer is one JSON line:
+
+    {"ts":1760000000.5,"user":42,"verb":"hablar","tense":"presente","person":1,
+     "correct":false,"latency_ms":5210,"answer":"hablo"}
+
+("answer" only for wrong answers). Per-user statistics are updated in
+memory as answers come in, so /stats never reads the log. A background
+thread writes the lines in batches (one write and fsync per batch). When
+the log grows past max_bytes it is rotated: the full file becomes a
+numbered segment that is gzipped in the background, next to a snapshot of
+the statistics up to that point, so a restart only replays what was
+written after the last rotation.
+
+Files for path "answers.jsonl":
+    answers.jsonl                 current log
+    answers.000001.jsonl.gz ...   rotated segments, oldest first
+    answers.snapshot.json         statistics through the last compacted segment
+
+ShardedAnswerLog splits the users over a number of such logs
+(answers.shard00.jsonl, ...), for processes that each serve a fixed set of
+shards (webhook_server.py); reshard() moves the history to another number
+of shards.
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from config import TENSE_GROUPS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ANSWER_EVENTS = metrics.counter('bot_answer_events_total', 'Answers recorded in the answer log', ('result',))
+ANSWER_LOG_COMMITS = metrics.histogram(
+    'bot_answer_log_commit_duration_seconds', 'Time to write (and fsync) one batch of answer events')
+
+# Tense groups statistics are kept for ("all" overlaps the others)
+STATS_GROUPS = tuple(group_key for group_key in TENSE_GROUPS if group_key != 'all')
+_GROUP_OF_TENSE = {
+    tense: index for index, group_key in enumerate(STATS_GROUPS) for tense in TENSE_GROUPS[group_key]['tenses']
+}
+
+
+class UserStats:
+    """Running totals for one user, updated in O(1) per answer."""
+
+    __slots__ = ('total', 'correct', 'streak', 'best_streak', 'latency_ms_total', 'latency_count',
+                 'group_total', 'group_correct', 'last_answer')
+
+    def __init__(self):
+        self.total = 0
+        self.correct = 0
+        # Consecutive correct answers
+        self.streak = 0
+        self.best_streak = 0
+        self.latency_ms_total = 0
+        self.latency_count = 0
+        self.group_total = [0] * len(STATS_GROUPS)
+        self.group_correct = [0] * len(STATS_GROUPS)
+        self.last_answer = 0.0
+
+    def apply(self, event):
+        """Update the totals with one answer event."""
+        correct = event['correct']
+        self.total += 1
+        self.last_answer = event['ts']
+        if correct:
+            self.correct += 1
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.streak = 0
+        if event.get('latency_ms') is not None:
+            self.latency_ms_total += event['latency_ms']
+            self.latency_count += 1
+        group = _GROUP_OF_TENSE.get(event['tense'])
+        if group is not None:
+            self.group_total[group] += 1
+            self.group_correct[group] += int(correct)
+
+    @property
+    def accuracy(self):
+        return self.correct / self.total if self.total else 0.0
+
+    @property
+    def mean_latency(self):
+        """Mean seconds from challenge to answer, or None if unknown."""
+        return self.latency_ms_total / self.latency_count / 1000 if self.latency_count else None
+
+    def groups(self):
+        """(group_key, answered, correct) for the groups the user has answered."""
+        return [(group_key, total, correct)
+                for group_key, total, correct in zip(STATS_GROUPS, self.group_total, self.group_correct) if total]
+
+    def to_state(self):
+        # Copies of the group lists: the state may be written out while answers keep coming
+        return [list(value) if isinstance(value, list) else value
+                for value in (getattr(self, name) for name in self.__slots__)]
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        for name, value in zip(cls.__slots__, state):
+            setattr(stats, name, value)
+        return stats
+
+
+def _segment_paths(path):
+    """Rotated segments of a log as (sequence, path), oldest first."""
+    root = path[:-len('.jsonl')] if path.endswith('.jsonl') else path
+    pattern = re.compile(re.escape(root) + r'\.(\d+)\.jsonl(\.gz)?$')
+    segments = {}
+    for candidate in glob.glob(glob.escape(root) + '.*.jsonl*'):
+        match = pattern.match(candidate)
+        if match:
+            sequence = int(match.group(1))
+            # Prefer the gzipped copy once compaction finished
+            if sequence not in segments or match.group(2):
+                segments[sequence] = candidate
+    return sorted(segments.items())
+
+
+def _read_events(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+
+
+def iter_events(path, since_sequence=0):
+    """Yield every answer event of a log (rotated segments, then the current file) in order."""
+    for sequence, segment in _segment_paths(path):
+        if sequence > since_sequence:
+            yield from _read_events(segment)
+    if os.path.exists(path):
+        yield from _read_events(path)
+
+
+class AnswerLog:
+    """Answer event log with in-memory per-user statistics.
+
+    With path=None nothing is written and statistics only last until restart.
+    """
+
+    def __init__(self, path=None, commit_interval=0.5, fsync=True, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stats = {}
+        # user_id -> time the user's current challenge was sent
+        self._issued = {}
+        self._pending = []
+        self._closed = False
+        self._compactor = None
+        self._file = None
+        self._writer = None
+        if path is None:
+            return
+
+        root = path[:-len('.jsonl')] if path.endswith('.jsonl') else path
+        self._snapshot_path = root + '.snapshot.json'
+        self._segment_template = root + '.{:06d}.jsonl'
+        self._load()
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+        self._writer = threading.Thread(target=self._write_behind, name="answer-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # Public interface
+
+    def challenge_issued(self, user_id, issued_at=None):
+        """Note when a user's challenge was sent, to measure how long the answer took."""
+        self._issued[user_id] = time.time() if issued_at is None else issued_at
+
+    def record(self, user_id, challenge, user_answer, correct, issued_at=None):
+        """Record an answer to a challenge and update the user's statistics.
+
+        issued_at is when the challenge was sent, if known from the answer itself
+        (e.g. the replied-to message); otherwise challenge_issued()'s time is used.
+        """
+        now = time.time()
+        issued = self._issued.pop(user_id, None)
+        if issued_at is None:
+            issued_at = issued
+        event = {
+            'ts': round(now, 3),
+            'user': user_id,
+            'verb': challenge.verb,
+            'tense': challenge.tense,
+            'person': challenge.person_index,
+            'correct': bool(correct),
+            'latency_ms': None if issued_at is None else max(0, int((now - issued_at) * 1000)),
+        }
+        if not correct:
+            event['answer'] = user_answer
+        ANSWER_EVENTS.inc('correct' if correct else 'incorrect')
+
+        with self._lock:
+            stats = self._stats.get(user_id)
+            if stats is None:
+                stats = self._stats[user_id] = UserStats()
+            stats.apply(event)
+            if self._file is not None:
+                self._pending.append(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+        return event
+
+    def stats(self, user_id):
+        """A user's statistics, or None if they haven't answered anything."""
+        return self._stats.get(user_id)
+
+    def flush(self):
+        """Write all recorded answers now."""
+        if self._file is not None:
+            self._commit()
+
+    def close(self):
+        """Write everything, finish background compaction and close the log."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._commit()
+            self._file.close()
+        if self._compactor is not None:
+            self._compactor.join()
+
+    # Internals
+
+    def _load(self):
+        """Rebuild statistics from the snapshot and the events written after it."""
+        start = time.perf_counter()
+        through = 0
+        try:
+            with open(self._snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            through = snapshot['through']
+            self._stats = {int(user_id): UserStats.from_state(state) for user_id, state in snapshot['users'].items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Ignoring unreadable answer log snapshot {self._snapshot_path}: {e}")
+            through, self._stats = 0, {}
+
+        replayed = 0
+        for event in iter_events(self.path, through):
+            stats = self._stats.get(event['user'])
+            if stats is None:
+                stats = self._stats[event['user']] = UserStats()
+            stats.apply(event)
+            replayed += 1
+        segments = _segment_paths(self.path)
+        self._sequence = max(through, segments[-1][0] if segments else 0)
+        logger.info(f"Answer log: {len(self._stats)} users loaded, {replayed} events replayed "
+                    f"in {time.perf_counter() - start:.2f} s")
+
+    def _write_behind(self):
+        """Background loop that group-commits pending events."""
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self.commit_interval)
+                if self._closed:
+                    return
+            try:
+                self._commit()
+            except Exception as e:
+                logger.error(f"Failed to write answer events: {e}")
+
+    def _commit(self):
+        """Write pending events in one batch, rotating the log when it is full."""
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+                data = ''.join(lines).encode('utf-8')
+                # Statistics now match exactly what the file holds after this write
+                snapshot = None
+                if data and self._size + len(data) >= self.max_bytes:
+                    snapshot = {user_id: stats.to_state() for user_id, stats in self._stats.items()}
+            if not data:
+                return
+            start = time.perf_counter()
+            try:
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = lines
+                raise
+            self._size += len(data)
+            ANSWER_LOG_COMMITS.observe(time.perf_counter() - start)
+            if snapshot is not None:
+                self._rotate(snapshot)
+
+    def _rotate(self, snapshot):
+        """Turn the current file into the next segment and start a new one (caller holds the write lock)."""
+        self._file.close()
+        self._sequence += 1
+        segment = self._segment_template.format(self._sequence)
+        os.replace(self.path, segment)
+        self._file = open(self.path, 'ab')
+        self._size = 0
+
+        previous = self._compactor
+        self._compactor = threading.Thread(
+            target=self._compact, args=(previous, segment, self._sequence, snapshot),
+            name="answer-log-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def _compact(self, previous, segment, sequence, snapshot):
+        """Gzip a rotated segment and write the statistics snapshot covering it."""
+        if previous is not None:
+            # Snapshots must be written in order
+            previous.join()
+        try:
+            with open(segment, 'rb') as source, gzip.open(segment + '.gz.tmp', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.replace(segment + '.gz.tmp', segment + '.gz')
+            os.remove(segment)
+
+            with open(self._snapshot_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'through': sequence, 'users': snapshot}, f, separators=(',', ':'))
+            os.replace(self._snapshot_path + '.tmp', self._snapshot_path)
+            logger.info(f"Answer log segment {sequence} compacted")
+        except OSError as e:
+            logger.error(f"Failed to compact answer log segment {segment}: {e}")
+
+
+def user_shard(user_id, shard_count):
+    """Answer log shard of a user (stable across processes and restarts)."""
+    return zlib.crc32(str(user_id).encode('ascii')) % shard_count
+
+
+def shard_path(path, shard):
+    """Path of one shard's log: answers.jsonl -> answers.shard03.jsonl."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard{shard:02d}{extension}"
+
+
+def _shard_files(path):
+    """Every file of the per-user shards of a log (current files, segments, snapshots) as {shard: [paths]}."""
+    root, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.shard(\d+)\.')
+    files = {}
+    for candidate in glob.glob(glob.escape(root) + '.shard*'):
+        match = pattern.match(candidate)
+        if match:
+            files.setdefault(int(match.group(1)), []).append(candidate)
+    return files
+
+
+def reshard(path, shard_count):
+    """Split the per-user shards of a log into shard_count shards, if there is another number of them.
+
+    Every event is copied, in order, to its user's new shard in a staging
+    directory; the old files (segments and snapshots included) are only
+    replaced once all are written, and an interrupted swap is finished on
+    the next call. Returns True if the shards were rewritten.
+    """
+    root, extension = os.path.splitext(path)
+    staging = root + '.reshard'
+    manifest_path = os.path.join(staging, 'manifest.json')
+    if os.path.isdir(staging) and not os.path.exists(manifest_path):
+        # An interrupted copy: the old shards are still complete
+        shutil.rmtree(staging)
+
+    if not os.path.isdir(staging):
+        files = _shard_files(path)
+        if not files or max(files) + 1 == shard_count:
+            return False
+        start = time.perf_counter()
+        os.makedirs(staging)
+        names = [os.path.basename(shard_path(path, shard)) for shard in range(shard_count)]
+        # Every new shard gets a file, so the next start sees all of them
+        outputs = [open(os.path.join(staging, name), 'w', encoding='utf-8') for name in names]
+        moved = 0
+        try:
+            for shard in range(max(files) + 1):
+                for event in iter_events(shard_path(path, shard)):
+                    output = outputs[user_shard(event['user'], shard_count)]
+                    output.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+                    moved += 1
+            for output in outputs:
+                output.flush()
+                os.fsync(output.fileno())
+        finally:
+            for output in outputs:
+                output.close()
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'shards': shard_count, 'files': names}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info(f"Answer log: {moved} events from {max(files) + 1} shards copied into {shard_count} "
+                    f"in {time.perf_counter() - start:.2f} s")
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        names = set(json.load(f)['files'])
+    for shard_paths in _shard_files(path).values():
+        for old in shard_paths:
+            if os.path.basename(old) not in names:
+                os.remove(old)
+    directory = os.path.dirname(path)
+    for name in names:
+        staged = os.path.join(staging, name)
+        if os.path.exists(staged):
+            os.replace(staged, os.path.join(directory, name))
+    shutil.rmtree(staging)
+    return True
+
+
+class ShardedAnswerLog:
+    """AnswerLog interface over per-shard logs, of which this process opens only its own.
+
+    A user whose shard isn't open here (an update that reached the wrong
+    process) gets statistics that are kept in memory only.
+    """
+
+    def __init__(self, path, shard_count, shards, **kwargs):
+        self.shard_count = shard_count
+        self.logs = {shard: AnswerLog(shard_path(path, shard), **kwargs) for shard in shards}
+        self._stray = AnswerLog(None)
+
+    def _log(self, user_id):
+        log = self.logs.get(user_shard(user_id, self.shard_count))
+        if log is None:
+            logger.warning(f"Answer log shard of user {user_id} is not open in this process")
+            return self._stray
+        return log
+
+    def challenge_issued(self, user_id, issued_at=None):
+        self._log(user_id).challenge_issued(user_id, issued_at)
+
+    def record(self, user_id, challenge, user_answer, correct, issued_at=None):
+        return self._log(user_id).record(user_id, challenge, user_answer, correct, issued_at)
+
+    def stats(self, user_id):
+        return self._log(user_id).stats(user_id)
+
+    def flush(self):
+        for log in self.logs.values():
+            log.flush()
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
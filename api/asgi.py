@@ -0,0 +1,205 @@
+"""
+ASGI webhook entry point.
+
+Alternative to api/webhook.py for ASGI servers: updates are processed on the
+server's own event loop, many at a time per process, each user's updates in
+order. When ASGI_MAX_IN_FLIGHT updates are already being processed, new ones
+get 503 with Retry-After, so Telegram retries them later.
+
+Run locally with any ASGI server, e.g.:
+    uvicorn api.asgi:app --port 8000
+"""
+
+import asyncio
+import json
+import logging
+import time
+import sys
+from urllib.parse import parse_qsl
+sys.path.append('..')
+from config import BOT_TOKEN, WEBHOOK_REPLY, ASGI_MAX_IN_FLIGHT
+import metrics
+from update_processor import KeyedLocks, update_key
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = metrics.gauge('asgi_updates_in_flight', 'Webhook updates being processed (including waiting for the same user)')
+REJECTED = metrics.counter('asgi_updates_rejected_total', 'Webhook updates answered with 503 because the process was saturated')
+UPDATE_LATENCY = metrics.histogram('asgi_update_duration_seconds', 'Time to process one webhook update')
+
+# Largest request body accepted (Telegram updates are far smaller)
+MAX_BODY_SIZE = 1024 * 1024
+
+# _read_body() results other than the body
+TOO_LARGE = object()
+DISCONNECTED = object()
+
+# Seconds Telegram is asked to wait before retrying a rejected update
+RETRY_AFTER = 1
+
+# Initialized Application, created by the lifespan startup or the first update
+application = None
+_application_lock = None
+_user_locks = KeyedLocks()
+_in_flight = 0
+
+
+def create_application(token=BOT_TOKEN):
+    """Create the Application with one Bot API connection per update that may be in flight."""
+    from api.webhook import create_application
+    return create_application(token, connection_pool_size=ASGI_MAX_IN_FLIGHT)
+
+
+async def get_application():
+    """Get the initialized Application, creating it on first use."""
+    global application, _application_lock
+    if application is None:
+        if _application_lock is None:
+            _application_lock = asyncio.Lock()
+        async with _application_lock:
+            if application is None:
+                start = time.perf_counter()
+                app = create_application()
+                await app.initialize()
+                metrics.STARTUP_LATENCY.observe(time.perf_counter() - start, "application_init")
+                application = app
+                logger.info("Application created and initialized")
+    return application
+
+
+async def _send(send, status, body, content_type='application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status, payload, headers=()):
+    await _send(send, status, json.dumps(payload).encode('utf-8'), headers=headers)
+
+
+async def _read_body(receive):
+    """Read the request body; TOO_LARGE past MAX_BODY_SIZE, DISCONNECTED if the client went away."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return DISCONNECTED
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return TOO_LARGE
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def process_update(body):
+    """Process one update; returns the webhook-reply call to send back, or None."""
+    from telegram import Update
+    from flood_control import wait_for_refresh
+    app = await get_application()
+    update = Update.de_json(body, app.bot)
+
+    # Same-user updates run one at a time, in arrival order
+    async with _user_locks.hold(update_key(update)):
+        if WEBHOOK_REPLY:
+            from webhook_reply import capture_reply
+            reply = await capture_reply(app.process_update(update))
+        else:
+            await app.process_update(update)
+            reply = None
+    # A coalesced toggle leaves a screen refresh behind: finish it before answering
+    # (outside the lock, so the user's next toggles can still be coalesced meanwhile)
+    await wait_for_refresh(update)
+    return reply
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await get_application()
+                from bot_handlers import get_verb_engine
+                get_verb_engine().build_indexes()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error(f"Startup failed: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+        elif message['type'] == 'lifespan.shutdown':
+            if application is not None:
+                await application.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _http(scope, receive, send):
+    global _in_flight
+    path = scope.get('path', '')
+    params = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+
+    if scope['method'] == 'GET':
+        if path.endswith('/profile') or 'profile' in params:
+            from profiling import http_response
+            status, content_type, body = http_response(params)
+            await _send(send, status, body, content_type)
+        elif path.endswith('/metrics') or 'metrics' in params:
+            await _send(send, 200, metrics.render().encode('utf-8'), metrics.PROMETHEUS_CONTENT_TYPE)
+        else:
+            await _send_json(send, 200, {"status": "Telegram Bot Webhook is running"})
+        return
+
+    if scope['method'] != 'POST':
+        await _send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    # Shed load before doing any work
+    if _in_flight >= ASGI_MAX_IN_FLIGHT:
+        REJECTED.inc()
+        await _send_json(send, 503, {"error": "Busy, retry later"},
+                         headers=[(b'retry-after', str(RETRY_AFTER).encode('latin-1'))])
+        return
+
+    _in_flight += 1
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        raw = await _read_body(receive)
+        if raw is DISCONNECTED:
+            # Nobody to answer; Telegram sends the update again
+            return
+        if raw is TOO_LARGE:
+            await _send_json(send, 413, {"error": "Request body too large"})
+            return
+        try:
+            body = json.loads(raw.decode('utf-8'))
+        except ValueError:
+            await _send_json(send, 400, {"error": "Invalid JSON"})
+            return
+
+        reply = await process_update(body)
+        UPDATE_LATENCY.observe(time.perf_counter() - start)
+        await _send_json(send, 200, reply if reply is not None else {"status": "ok"})
+    except Exception as e:
+        logger.error(f"Error processing webhook: {e}")
+        await _send_json(send, 500, {"error": str(e)})
+    finally:
+        _in_flight -= 1
+        IN_FLIGHT.dec()
+
+
+async def app(scope, receive, send):
+    """ASGI application."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http':
+        await _http(scope, receive, send)
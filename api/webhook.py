@@ -1,23 +1,19 @@
+import time
+_import_start = time.perf_counter()
+
 from http.server import BaseHTTPRequestHandler
 import json
 import logging
-import asyncio
 import os
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+import threading
+from urllib.parse import urlparse, parse_qs
 
-# Import bot handlers
+# python-telegram-bot and the bot handlers are imported on first use, so a cold
+# start that only serves a GET (health check, metrics) doesn't pay for them
 import sys
 sys.path.append('..')
-from config import BOT_TOKEN
-from bot_handlers import (
-    start_command,
-    help_command,
-    practice_command,
-    handle_message,
-    handle_tense_group_selection,
-    error_handler
-)
+from config import BOT_TOKEN, TELEGRAM_API_BASE_URL, WEBHOOK_REPLY, BOT_API_POOL_SIZE
+import metrics
 
 # Enable logging
 logging.basicConfig(
@@ -26,41 +22,168 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Webhook metrics
+INVOCATIONS = metrics.counter('webhook_invocations_total', 'Webhook POSTs by cold or warm process', ('start',))
+UPDATE_LATENCY = metrics.histogram('webhook_update_duration_seconds', 'Time to process one webhook update')
+
+# Set after the first POST handled by this process
+_warm = False
+
+# Maximum time to wait for a single update to be processed (seconds)
+PROCESS_UPDATE_TIMEOUT = 25
+
 # Global application instance
 application = None
+_application_lock = threading.Lock()
+
+# Long-lived event loop shared by all warm invocations of this process.
+# Keeping it alive keeps the Bot's HTTP connection pool (and its keep-alive
+# connections to the Bot API) alive between requests.
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop():
+    """Get the background event loop, starting its thread on first use."""
+    global _loop
+    
+    with _loop_lock:
+        if _loop is None:
+            start = time.perf_counter()
+            import asyncio
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="webhook-event-loop", daemon=True)
+            thread.start()
+            _loop = loop
+            metrics.STARTUP_LATENCY.observe(time.perf_counter() - start, "event_loop")
+    
+    return _loop
+
+def run_coroutine(coro, timeout=None):
+    """Run a coroutine on the background event loop and wait for its result."""
+    import asyncio
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+def create_application(token=BOT_TOKEN, request=None, connection_pool_size=BOT_API_POOL_SIZE):
+    """Create an Application with all bot handlers (not yet initialized).
+
+    connection_pool_size bounds the concurrent Bot API calls when no request backend is given.
+    """
+    from telegram import Update
+    from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, TypeHandler, filters
+    from flood_control import flood_guard
+    from profiling import application_class
+    from bot_handlers import (
+        start_command,
+        help_command,
+        practice_command,
+        stats_command,
+        handle_message,
+        handle_tense_group_selection,
+        handle_inline_query,
+        error_handler
+    )
+    
+    if request is None:
+        from telegram.request import HTTPXRequest
+        request = HTTPXRequest(connection_pool_size=connection_pool_size)
+    # Bot API calls are timed per method
+    request = metrics.instrumented_request(request)
+    if WEBHOOK_REPLY:
+        # One call per update can be returned in the webhook response instead
+        from webhook_reply import ReplyCaptureRequest
+        request = ReplyCaptureRequest(request)
+    app = (
+        Application.builder()
+        .application_class(application_class())  # samples updates under cProfile if PROFILING is on
+        .token(token)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .request(request)
+        .build()
+    )
+    
+    # Flood control runs before all other handlers
+    app.add_handler(TypeHandler(Update, flood_guard), group=-1)
+    
+    # Add handlers
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("practice", practice_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CallbackQueryHandler(handle_tense_group_selection))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(InlineQueryHandler(handle_inline_query))
+    app.add_error_handler(error_handler)
+    
+    return app
 
 def get_or_create_application():
-    """Get or create Application instance (synchronous)."""
+    """Get or create the initialized Application instance (synchronous)."""
     global application
     
-    if application is None:
-        # Create the Application instance
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        # Add handlers
-        application.add_handler(CommandHandler("start", start_command))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("practice", practice_command))
-        application.add_handler(CallbackQueryHandler(handle_tense_group_selection))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        application.add_error_handler(error_handler)
-        
-        logger.info("Application created")
+    with _application_lock:
+        if application is None:
+            start = time.perf_counter()
+            app = create_application()
+            
+            # Initialize once per process on the background loop
+            run_coroutine(app.initialize(), PROCESS_UPDATE_TIMEOUT)
+            metrics.STARTUP_LATENCY.observe(time.perf_counter() - start, "application_init")
+            
+            # Build the answer and lookup indexes now rather than stall the first answer
+            start = time.perf_counter()
+            from bot_handlers import get_verb_engine
+            get_verb_engine().build_indexes()
+            metrics.STARTUP_LATENCY.observe(time.perf_counter() - start, "verb_indexes")
+            application = app
+            
+            logger.info("Application created and initialized")
     
     return application
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
-        """Handle GET requests for testing."""
+        """Handle GET requests for testing, metrics (?metrics or /metrics) and profiles (?profile&token=...)."""
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        if url.path.endswith('/profile') or 'profile' in query:
+            from profiling import http_response
+            status, content_type, body = http_response({name: values[0] for name, values in query.items()})
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url.path.endswith('/metrics') or 'metrics' in query:
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', metrics.PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        
+        response = json.dumps({"status": "Telegram Bot Webhook is running"}).encode('utf-8')
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
         self.end_headers()
-        response = json.dumps({"status": "Telegram Bot Webhook is running"})
-        self.wfile.write(response.encode('utf-8'))
+        self.wfile.write(response)
         return
 
     def do_POST(self):
         """Handle POST requests from Telegram webhook."""
+        global _warm
+        cold = not _warm
+        INVOCATIONS.inc("cold" if cold else "warm")
+        _warm = True
+        start = time.perf_counter()
+        
         try:
             # Get content length
             content_length = int(self.headers.get('Content-Length', 0))
@@ -71,64 +194,64 @@ class handler(BaseHTTPRequestHandler):
             # Parse JSON
             body = json.loads(post_data.decode('utf-8'))
             
-            # Process the update with proper event loop management
-            self.process_update_sync(body)
+            # Process the update on the shared event loop
+            reply = self.process_update_sync(body)
+            UPDATE_LATENCY.observe(time.perf_counter() - start)
+            if cold:
+                # Module import to first processed update: the cold-start cost
+                metrics.STARTUP_LATENCY.observe(time.perf_counter() - _import_start, "cold_start_total")
             
             # Send success response
+            # In webhook-reply mode the body is a Bot API call for Telegram to execute
+            response = json.dumps(reply if reply is not None else {"status": "ok"}).encode('utf-8')
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
+            # With a length, keep-alive clients (webhook_server.py) can reuse the connection
+            self.send_header('Content-Length', str(len(response)))
             self.end_headers()
-            response = json.dumps({"status": "ok"})
-            self.wfile.write(response.encode('utf-8'))
+            self.wfile.write(response)
                 
         except Exception as e:
             logger.error(f"Error processing webhook: {e}")
             
             # Send error response
+            response = json.dumps({"error": str(e)}).encode('utf-8')
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
             self.end_headers()
-            response = json.dumps({"error": str(e)})
-            self.wfile.write(response.encode('utf-8'))
+            self.wfile.write(response)
 
     def process_update_sync(self, body):
-        """Process Telegram update with proper event loop management."""
+        """Process Telegram update on the shared background event loop.
+        
+        Returns the Bot API call to send back in the response body (webhook-reply
+        mode), or None.
+        """
+        from telegram import Update
+        from flood_control import refresh_pending, wait_for_refresh
+        
         try:
-            # Get application
+            # Get application (initialized once per process)
             app = get_or_create_application()
             
             # Create Update object from the webhook data
             update = Update.de_json(body, app.bot)
             
-            # Create new event loop for this request
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                # Initialize application if needed
-                if not app.running:
-                    loop.run_until_complete(app.initialize())
-                
-                # Process the update
-                loop.run_until_complete(app.process_update(update))
-                
-            finally:
-                # Clean up the loop
-                try:
-                    # Cancel all pending tasks
-                    pending = asyncio.all_tasks(loop)
-                    for task in pending:
-                        task.cancel()
-                    
-                    # Wait for tasks to complete cancellation
-                    if pending:
-                        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-                    
-                    # Close the loop
-                    loop.close()
-                except Exception as cleanup_error:
-                    logger.warning(f"Error during loop cleanup: {cleanup_error}")
+            # Hand the update to the background loop and wait for it to finish
+            if WEBHOOK_REPLY:
+                from webhook_reply import capture_reply
+                reply = run_coroutine(capture_reply(app.process_update(update)), PROCESS_UPDATE_TIMEOUT)
+            else:
+                run_coroutine(app.process_update(update), PROCESS_UPDATE_TIMEOUT)
+                reply = None
+            # A coalesced toggle leaves a screen refresh behind; the instance may be frozen once we answer
+            if refresh_pending(update):
+                run_coroutine(wait_for_refresh(update), PROCESS_UPDATE_TIMEOUT)
+            return reply
             
         except Exception as e:
             logger.error(f"Error in process_update_sync: {e}")
             raise
+
+metrics.STARTUP_LATENCY.observe(time.perf_counter() - _import_start, "webhook_import")
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Spanish Verb Trainer Bot.
+
+Times the verb engine, the bot handlers (against a stubbed Bot API), polling
+throughput with concurrent update processing and the webhook HTTP path, and writes the results as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py                                   # run everything
+    python benchmark.py --only engine                     # engine, handlers, concurrency or webhook
+    python benchmark.py --only concurrency --concurrency 32 --api-latency 0.05
+    python benchmark.py --output new.json --baseline old.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import gc
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+# Benchmarks replay many updates from one user; don't let flood control drop them
+os.environ.setdefault("FLOOD_CONTROL", "false")
+# Benchmark answers are not real practice history: keep them out of the answer log
+os.environ.setdefault("ANSWER_LOG_PATH", "")
+
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+
+from verb_engine import VerbEngine, PERSON_COUNT
+
+STUB_TOKEN = "123456:benchmark-stub-token"
+USER_ID = 1000
+
+# Concurrency suite settings (overridable from the command line)
+CONCURRENCY_LIMIT = 16
+API_LATENCY = 0.01
+
+
+class StubRequest(BaseRequest):
+    """Bot API request backend that answers locally with canned responses."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": parameters.get('chat_id', USER_ID), "type": "private"},
+                "text": parameters.get('text', ''),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode('utf-8')
+
+
+# Timing helpers
+
+def summarize(samples_ns, ops_per_sample=1):
+    """Summarize per-operation timings (nanoseconds) into a result record."""
+    per_op = sorted(sample / ops_per_sample for sample in samples_ns)
+    count = len(per_op)
+    mean = statistics.fmean(per_op)
+    return {
+        "samples": count,
+        "ops_per_sample": ops_per_sample,
+        "mean_us": round(mean / 1000, 3),
+        "p50_us": round(per_op[count // 2] / 1000, 3),
+        "p99_us": round(per_op[min(count - 1, int(count * 0.99))] / 1000, 3),
+        "ops_per_sec": round(1e9 / mean, 1) if mean else None,
+    }
+
+
+def time_sync(func, samples, ops_per_sample=1):
+    """Time a synchronous callable that performs ops_per_sample operations per call."""
+    gc.collect()
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    return summarize(timings, ops_per_sample)
+
+
+async def time_async(make_coroutine, samples):
+    """Time an async operation once per sample."""
+    gc.collect()
+    timings = []
+    for _ in range(samples):
+        coroutine = make_coroutine()
+        start = time.perf_counter_ns()
+        await coroutine
+        timings.append(time.perf_counter_ns() - start)
+    return summarize(timings)
+
+
+# Realistic answer distribution for check_answer
+
+def build_answer_mix(engine, count, seed=42):
+    """Build (user_answer, correct_answer, person_index) triples resembling real traffic."""
+    rng = random.Random(seed)
+    pronouns = {0: "yo", 1: "tú", 2: "él", 3: "nosotros", 4: "vosotros", 5: "ellos"}
+    strip_accents = str.maketrans("áéíóú", "aeiou")
+    pairs = []
+    for cell in engine.sample_cells(['all'], count):
+        correct = engine.forms[cell]
+        person_index = cell % PERSON_COUNT
+        roll = rng.random()
+        if roll < 0.40:
+            answer = correct
+        elif roll < 0.55:
+            answer = correct.translate(strip_accents)
+        elif roll < 0.60:
+            answer = correct.capitalize()
+        elif roll < 0.65:
+            answer = f"{pronouns[person_index]} {correct}"
+        elif roll < 0.80:
+            # One-letter typo
+            position = rng.randrange(len(correct))
+            answer = correct[:position] + rng.choice("aeiosn") + correct[position + 1:]
+        else:
+            # Right verb, wrong person
+            answer = engine.forms[cell - person_index + (person_index + 1) % PERSON_COUNT]
+        pairs.append((answer, correct, person_index))
+    return pairs
+
+
+# Benchmarks
+
+def bench_engine(samples):
+    """Benchmark VerbEngine construction, challenge generation and answer checking."""
+    results = {}
+    results["engine.init"] = time_sync(VerbEngine, max(5, samples // 100))
+    results["engine.init_db"] = time_sync(lambda: VerbEngine(db_file="verbs.vmdb"), max(5, samples // 10))
+    results["engine.build_indexes"] = time_sync(lambda: VerbEngine().build_indexes(), max(5, samples // 100))
+
+    engine = VerbEngine()
+    batch = 100
+    results["engine.get_random_challenge"] = time_sync(
+        lambda: [engine.get_random_challenge() for _ in range(batch)], samples, batch)
+    results["engine.get_random_challenge_by_group"] = time_sync(
+        lambda: [engine.get_random_challenge_by_group('past') for _ in range(batch)], samples, batch)
+    results["engine.get_random_challenge_by_groups"] = time_sync(
+        lambda: [engine.get_random_challenge_by_groups(['present', 'past']) for _ in range(batch)], samples, batch)
+    results["engine.get_challenges_batch"] = time_sync(
+        lambda: engine.get_challenges(['present', 'past'], batch), samples, batch)
+    results["engine.sample_cells_batch"] = time_sync(
+        lambda: engine.sample_cells(['present', 'past'], batch), samples, batch)
+
+    pairs = build_answer_mix(engine, batch * 10)
+    check_answer = engine.check_answer
+    results["engine.check_answer"] = time_sync(
+        lambda: [check_answer(answer, correct, person_index) for answer, correct, person_index in pairs], samples, len(pairs))
+
+    # Inline queries: one lookup per keystroke while typing a verb
+    prefixes = [verb[:length] for verb in engine.verb_list[:20] for length in range(1, len(verb) + 1)]
+    results["engine.lookup"] = time_sync(
+        lambda: [engine.lookup(prefix) for prefix in prefixes], samples, len(prefixes))
+
+    # Diagnosis runs only for wrong answers: typos, other persons and answers far from any form
+    rng = random.Random(42)
+    wrong = []
+    for challenge in engine.get_challenges(['all'], batch):
+        correct = challenge.correct_answer
+        roll = rng.random()
+        if roll < 0.4:
+            position = rng.randrange(len(correct))
+            answer = correct[:position] + "x" + correct[position + 1:]
+        elif roll < 0.8:
+            answer = engine.get_form(challenge.verb_idx, challenge.tense_idx, (challenge.person_index + 1) % 6)
+        else:
+            answer = "no sé"
+        wrong.append((challenge, answer))
+    results["engine.diagnose"] = time_sync(
+        lambda: [engine.diagnose(challenge, answer) for challenge, answer in wrong], max(5, samples // 10), len(wrong))
+    return results
+
+
+def _message_update(bot, update_id, text):
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+    if text.startswith('/'):
+        data["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return Update.de_json(data, bot)
+
+
+def _callback_update(bot, update_id, callback_data):
+    data = {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "benchmark",
+            "data": callback_data,
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Bench"},
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": USER_ID, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Benchmark"},
+                "text": "challenge",
+            },
+        },
+    }
+    return Update.de_json(data, bot)
+
+
+async def _bench_handlers(samples):
+    import bot_handlers
+
+    bot = Bot(STUB_TOKEN, request=StubRequest())
+    await bot.initialize()
+    results = {}
+    counter = iter(range(1, 10 ** 9))
+
+    # Practice command (fresh selection screen)
+    results["handlers.practice_command"] = await time_async(
+        lambda: bot_handlers.practice_command(_message_update(bot, next(counter), "/practice"), None), samples)
+
+    # Toggling a group on the selection screen
+    results["handlers.handle_tense_group_selection.toggle"] = await time_async(
+        lambda: bot_handlers.handle_tense_group_selection(_callback_update(bot, next(counter), "toggle_past"), None),
+        samples)
+
+    # Answering inside an active session (feedback plus next challenge)
+    await bot_handlers.practice_command(_message_update(bot, next(counter), "/practice"), None)
+    await bot_handlers.handle_tense_group_selection(_callback_update(bot, next(counter), "toggle_present"), None)
+    await bot_handlers.handle_tense_group_selection(_callback_update(bot, next(counter), "start_practice"), None)
+
+    def answer_update():
+        challenge = bot_handlers.session_store.get_challenge(USER_ID)
+        text = challenge.correct_answer if random.random() < 0.6 else "incorrecto"
+        return bot_handlers.handle_message(_message_update(bot, next(counter), text), None)
+
+    results["handlers.handle_message"] = await time_async(answer_update, samples)
+
+    await bot.shutdown()
+    return results
+
+
+def bench_handlers(samples):
+    """Benchmark the handler path with a stubbed Bot."""
+    return asyncio.run(_bench_handlers(samples))
+
+
+async def _bench_concurrency(samples, limit, api_latency, users=20):
+    from api.webhook import create_application
+    from update_processor import PerUserUpdateProcessor
+    import bot_handlers
+
+    app = create_application(STUB_TOKEN, StubRequest(api_latency))
+    await app.initialize()
+    counter = iter(range(1, 10 ** 9))
+    # Every virtual user opens the selection screen, picks a group, starts and answers twice
+    script = [(_message_update, "/practice"), (_callback_update, "toggle_present"),
+              (_callback_update, "start_practice"), (_message_update, "hablo"), (_message_update, "hablo")]
+
+    def make_update(build, payload, user_id):
+        data = build(None, next(counter), payload).to_dict()
+        for part in ("message", "callback_query"):
+            if part in data:
+                data[part]["from"]["id"] = user_id
+                message = data[part] if part == "message" else data[part]["message"]
+                message["chat"]["id"] = user_id
+        return Update.de_json(data, app.bot)
+
+    gc.collect()
+    timings = []
+    for _ in range(samples):
+        bot_handlers.session_store = bot_handlers.create_session_store()
+        processor = PerUserUpdateProcessor(limit)
+        # Updates arrive interleaved across users, as from getUpdates
+        updates = [make_update(build, payload, USER_ID + n) for build, payload in script for n in range(users)]
+        start = time.perf_counter_ns()
+        # One task per update, like Application does with concurrent updates
+        await asyncio.gather(*(processor.process_update(update, app.process_update(update)) for update in updates))
+        timings.append(time.perf_counter_ns() - start)
+    await app.shutdown()
+    return summarize(timings, len(updates))
+
+
+def bench_concurrency(samples):
+    """Benchmark polling throughput with and without concurrent update processing."""
+    samples = max(3, samples // 20)
+    results = {}
+    for limit in sorted({1, CONCURRENCY_LIMIT}):
+        results[f"concurrency.updates.limit_{limit}"] = asyncio.run(_bench_concurrency(samples, limit, API_LATENCY))
+    return results
+
+
+def bench_webhook(samples):
+    """Benchmark api/webhook.py end to end through a local HTTP server."""
+    from api import webhook
+
+    app = webhook.create_application(STUB_TOKEN, StubRequest())
+    webhook.run_coroutine(app.initialize())
+    webhook.application = app
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), webhook.handler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+    counter = iter(range(1, 10 ** 9))
+
+    def post(payload):
+        body = json.dumps(payload).encode('utf-8')
+        connection.request('POST', '/api/webhook', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Webhook returned HTTP {response.status}")
+
+    def message(text):
+        return _message_update(None, next(counter), text).to_dict()
+
+    def callback(data):
+        return _callback_update(None, next(counter), data).to_dict()
+
+    results = {}
+    results["webhook.get"] = time_sync(
+        lambda: (connection.request('GET', '/api/webhook'), connection.getresponse().read()), samples)
+    results["webhook.post.practice"] = time_sync(lambda: post(message("/practice")), samples)
+    results["webhook.post.toggle"] = time_sync(lambda: post(callback("toggle_past")), samples)
+    post(callback("start_practice"))
+    results["webhook.post.answer"] = time_sync(lambda: post(message("hablo")), samples)
+
+    connection.close()
+    server.shutdown()
+    webhook.run_coroutine(app.shutdown())
+    return results
+
+
+SUITES = {
+    "engine": bench_engine,
+    "handlers": bench_handlers,
+    "concurrency": bench_concurrency,
+    "webhook": bench_webhook,
+}
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of benchmarks whose mean got slower than allowed."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("mean_us"):
+            continue
+        ratio = result["mean_us"] / previous["mean_us"]
+        if ratio > 1 + max_regression:
+            regressions.append((name, previous["mean_us"], result["mean_us"], ratio))
+    return regressions
+
+
+def main():
+    global CONCURRENCY_LIMIT, API_LATENCY
+    parser = argparse.ArgumentParser(description="Benchmark the Spanish Verb Trainer Bot")
+    parser.add_argument("--only", choices=sorted(SUITES), action="append", help="Run only these suites")
+    parser.add_argument("--samples", type=int, default=200, help="Samples per benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write JSON results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed slowdown of the mean vs. baseline (0.25 = 25%%)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY_LIMIT,
+                        help="Concurrent update limit for the concurrency suite")
+    parser.add_argument("--api-latency", type=float, default=API_LATENCY,
+                        help="Simulated Bot API latency in seconds for the concurrency suite")
+    args = parser.parse_args()
+
+    CONCURRENCY_LIMIT = args.concurrency
+    API_LATENCY = args.api_latency
+
+    results = {}
+    for name in args.only or SUITES:
+        print(f"⏱️  Running {name} benchmarks...")
+        results.update(SUITES[name](args.samples))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "samples": args.samples,
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        print(f"{name:50} mean {result['mean_us']:>10.3f} µs   p99 {result['p99_us']:>10.3f} µs")
+    print(f"📍 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for name, before, after, ratio in regressions:
+            print(f"❌ {name}: {before:.3f} µs -> {after:.3f} µs ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
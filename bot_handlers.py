@@ -1,172 +1,290 @@
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CallbackQueryHandler
-from verb_engine import VerbEngine
-from config import WELCOME_MESSAGE, HELP_MESSAGE, TENSE_GROUPS
+import time
+from telegram import Update
+from telegram.ext import ContextTypes
+from verb_engine import VerbEngine, TENSE_LIST
+from srs import SpacedRepetition, UserSchedule
+from session_store import MemorySessionStore, SQLiteSessionStore
+from answer_log import AnswerLog, ShardedAnswerLog
+from challenge_token import encode_token, decode_token
+from flood_control import is_coalesced, defer_refresh
+from metrics import timed, counter, CALLBACK_ACTIONS, STARTUP_LATENCY
+from rendering import (
+    selection_screen, challenge_message, correct_feedback, incorrect_feedback, mistake_hint,
+    inline_verb_result, inline_form_result, stats_message, stop_keyboard, STOP_PREFIX
+)
+from config import (
+    WELCOME_MESSAGE, HELP_MESSAGE, SESSION_STORE, SESSION_DB_PATH, COMBINED_REPLY, TENSES, VERB_DB_PATH,
+    ANSWER_LOG_PATH, ANSWER_LOG_MAX_MB, ANSWER_LOG_FSYNC
+)
 
-# Initialize the verb engine
-verb_engine = VerbEngine()
+# Where answered challenges were found: the signed ID in the replied-to message, the session store, or nowhere
+CHALLENGE_LOOKUPS = counter('bot_challenge_lookups_total', 'Answered challenges by where they were found', ('source',))
+
+# The verb engine parses the JSON data, so it is created on first use
+# rather than at import time (keeps serverless cold starts cheap)
+_verb_engine = None
+
+def get_verb_engine():
+    """Get the shared verb engine, loading it on first use."""
+    global _verb_engine
+    if _verb_engine is None:
+        start = time.perf_counter()
+        _verb_engine = VerbEngine(db_file=VERB_DB_PATH)
+        STARTUP_LATENCY.observe(time.perf_counter() - start, "verb_engine")
+    return _verb_engine
+
+# Spaced-repetition scheduler for users practicing in 'srs' mode (schedules live in the session store)
+_spaced_repetition = None
+
+def get_spaced_repetition():
+    """Get the spaced-repetition scheduler over the current session store."""
+    global _spaced_repetition
+    if _spaced_repetition is None or _spaced_repetition.store is not session_store:
+        _spaced_repetition = SpacedRepetition(get_verb_engine(), session_store)
+    return _spaced_repetition
+
+def __getattr__(name):
+    # Keep bot_handlers.verb_engine working for existing callers
+    if name == 'verb_engine':
+        return get_verb_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def create_session_store():
+    """Create the session store selected by the SESSION_STORE setting."""
+    if SESSION_STORE == 'sqlite':
+        return SQLiteSessionStore(
+            SESSION_DB_PATH,
+            encode_challenge=lambda challenge: challenge.to_state(),
+            decode_challenge=lambda state: get_verb_engine().challenge_from_state(state),
+            encode_schedule=lambda schedule: schedule.to_state(),
+            decode_schedule=lambda state: UserSchedule.from_state(state, len(get_verb_engine().forms))
+        )
+    return MemorySessionStore()
 
 # Store current challenges and practice sessions for each user
-user_challenges = {}
-user_practice_sessions = {}
+session_store = create_session_store()
+
+# Answer history and per-user statistics, loaded on first use (replays the log)
+_answer_log = None
+
+def create_answer_log(path=ANSWER_LOG_PATH, shards=None, shard_count=None):
+    """Create the answer log (statistics are kept in memory only if there is no path).
+    
+    With shards, only those of shard_count per-user shards of the log are opened.
+    """
+    options = dict(fsync=ANSWER_LOG_FSYNC, max_bytes=int(ANSWER_LOG_MAX_MB * 1024 * 1024))
+    try:
+        if path and shards is not None:
+            return ShardedAnswerLog(path, shard_count, shards, **options)
+        return AnswerLog(path or None, **options)
+    except OSError as e:
+        logging.error(f"Cannot open answer log {path}, keeping statistics in memory: {e}")
+        return AnswerLog(None)
+
+def get_answer_log():
+    """Get the shared answer log, opening it on first use."""
+    global _answer_log
+    if _answer_log is None:
+        _answer_log = create_answer_log()
+    return _answer_log
+
+def get_or_create_session(user_id):
+    """Get the user's practice session, creating an empty one if needed."""
+    session = session_store.get_session(user_id)
+    if session is None:
+        session = {
+            'selected_groups': [],
+            'active': False,
+            'mode': 'random'
+        }
+    return session
 
+@timed('start_command')
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /start command."""
     await update.message.reply_text(WELCOME_MESSAGE)
 
+@timed('help_command')
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /help command."""
     await update.message.reply_text(HELP_MESSAGE)
 
+@timed('practice_command')
 async def practice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /practice command - show tense group selection."""
     user_id = update.effective_user.id
     
-    # Initialize user selection if not exists
-    if user_id not in user_practice_sessions:
-        user_practice_sessions[user_id] = {
-            'selected_groups': [],
-            'active': False
-        }
-    else:
-        user_practice_sessions[user_id]['selected_groups'] = []
-        user_practice_sessions[user_id]['active'] = False
+    # Initialize (or reset) the user selection, keeping the chosen practice mode
+    previous = session_store.get_session(user_id)
+    session_store.set_session(user_id, {
+        'selected_groups': [],
+        'active': False,
+        'mode': previous.get('mode', 'random') if previous else 'random'
+    })
     
     await show_tense_selection(update.message, user_id)
 
 async def show_tense_selection(message_obj, user_id):
     """Show tense group selection with checkboxes."""
-    selected_groups = user_practice_sessions[user_id]['selected_groups']
-    
-    # Create inline keyboard for tense group selection
-    keyboard = []
-    for group_key, group_info in TENSE_GROUPS.items():
-        if group_key == 'all':
-            continue  # Skip 'all' option for now
-        
-        # Add checkmark if selected
-        prefix = "✅ " if group_key in selected_groups else "☐ "
-        keyboard.append([InlineKeyboardButton(
-            f"{prefix}{group_info['name_es']}", 
-            callback_data=f"toggle_{group_key}"
-        )])
-    
-    # Add control buttons
-    keyboard.append([
-        InlineKeyboardButton("🎯 Empezar práctica", callback_data="start_practice"),
-        InlineKeyboardButton("🔄 Resetear", callback_data="reset_selection")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    selected_text = ", ".join([TENSE_GROUPS[g]['name_es'] for g in selected_groups]) if selected_groups else "Nada seleccionado"
-    
-    message = "🎯 **Selecciona tiempos para practicar:**\n\n"
-    message += f"Seleccionado: {selected_text}\n\n"
-    message += "Haz clic en los tiempos para seleccionar/deseleccionar, luego 'Empezar práctica'"
-    
+    session = get_or_create_session(user_id)
+    message, reply_markup = selection_screen(session['selected_groups'], session.get('mode') == 'srs')
     await message_obj.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown')
 
+@timed('handle_tense_group_selection')
 async def handle_tense_group_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle tense group selection from inline keyboard."""
     query = update.callback_query
-    await query.answer()
-    
     user_id = update.effective_user.id
     data = query.data
     
-    if data == "stop_practice":
-        # Stop practice session
-        if user_id in user_practice_sessions:
-            del user_practice_sessions[user_id]
-        if user_id in user_challenges:
-            del user_challenges[user_id]
+    # Toggles coalesced by flood control are answered now but refresh the screen later
+    # (with webhook replies the answer goes out in the webhook response, at no extra call)
+    coalesced = is_coalesced(context)
+    await query.answer()
+    CALLBACK_ACTIONS.inc("toggle" if data.startswith("toggle_") else data.split(":", 1)[0])
+    
+    if data == "stop_practice" or data.startswith(STOP_PREFIX):
+        # Stop practice session (kept as inactive, so replies to old challenges don't restart it)
+        session = get_or_create_session(user_id)
+        session['active'] = False
+        session_store.set_session(user_id, session)
+        session_store.delete_challenge(user_id)
         
         await query.edit_message_text("🛑 Práctica detenida. Usa /practice para empezar de nuevo.")
         return
     
-    if data.startswith("toggle_"):
+    if data == "toggle_mode":
+        # Switch between random and spaced-repetition practice
+        session = get_or_create_session(user_id)
+        session['mode'] = 'random' if session.get('mode') == 'srs' else 'srs'
+        session_store.set_session(user_id, session)
+        await refresh_tense_selection(query, user_id, coalesced)
+        
+    elif data.startswith("toggle_"):
         # Toggle tense group selection
         group_key = data.replace("toggle_", "")
-        selected_groups = user_practice_sessions[user_id]['selected_groups']
+        session = get_or_create_session(user_id)
+        selected_groups = session['selected_groups']
         
         if group_key in selected_groups:
             selected_groups.remove(group_key)
         else:
             selected_groups.append(group_key)
+        session_store.set_session(user_id, session)
         
         # Update the selection display
-        await update_tense_selection(query, user_id)
+        await refresh_tense_selection(query, user_id, coalesced)
         
     elif data == "start_practice":
         # Start practice with selected groups
-        selected_groups = user_practice_sessions[user_id]['selected_groups']
+        session = get_or_create_session(user_id)
+        selected_groups = session['selected_groups']
         
         if not selected_groups:
             await query.answer("¡Selecciona al menos un grupo de tiempos!", show_alert=True)
             return
         
         # Start practice session
-        user_practice_sessions[user_id]['active'] = True
-        user_practice_sessions[user_id]['selected_groups'] = selected_groups
+        session['active'] = True
+        session_store.set_session(user_id, session)
         
         # Generate first challenge
-        await generate_challenge_for_groups(query, user_id, selected_groups)
+        await generate_challenge_for_groups(query, user_id, selected_groups, session.get('mode', 'random'))
         
     elif data == "reset_selection":
         # Reset selection
-        user_practice_sessions[user_id]['selected_groups'] = []
+        session = get_or_create_session(user_id)
+        session['selected_groups'] = []
+        session_store.set_session(user_id, session)
+        await update_tense_selection(query, user_id)
+
+async def refresh_tense_selection(query, user_id, coalesced=False):
+    """Show the updated selection now, or once later if flood control coalesced this toggle."""
+    if coalesced:
+        defer_refresh(user_id, lambda: update_tense_selection(query, user_id))
+    else:
         await update_tense_selection(query, user_id)
 
 async def update_tense_selection(query, user_id):
     """Update the tense selection message."""
-    selected_groups = user_practice_sessions[user_id]['selected_groups']
-    
-    # Create inline keyboard for tense group selection
-    keyboard = []
-    for group_key, group_info in TENSE_GROUPS.items():
-        if group_key == 'all':
-            continue  # Skip 'all' option for now
-        
-        # Add checkmark if selected
-        prefix = "✅ " if group_key in selected_groups else "☐ "
-        keyboard.append([InlineKeyboardButton(
-            f"{prefix}{group_info['name_es']}", 
-            callback_data=f"toggle_{group_key}"
-        )])
-    
-    # Add control buttons
-    keyboard.append([
-        InlineKeyboardButton("🎯 Empezar práctica", callback_data="start_practice"),
-        InlineKeyboardButton("🔄 Resetear", callback_data="reset_selection")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    selected_text = ", ".join([TENSE_GROUPS[g]['name_es'] for g in selected_groups]) if selected_groups else "Nada seleccionado"
+    session = get_or_create_session(user_id)
+    message, reply_markup = selection_screen(session['selected_groups'], session.get('mode') == 'srs')
+    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+
+def create_challenge(user_id, tense_groups, mode='random'):
+    """Pick the next challenge for a user and make it current."""
+    if mode == 'srs':
+        # Next due (verb, tense, person) cell for this user
+        challenge = get_spaced_repetition().next_challenge(user_id, tense_groups)
+    else:
+        challenge = get_verb_engine().get_random_challenge_by_groups(tense_groups)
+    session_store.set_challenge(user_id, challenge)
+    get_answer_log().challenge_issued(user_id)
+    return challenge
+
+def challenge_token(challenge, user_id, mode='random'):
+    """Signed ID of a challenge (with the practice groups, mode and issue time) for one user."""
+    return encode_token(
+        challenge.verb_idx, challenge.tense_idx, challenge.person_index,
+        challenge.selected_groups or [], mode == 'srs', challenge.srs_box,
+        user_id=user_id, catalogue=get_verb_engine().catalogue_id, issued_ms=int(time.time() * 1000)
+    )
+
+def challenge_from_reply(message, user_id):
+    """Rebuild the challenge an answer replies to from its signed ID.
     
-    message = "🎯 **Selecciona tiempos para practicar:**\n\n"
-    message += f"Seleccionado: {selected_text}\n\n"
-    message += "Haz clic en los tiempos para seleccionar/deseleccionar, luego 'Empezar práctica'"
+    Returns (challenge, mode, issued_ms), or None if the message isn't a reply to a
+    challenge or the ID doesn't verify.
+    """
+    replied = message.reply_to_message
+    if replied is None or replied.reply_markup is None:
+        return None
+    for row in replied.reply_markup.inline_keyboard:
+        for button in row:
+            data = button.callback_data
+            if isinstance(data, str) and data.startswith(STOP_PREFIX):
+                engine = get_verb_engine()
+                decoded = decode_token(data[len(STOP_PREFIX):], user_id, engine.catalogue_id)
+                if decoded is None:
+                    return None
+                verb_idx, tense_idx, person_index, groups, srs, srs_box, issued_ms = decoded
+                if verb_idx >= len(engine.verb_list) or tense_idx >= len(TENSE_LIST):
+                    return None
+                challenge = engine.make_challenge(verb_idx, tense_idx, person_index, selected_groups=groups)
+                challenge.srs_box = srs_box
+                return challenge, 'srs' if srs else 'random', issued_ms
+    return None
+
+def claim_reply(user_id, session, challenge, mode, replied_message_id, issued_ms):
+    """Accept an answer given as a reply to a challenge message at most once.
     
-    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+    Freshness comes from the reply itself, not from this instance's current
+    challenge (another instance may have issued a newer one): the challenge
+    counts if its message is newer than the last one answered here, or it
+    was issued later (a challenge edited into an older message). Returns
+    True if the answer counts. Without a session on this instance, the
+    reply's challenge becomes the session.
+    """
+    if session is None:
+        session = {'selected_groups': challenge.selected_groups or [], 'active': True, 'mode': mode}
+    elif (replied_message_id <= session.get('answered_through', 0)
+          and issued_ms <= session.get('answered_issued_ms', 0)):
+        return False
+    session['answered_through'] = max(replied_message_id, session.get('answered_through', 0))
+    session['answered_issued_ms'] = max(issued_ms, session.get('answered_issued_ms', 0))
+    session_store.set_session(user_id, session)
+    return True
 
-async def generate_challenge_for_groups(query_or_update, user_id, tense_groups):
+async def generate_challenge_for_groups(query_or_update, user_id, tense_groups, mode='random'):
     """Generate a new challenge for the specified tense groups."""
-    challenge = verb_engine.get_random_challenge_by_groups(tense_groups)
-    user_challenges[user_id] = challenge
+    challenge = create_challenge(user_id, tense_groups, mode)
     
     # Create the challenge message with only verb translation
-    message = f"🔤 **Conjugar el verbo:**\n\n"
-    message += f"**{challenge['verb']}** ({challenge['verb_translation']}) "
-    message += f"en **{challenge['tense_display']}** "
-    message += f"para **{challenge['person']}**\n\n"
-    message += f"Escribe tu respuesta:"
+    message = challenge_message(challenge.verb, challenge.verb_translation, challenge.tense_display, challenge.person)
     
-    # Create inline keyboard for stopping practice
-    keyboard = [[InlineKeyboardButton("🛑 Parar práctica", callback_data="stop_practice")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Inline keyboard for stopping practice (also carries the signed challenge ID)
+    reply_markup = stop_keyboard(challenge_token(challenge, user_id, mode))
     
     if hasattr(query_or_update, 'edit_message_text'):
         # This is a callback query
@@ -175,75 +293,127 @@ async def generate_challenge_for_groups(query_or_update, user_id, tense_groups):
         # This is a regular update
         await query_or_update.message.reply_text(message, parse_mode='Markdown', reply_markup=reply_markup)
 
+@timed('handle_message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular text messages (answers to challenges)."""
     user_id = update.effective_user.id
     user_answer = update.message.text.strip()
     
-    # Check if user has an active challenge
-    if user_id not in user_challenges:
-        await update.message.reply_text(
-            "¡Hola! 👋 Usa /practice para empezar a practicar conjugaciones de verbos."
-        )
-        return
+    # A reply to a challenge message carries the challenge itself (works on any instance);
+    # otherwise use the user's current challenge from the session store
+    from_reply = challenge_from_reply(update.message, user_id)
+    if from_reply is not None:
+        session = session_store.get_session(user_id)
+        if session is not None and not session['active']:
+            # Practice was stopped since that challenge was sent
+            from_reply = None
+    if from_reply is not None:
+        CHALLENGE_LOOKUPS.inc("token")
+        challenge, mode, issued_ms = from_reply
+        if not claim_reply(user_id, session, challenge, mode, update.message.reply_to_message.message_id, issued_ms):
+            CHALLENGE_LOOKUPS.inc("stale")
+            await update.message.reply_text(
+                "Ese desafío ya está respondido. Responde al último desafío o usa /practice."
+            )
+            return
+        selected_groups = challenge.selected_groups
+        has_active_session = True
+    else:
+        challenge = session_store.get_challenge(user_id)
+        if challenge is None:
+            CHALLENGE_LOOKUPS.inc("missing")
+            await update.message.reply_text(
+                "¡Hola! 👋 Usa /practice para empezar a practicar conjugaciones de verbos."
+            )
+            return
+        CHALLENGE_LOOKUPS.inc("store")
+        
+        # Check if user has an active practice session
+        session = session_store.get_session(user_id)
+        has_active_session = session is not None and session['active']
+        if has_active_session:
+            selected_groups = session['selected_groups']
+            mode = session.get('mode', 'random')
     
-    challenge = user_challenges[user_id]
-    correct_answer = challenge['correct_answer']
+    correct_answer = challenge.correct_answer
     
     # Check if the answer is correct
-    is_correct = verb_engine.check_answer(user_answer, correct_answer)
+    is_correct = get_verb_engine().check_answer(user_answer, correct_answer, challenge.person_index)
+    if challenge.srs_box is not None:
+        get_spaced_repetition().record_answer(user_id, challenge, is_correct)
+    # A reply tells when its challenge was sent, even if another instance sent it
+    issued_at = update.message.reply_to_message.date.timestamp() if from_reply is not None else None
+    get_answer_log().record(user_id, challenge, user_answer, is_correct, issued_at)
     
-    # Check if user has an active practice session
-    has_active_session = user_id in user_practice_sessions and user_practice_sessions[user_id]['active']
+    # Clear the current challenge
+    session_store.delete_challenge(user_id)
     
     if is_correct:
-        # Correct answer
-        response = f"¡Correcto! ✅\n\n"
-        response += f"**{challenge['verb']}** ({challenge.get('verb_translation', challenge['verb'])}) → **{correct_answer}**\n\n"
-        
-        # Clear the current challenge
-        del user_challenges[user_id]
-        
-        if has_active_session:
-            # Continue with next challenge in the same groups
-            response += f"Siguiente pregunta:"
-            await update.message.reply_text(response, parse_mode='Markdown')
-            
-            # Generate next challenge
-            selected_groups = user_practice_sessions[user_id]['selected_groups']
-            await generate_challenge_for_groups(update, user_id, selected_groups)
-        else:
-            response += f"¿Quieres practicar otro verbo? Usa /practice"
-            await update.message.reply_text(response, parse_mode='Markdown')
+        response = correct_feedback(challenge.verb, challenge.verb_translation, correct_answer, has_active_session)
     else:
-        # Incorrect answer
-        response = f"❌ Incorrecto.\n\n"
-        response += f"Tu respuesta: **{user_answer}**\n"
-        response += f"Respuesta correcta: **{correct_answer}**\n\n"
-        
-        # Clear the current challenge
-        del user_challenges[user_id]
-        
-        if has_active_session:
-            # Continue with next challenge in the same groups
-            response += f"Siguiente pregunta:"
-            await update.message.reply_text(response, parse_mode='Markdown')
-            
-            # Generate next challenge
-            selected_groups = user_practice_sessions[user_id]['selected_groups']
-            await generate_challenge_for_groups(update, user_id, selected_groups)
-        else:
-            response += f"¿Quieres intentar otro verbo? Usa /practice"
-            await update.message.reply_text(response, parse_mode='Markdown')
+        # Explain the mistake when the answer is another form of the verb or a typo
+        hint = None
+        diagnosis = get_verb_engine().diagnose(challenge, user_answer)
+        if diagnosis is not None:
+            typed = get_verb_engine().challenge_from_cell(diagnosis.cell)
+            hint = mistake_hint(diagnosis.kind, typed.verb, typed.tense_display, typed.person)
+        response = incorrect_feedback(user_answer, correct_answer, has_active_session, hint)
+    
+    if has_active_session and COMBINED_REPLY:
+        # Feedback and the next challenge in one message (one Bot API call)
+        next_challenge = create_challenge(user_id, selected_groups, mode)
+        response += "\n\n" + challenge_message(
+            next_challenge.verb, next_challenge.verb_translation, next_challenge.tense_display, next_challenge.person
+        )
+        reply_markup = stop_keyboard(challenge_token(next_challenge, user_id, mode))
+        await update.message.reply_text(response, parse_mode='Markdown', reply_markup=reply_markup)
+        return
+    
+    await update.message.reply_text(response, parse_mode='Markdown')
+    
+    if has_active_session:
+        # Continue with next challenge in the same groups
+        await generate_challenge_for_groups(update, user_id, selected_groups, mode)
+
+@timed('stats_command')
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the /stats command - show the user's progress."""
+    stats = get_answer_log().stats(update.effective_user.id)
+    await update.message.reply_text(stats_message(stats), parse_mode='Markdown')
 
+@timed('handle_continue')
 async def handle_continue(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle continuation requests after a correct answer."""
     user_id = update.effective_user.id
     
     # If user doesn't have an active challenge, start a new one
-    if user_id not in user_challenges:
+    if session_store.get_challenge(user_id) is None:
         await practice_command(update, context)
 
+# Inline queries fire on every keystroke: keep answers small and let Telegram cache them
+MAX_INLINE_RESULTS = 20
+INLINE_CACHE_TIME = 3600
+
+@timed('handle_inline_query')
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer inline queries (@bot habl…) with matching verbs and conjugated forms."""
+    engine = get_verb_engine()
+    results = []
+    for kind, value in engine.lookup(update.inline_query.query, MAX_INLINE_RESULTS):
+        if kind == 'verb':
+            verb = engine.verb_list[value]
+            info = engine.get_verb_info(verb)
+            tenses = tuple((TENSES[tense], tuple(info[tense])) for tense in TENSE_LIST)
+            results.append(inline_verb_result(verb, engine.translation_list[value], tenses))
+        else:
+            labels = []
+            for cell in value:
+                challenge = engine.challenge_from_cell(cell)
+                labels.append((challenge.verb, challenge.verb_translation, challenge.tense_display, challenge.person))
+            results.append(inline_form_result(engine.forms[value[0]], tuple(labels)))
+    
+    await update.inline_query.answer(results, cache_time=INLINE_CACHE_TIME)
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors."""
     logging.error(f"Update {update} caused error {context.error}")
@@ -0,0 +1,94 @@
+"""
+Signed, stateless challenge IDs.
+
+A challenge is fully described by its table cell plus the practice settings,
+so it is packed into a few bytes, signed with HMAC and sent along with the
+challenge (in the stop button's callback data). An answer sent as a reply to
+the challenge message can then be checked on any instance without looking
+up the session store. The token also carries its issue time, so an instance
+can tell a newer challenge from one that was already answered.
+"""
+
+import base64
+import hashlib
+import hmac
+from config import BOT_TOKEN, CHALLENGE_SECRET, TENSE_GROUPS
+
+# Group keys in bit order for the group mask
+GROUP_BITS = tuple(TENSE_GROUPS)
+
+# Packed layout (low to high bits): person 3, tense 4, srs box 4 (15 = none), srs mode 1,
+# groups 8, verb index 28 -> 48 bits, followed by the issue time in milliseconds (48 bits)
+CHALLENGE_BYTES = 6
+ISSUED_BYTES = 6
+PAYLOAD_BYTES = CHALLENGE_BYTES + ISSUED_BYTES
+SIGNATURE_BYTES = 8
+NO_BOX = 15
+
+_KEY = hashlib.sha256(
+    (CHALLENGE_SECRET or f"verb-master challenge:{BOT_TOKEN or ''}").encode('utf-8')
+).digest()
+
+
+def groups_to_mask(group_keys):
+    """Bit mask of tense group keys (unknown keys are ignored)."""
+    mask = 0
+    for bit, group_key in enumerate(GROUP_BITS):
+        if group_key in group_keys:
+            mask |= 1 << bit
+    return mask
+
+
+def mask_to_groups(mask):
+    """Tense group keys of a bit mask, in config order."""
+    return [group_key for bit, group_key in enumerate(GROUP_BITS) if mask & (1 << bit)]
+
+
+def _signature(payload, user_id, catalogue):
+    # The catalogue ID makes tokens from before a verb data change invalid (indices may have moved)
+    message = payload + str(user_id).encode('ascii') + b':' + catalogue
+    return hmac.new(_KEY, message, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode_token(verb_idx, tense_idx, person_index, group_keys, srs=False, srs_box=None, user_id=0, catalogue=b'',
+                 issued_ms=0):
+    """Pack and sign a challenge for one user; returns a 27-character URL-safe string."""
+    packed = (
+        person_index
+        | tense_idx << 3
+        | (NO_BOX if srs_box is None else srs_box) << 7
+        | int(srs) << 11
+        | groups_to_mask(group_keys) << 12
+        | verb_idx << 20
+    )
+    payload = packed.to_bytes(CHALLENGE_BYTES, 'little') + issued_ms.to_bytes(ISSUED_BYTES, 'little')
+    return base64.urlsafe_b64encode(payload + _signature(payload, user_id, catalogue)).rstrip(b'=').decode('ascii')
+
+
+def decode_token(token, user_id=0, catalogue=b''):
+    """Verify and unpack a token.
+
+    Returns (verb_idx, tense_idx, person_index, group_keys, srs, srs_box, issued_ms),
+    or None if the token is malformed or wasn't signed for this user and catalogue.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(raw) != PAYLOAD_BYTES + SIGNATURE_BYTES:
+        return None
+    payload, signature = raw[:PAYLOAD_BYTES], raw[PAYLOAD_BYTES:]
+    if not hmac.compare_digest(signature, _signature(payload, user_id, catalogue)):
+        return None
+
+    packed = int.from_bytes(payload[:CHALLENGE_BYTES], 'little')
+    srs_box = (packed >> 7) & 0xF
+    return (
+        packed >> 20,
+        (packed >> 3) & 0xF,
+        packed & 0x7,
+        mask_to_groups((packed >> 12) & 0xFF),
+        bool((packed >> 11) & 1),
+        None if srs_box == NO_BOX else srs_box,
+        int.from_bytes(payload[CHALLENGE_BYTES:], 'little'),
+    )
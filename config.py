@@ -1,13 +1,77 @@
 import os
-from dotenv import load_dotenv
 
 # Load environment variables from .env file for local development
-# In production (Vercel), environment variables are set directly in dashboard
-load_dotenv()
+# In production (Vercel), environment variables are set directly in dashboard,
+# so python-dotenv is not even imported there (saves cold-start time)
+if not os.getenv('VERCEL'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Telegram Bot Configuration
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Bot API endpoint the token is appended to (point it at fake_bot_api.py for load tests)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+
+# Session storage: "memory" (default) or "sqlite" to keep sessions across restarts/instances
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'sessions.db')
+
+# Key for signing challenge IDs sent with each challenge (derived from the bot token if not set).
+# Must be the same on every instance.
+CHALLENGE_SECRET = os.getenv('CHALLENGE_SECRET')
+
+# Compiled verb database (built with `python verb_db.py`); the JSON files are used if it's missing.
+# Set to an empty value to always load the JSON files.
+VERB_DB_PATH = os.getenv('VERB_DB_PATH', 'verbs.vmdb')
+
+# Answer history: one JSON line per checked answer, rotated at ANSWER_LOG_MAX_MB.
+# Set to an empty value to keep /stats in memory only (the default on Vercel, whose disk is read-only).
+ANSWER_LOG_PATH = os.getenv('ANSWER_LOG_PATH', '' if os.getenv('VERCEL') else 'answers.jsonl')
+ANSWER_LOG_MAX_MB = float(os.getenv('ANSWER_LOG_MAX_MB', '64'))
+# fsync each batch of answers (set to "false" to leave it to the OS)
+ANSWER_LOG_FSYNC = os.getenv('ANSWER_LOG_FSYNC', 'true').lower() != 'false'
+
+# Send answer feedback and the next challenge as one message (set to "false" for two messages)
+COMBINED_REPLY = os.getenv('COMBINED_REPLY', 'true').lower() != 'false'
+
+# Webhook: return the first Bot API call of each update in the webhook response body
+# instead of making a separate request (set to "true" to enable)
+WEBHOOK_REPLY = os.getenv('WEBHOOK_REPLY', 'false').lower() == 'true'
+
+# Polling: how many users' updates are processed at the same time (1 = one update at a time).
+# Updates from the same user are always processed in order.
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+
+# Bot API connections of the default request backend (ApplicationBuilder's own default;
+# a bare HTTPXRequest() has a single connection)
+BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', '256'))
+
+# ASGI entry point (api/asgi.py): updates processed at once per process before answering 503
+ASGI_MAX_IN_FLIGHT = int(os.getenv('ASGI_MAX_IN_FLIGHT', '64'))
+
+# Flood control: per-user token buckets (rate in updates per second, burst = bucket size)
+FLOOD_CONTROL = os.getenv('FLOOD_CONTROL', 'true').lower() != 'false'
+FLOOD_MESSAGE_RATE = float(os.getenv('FLOOD_MESSAGE_RATE', '1'))
+FLOOD_MESSAGE_BURST = int(os.getenv('FLOOD_MESSAGE_BURST', '5'))
+FLOOD_CALLBACK_RATE = float(os.getenv('FLOOD_CALLBACK_RATE', '2'))
+FLOOD_CALLBACK_BURST = int(os.getenv('FLOOD_CALLBACK_BURST', '6'))
+# Users tracked at most (least recently seen are forgotten first)
+FLOOD_MAX_USERS = int(os.getenv('FLOOD_MAX_USERS', '10000'))
+
+# Port for the Prometheus /metrics endpoint in polling mode (disabled if not set)
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+# Profiling (set PROFILING=true): cProfile 1 in PROFILE_SAMPLE_RATE updates and take a
+# tracemalloc snapshot every PROFILE_TRACEMALLOC_INTERVAL seconds (0 = no tracemalloc).
+# Reports are served at ?profile&token=PROFILE_TOKEN (disabled if not set) and written
+# to PROFILE_DUMP_DIR on SIGUSR1.
+PROFILING = os.getenv('PROFILING', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', '100'))
+PROFILE_TRACEMALLOC_INTERVAL = float(os.getenv('PROFILE_TRACEMALLOC_INTERVAL', '300'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_DUMP_DIR = os.getenv('PROFILE_DUMP_DIR', '.')
+
 # Verb practice settings
 PERSONS = {
     0: "yo",
@@ -89,6 +153,7 @@ HELP_MESSAGE = """
 3. Te daré un verbo en infinitivo y te pediré que lo conjugues
 4. Escribe tu respuesta
 5. Te diré si es correcta y continuaremos con una nueva pregunta
+6. Usa /stats para ver tu progreso
 
 **Ejemplo:**
 Bot: Conjugar "hablar" (говорить) en Presente para "tú"
@@ -100,5 +165,6 @@ Bot: ¡Correcto! ✅
 **Características:**
 - Las respuestas se aceptan con y sin acentos
 - La práctica continúa automáticamente hasta que la detengas
+- Activa "🧠 Repetición espaciada" para repasar primero las formas que fallas
 - Usa el botón "🛑 Parar práctica" para terminar
 """
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Rule-based Spanish conjugation generator.
+
+Regular -ar/-er/-ir paradigms, stem changes, spelling changes and the
+compound pretérito perfecto (haber + participle) are derived from rules.
+Only what the rules cannot produce is stored in verb_irregulars.json.
+
+Forms are generated when they are first asked for and kept in a bounded
+memo cache, so the number of verbs doesn't decide the memory used.
+verbs_data.json holds full tables for the most common verbs and serves as
+the regression set for the rules.
+
+Run this file to rebuild verb_irregulars.json from verbs_data.json.
+"""
+
+import functools
+import json
+import re
+import sys
+from config import TENSES
+
+PERSON_COUNT = 6
+
+ENDINGS = {
+    'ar': {
+        'presente': ("o", "as", "a", "amos", "áis", "an"),
+        'preterito_imperfecto': ("aba", "abas", "aba", "ábamos", "abais", "aban"),
+        'preterito_indefinido': ("é", "aste", "ó", "amos", "asteis", "aron"),
+    },
+    'er': {
+        'presente': ("o", "es", "e", "emos", "éis", "en"),
+        'preterito_imperfecto': ("ía", "ías", "ía", "íamos", "íais", "ían"),
+        'preterito_indefinido': ("í", "iste", "ió", "imos", "isteis", "ieron"),
+    },
+    'ir': {
+        'presente': ("o", "es", "e", "imos", "ís", "en"),
+        'preterito_imperfecto': ("ía", "ías", "ía", "íamos", "íais", "ían"),
+        'preterito_indefinido': ("í", "iste", "ió", "imos", "isteis", "ieron"),
+    },
+}
+
+FUTURE_ENDINGS = ("é", "ás", "á", "emos", "éis", "án")
+CONDITIONAL_ENDINGS = ("ía", "ías", "ía", "íamos", "íais", "ían")
+HABER_PRESENT = ("he", "has", "ha", "hemos", "habéis", "han")
+
+# Persons whose stem is stressed in the present tense (the "boot")
+BOOT_PERSONS = (0, 1, 2, 5)
+
+# Stem change -> (vowel, stressed replacement, -ir preterite 3rd person replacement)
+STEM_CHANGES = {
+    'e>ie': ('e', 'ie', 'i'),
+    'o>ue': ('o', 'ue', 'u'),
+    'e>i': ('e', 'i', 'i'),
+    # jugar -> juego
+    'u>ue': ('u', 'ue', 'u'),
+}
+
+
+def _change_last_vowel(stem, vowel, replacement):
+    """Replace the last occurrence of a vowel in a stem."""
+    position = stem.rfind(vowel)
+    if position < 0:
+        return stem
+    return stem[:position] + replacement + stem[position + 1:]
+
+
+class Conjugator:
+    """Derive conjugation tables from rules plus stored irregular overrides."""
+
+    def __init__(self, irregulars_file='verb_irregulars.json', cache_size=4096):
+        """Load irregular overrides and set up the bounded memo cache of (verb, tense) forms."""
+        if irregulars_file:
+            with open(irregulars_file, 'r', encoding='utf-8') as f:
+                self.irregulars = json.load(f)
+        else:
+            self.irregulars = {}
+        self.conjugate = functools.lru_cache(maxsize=cache_size)(self._conjugate)
+
+    def _conjugate(self, verb, tense):
+        """Compute the six forms of a verb in a tense (memoized via self.conjugate)."""
+        info = self.irregulars.get(verb, {})
+        forms = list(conjugate_regular(verb, tense, info.get('stem_change'),
+                                       info.get('future_stem'), info.get('participle')))
+        for person_index, form in enumerate(info.get('forms', {}).get(tense, ())):
+            if form is not None:
+                forms[person_index] = form
+        return tuple(forms)
+
+    def get_paradigm(self, verb):
+        """Get all tenses for a verb as {tense: [forms]}."""
+        return {tense: list(self.conjugate(verb, tense)) for tense in TENSES}
+
+    def is_irregular(self, verb):
+        """Check if the verb has stored overrides."""
+        return verb in self.irregulars
+
+
+def split_infinitive(verb):
+    """Split an infinitive into its stem and class ('ar', 'er' or 'ir'; reír and oír are -ir verbs)."""
+    stem, verb_class = verb[:-2], verb[-2:].replace('í', 'i')
+    if verb_class not in ENDINGS:
+        raise ValueError(f"Not a Spanish infinitive (expected -ar, -er, -ir or -ír): {verb!r}")
+    return stem, verb_class
+
+
+def conjugate_regular(verb, tense, stem_change=None, future_stem=None, participle=None):
+    """Conjugate a verb by rules only, applying an optional stem change."""
+    stem, verb_class = split_infinitive(verb)
+    # The future keeps the infinitive without its accent (reír -> reiré)
+    future_stem = future_stem or stem + verb_class
+
+    if tense == 'futuro':
+        return tuple(future_stem + ending for ending in FUTURE_ENDINGS)
+    if tense == 'condicional':
+        return tuple(future_stem + ending for ending in CONDITIONAL_ENDINGS)
+    if tense == 'preterito_perfecto':
+        participle = participle or regular_participle(verb)
+        return tuple(f"{auxiliary} {participle}" for auxiliary in HABER_PRESENT)
+
+    endings = ENDINGS[verb_class][tense]
+    forms = [stem + ending for ending in endings]
+
+    if tense == 'presente':
+        if stem_change:
+            vowel, stressed, _ = STEM_CHANGES[stem_change]
+            changed = _change_last_vowel(stem, vowel, stressed)
+            for person_index in BOOT_PERSONS:
+                forms[person_index] = changed + endings[person_index]
+        forms[0] = _first_person_present(forms[0], verb, stem_change)
+        if verb_class == 'ir' and stem and stem[-1] in 'aeo':
+            # oír -> oímos
+            forms[3] = stem + "ímos"
+        elif _inserts_y(stem, verb_class):
+            # construir -> construyo, construyen; huir -> huis
+            for person_index in BOOT_PERSONS:
+                forms[person_index] = stem + "y" + endings[person_index].lstrip('i')
+            if _is_monosyllable(stem + "i"):
+                forms[4] = stem + "is"
+
+    elif tense == 'preterito_indefinido':
+        if verb_class == 'ar':
+            forms[0] = _spell_before_e(stem) + endings[0]
+        elif verb.endswith('ducir'):
+            # traducir -> traduje, tradujo, tradujeron
+            forms = [stem[:-1] + "j" + ending for ending in ("e", "iste", "o", "imos", "isteis", "eron")]
+        else:
+            if stem_change and verb_class == 'ir':
+                vowel, _, weak = STEM_CHANGES[stem_change]
+                changed = _change_last_vowel(stem, vowel, weak)
+                forms[2] = changed + endings[2]
+                forms[5] = changed + endings[5]
+            if stem and stem[-1] in 'aeo':
+                # creer -> creyó, creíste, creímos
+                forms = [stem + ending for ending in ("í", "íste", "yó", "ímos", "ísteis", "yeron")]
+            elif _inserts_y(stem, verb_class):
+                # construir -> construyó, construyeron; huir -> hui
+                forms[2] = stem + "yó"
+                forms[5] = stem + "yeron"
+                if _is_monosyllable(stem + "i"):
+                    forms[0] = stem + "i"
+
+    return tuple(forms)
+
+
+def regular_participle(verb):
+    """Build the regular past participle (hablado, comido, creído)."""
+    stem, verb_class = split_infinitive(verb)
+    if verb_class == 'ar':
+        return stem + "ado"
+    if stem and stem[-1] in 'aeo':
+        return stem + "ído"
+    return stem + "ido"
+
+
+def _inserts_y(stem, verb_class):
+    """Check for -uir verbs, which add a y before endings not starting with i (construyo).
+
+    In -guir and -quir verbs (seguir, delinquir) the u is silent, so they don't.
+    """
+    return verb_class == 'ir' and stem.endswith('u') and not stem.endswith(('gu', 'qu'))
+
+
+def _is_monosyllable(word):
+    """Check whether an -uir stem plus i is one syllable (hui, flui), so it takes no written accent."""
+    return len(re.findall('[aeiouáéíóú]+', word)) == 1
+
+
+def _first_person_present(form, verb, stem_change=None):
+    """Apply yo-form spelling changes (sigo, parezco, venzo, cojo, cuezo)."""
+    if verb.endswith('guir'):
+        return form[:-2] + "o"
+    if verb.endswith(('cer', 'cir')):
+        # -zco after a vowel (conozco), except in stem-changing verbs (cocer -> cuezo)
+        if len(verb) > 3 and verb[-4] in 'aeiou' and not stem_change:
+            return form[:-2] + "zco"
+        return form[:-2] + "zo"
+    if verb.endswith(('ger', 'gir')):
+        return form[:-2] + "jo"
+    return form
+
+
+def _spell_before_e(stem):
+    """Keep the consonant sound before -é (llegué, busqué, empecé, averigüé)."""
+    if stem.endswith('gu'):
+        return stem[:-1] + "ü"
+    if stem.endswith('c'):
+        return stem[:-1] + "qu"
+    if stem.endswith('g'):
+        return stem[:-1] + "gu"
+    if stem.endswith('z'):
+        return stem[:-1] + "c"
+    return stem
+
+
+def build_irregulars(verbs_data):
+    """Derive the minimal override set that reproduces a full conjugation table."""
+    irregulars = {}
+    for verb, conjugations in verbs_data.items():
+        info = {}
+
+        future_stem = conjugations['futuro'][0][:-1]
+        if future_stem != verb:
+            info['future_stem'] = future_stem
+
+        participle = conjugations['preterito_perfecto'][0].split(' ', 1)[1]
+        if participle != regular_participle(verb):
+            info['participle'] = participle
+
+        # Pick the stem change that leaves the fewest forms to override
+        best = None
+        for stem_change in (None, *STEM_CHANGES):
+            forms = {}
+            for tense in TENSES:
+                generated = conjugate_regular(verb, tense, stem_change, info.get('future_stem'), info.get('participle'))
+                expected = conjugations[tense]
+                if list(generated) != expected:
+                    forms[tense] = [form if form != rule else None for form, rule in zip(expected, generated)]
+            misses = sum(form is not None for tense_forms in forms.values() for form in tense_forms)
+            if best is None or misses < best[0]:
+                best = (misses, stem_change, forms)
+
+        _, stem_change, forms = best
+        if stem_change:
+            info['stem_change'] = stem_change
+        if forms:
+            info['forms'] = forms
+        if info:
+            irregulars[verb] = info
+    return irregulars
+
+
+if __name__ == "__main__":
+    verbs_file = sys.argv[1] if len(sys.argv) > 1 else 'verbs_data.json'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else 'verb_irregulars.json'
+
+    with open(verbs_file, 'r', encoding='utf-8') as f:
+        verbs_data = json.load(f)
+
+    irregulars = build_irregulars(verbs_data)
+    # Keep the entries of verbs without a full table (e.g. a stem change added by hand)
+    try:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {}
+    irregulars.update((verb, info) for verb, info in previous.items() if verb not in verbs_data)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(irregulars, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+    overrides = sum(
+        form is not None
+        for info in irregulars.values()
+        for tense_forms in info.get('forms', {}).values()
+        for form in tense_forms
+    )
+    print(f"✅ {len(irregulars)} verbs need overrides ({overrides} stored forms)")
+    print(f"📍 Written to {output_file}")
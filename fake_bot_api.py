@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Fake Telegram Bot API server for local load tests.
+
+Implements the methods the bot uses (sendMessage, editMessageText,
+answerCallbackQuery, answerInlineQuery, getMe) plus what polling needs
+(getUpdates, deleteWebhook), with configurable latency and injected
+429 "Too Many Requests" errors. Every call is recorded per chat so a load
+generator can wait for the bot's replies. Standard library only.
+
+Point the bot at it with:
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot python main.py
+
+Usage:
+    python fake_bot_api.py --port 8081 --latency 0.02 --error-rate 0.01
+"""
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Verb Master", "username": "fake_verb_bot"}
+
+# Form-encoded parameters that carry JSON (python-telegram-bot sends other values as plain strings)
+JSON_PARAMETERS = {
+    'chat_id', 'message_id', 'reply_markup', 'reply_parameters', 'reply_to_message_id',
+    'show_alert', 'cache_time', 'results', 'offset', 'limit', 'timeout', 'allowed_updates',
+    'drop_pending_updates', 'max_connections',
+}
+
+# Methods that can fail with an injected 429 (the ones Telegram actually rate-limits)
+LIMITED_METHODS = {'sendMessage', 'editMessageText', 'answerCallbackQuery', 'answerInlineQuery'}
+
+# Longest getUpdates long poll, so server shutdown isn't held up
+MAX_POLL_TIMEOUT = 10
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """Threading HTTP server with Nagle's algorithm off.
+
+    BaseHTTPRequestHandler writes headers and body separately; with Nagle
+    and delayed ACKs every response would wait ~40 ms for nothing.
+    """
+
+    daemon_threads = True
+
+    def get_request(self):
+        connection, address = super().get_request()
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection, address
+
+
+class BotAPIError(Exception):
+    """A Bot API error response."""
+
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        response = {"ok": False, "error_code": self.error_code, "description": self.description}
+        if self.retry_after is not None:
+            response["parameters"] = {"retry_after": self.retry_after}
+        return response
+
+
+class FakeBotAPI:
+    """In-memory Bot API state: recorded calls per chat and pending updates for getUpdates."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._condition = threading.Condition()
+        # chat_id -> [(method, params), ...]
+        self._calls = defaultdict(list)
+        self._message_ids = defaultdict(int)
+        self._updates = []
+        self._last_update_id = 0
+        self.polled = threading.Event()
+        self.call_count = 0
+        self.rate_limited = 0
+
+    # Calls
+
+    def handle(self, method, params):
+        """Execute one Bot API call; returns its result or raises BotAPIError."""
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if method in LIMITED_METHODS and self.error_rate and self._random.random() < self.error_rate:
+            with self._condition:
+                self.rate_limited += 1
+            raise BotAPIError(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('deleteWebhook', 'setWebhook', 'setMyCommands', 'answerInlineQuery'):
+            return True
+        if method == 'answerCallbackQuery':
+            self.record(method, params)
+            return True
+        if method in ('sendMessage', 'editMessageText'):
+            return self.record(method, params)
+        raise BotAPIError(404, "Not Found: method not found")
+
+    def record(self, method, params):
+        """Record a call (also for calls returned in a webhook response); returns the message it produced."""
+        chat_id = params.get('chat_id')
+        with self._condition:
+            self.call_count += 1
+            if method == 'sendMessage':
+                self._message_ids[chat_id] += 1
+                message_id = self._message_ids[chat_id]
+            else:
+                message_id = params.get('message_id')
+            self._calls[chat_id].append((method, params))
+            self._condition.notify_all()
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get('text', ''),
+        }
+
+    def calls(self, chat_id):
+        """Number of calls recorded for a chat so far."""
+        with self._condition:
+            return len(self._calls[chat_id])
+
+    def wait_for_call(self, chat_id, after, methods, timeout):
+        """Wait for a call to chat_id in methods, recorded after the first `after` calls.
+
+        Returns (index, method, params), or None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                calls = self._calls[chat_id]
+                for index in range(after, len(calls)):
+                    if calls[index][0] in methods:
+                        return (index, *calls[index])
+                after = len(calls)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    # Updates (polling)
+
+    def push_update(self, update):
+        """Queue an update for the bot's next getUpdates."""
+        with self._condition:
+            # Numbered here, so IDs increase in queue order whatever thread pushed the update
+            self._last_update_id += 1
+            update['update_id'] = self._last_update_id
+            self._updates.append(update)
+            self._condition.notify_all()
+
+    def _get_updates(self, params):
+        self.polled.set()
+        offset = params.get('offset') or 0
+        limit = params.get('limit') or 100
+        deadline = time.monotonic() + min(params.get('timeout') or 0, MAX_POLL_TIMEOUT)
+        with self._condition:
+            # Updates below the offset are confirmed by the bot
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._updates[:limit]
+
+
+def parse_params(content_type, body):
+    """Parse call parameters sent as JSON or form data."""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True):
+        if key in JSON_PARAMETERS:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        params[key] = value
+    return params
+
+
+def make_handler(api):
+    """Request handler class serving api at /bot<token>/<method>."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _respond(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _call(self):
+            path, _, method = self.path.split('?', 1)[0].rpartition('/')
+            if not path.startswith('/bot'):
+                self._respond(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                params = parse_params(self.headers.get('Content-Type', ''), self.rfile.read(length))
+                self._respond(200, {"ok": True, "result": api.handle(method, params)})
+            except BotAPIError as e:
+                self._respond(e.error_code, e.to_dict())
+            except ValueError as e:
+                self._respond(400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"})
+
+        do_GET = _call
+        do_POST = _call
+
+    return Handler
+
+
+def serve(api, host='127.0.0.1', port=8081):
+    """Start serving api in a background thread; returns the server (port 0 picks a free one)."""
+    server = LocalHTTPServer((host, port), make_handler(api))
+    threading.Thread(target=server.serve_forever, name="fake-bot-api", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of send/edit/answer calls failing with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of injected 429 errors")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.error_rate, args.retry_after)
+    server = serve(api, args.host, args.port)
+    print(f"🤖 Fake Bot API on http://{args.host}:{server.server_address[1]}/bot")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
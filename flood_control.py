@@ -0,0 +1,176 @@
+"""
+Inbound flood control.
+
+A per-user token bucket runs before the handlers (TypeHandler in group -1):
+excess messages are dropped (with one "slow down" reply), excess toggle
+callbacks still change the selection but skip the screen refresh, which is
+done once later, and other excess callbacks are dropped. Every callback is
+still answered, so the button stops spinning on the client.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop
+import metrics
+from config import (
+    FLOOD_CONTROL, FLOOD_MESSAGE_RATE, FLOOD_MESSAGE_BURST,
+    FLOOD_CALLBACK_RATE, FLOOD_CALLBACK_BURST, FLOOD_MAX_USERS
+)
+
+logger = logging.getLogger(__name__)
+
+FLOOD_LIMITED = metrics.counter('bot_flood_limited_total', 'Updates limited by flood control', ('action',))
+
+SLOW_DOWN_MESSAGE = "⏳ Demasiados mensajes. Espera un momento, por favor."
+SLOW_DOWN_CALLBACK = "⏳ Demasiados toques. Espera un momento, por favor."
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets in a bounded LRU table.
+
+    Buckets refill lazily when touched. A bucket that isn't touched for
+    burst / rate seconds is full again, i.e. the same as a new one, so the
+    least recently used buckets can be evicted when the table is full
+    without changing behavior for active users.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time, warned since last allowed]
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now, False]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, key, now=None):
+        """Take a token for key if one is available."""
+        bucket = self._bucket(key, time.monotonic() if now is None else now)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True
+        return False
+
+    def should_warn(self, key):
+        """True the first time a limited key is asked about since its last allowed request."""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+    def wait_time(self, key, now=None):
+        """Seconds until key has a token again."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+
+
+MESSAGE_LIMITER = TokenBucketLimiter(FLOOD_MESSAGE_RATE, FLOOD_MESSAGE_BURST, FLOOD_MAX_USERS)
+CALLBACK_LIMITER = TokenBucketLimiter(FLOOD_CALLBACK_RATE, FLOOD_CALLBACK_BURST, FLOOD_MAX_USERS)
+
+# user_id -> deferred selection screen refresh
+_pending_refreshes = {}
+
+
+async def flood_guard(update, context):
+    """Pre-handler: let the update through, mark it as coalesced, or stop it."""
+    user = update.effective_user
+    if not FLOOD_CONTROL or user is None:
+        return
+
+    if update.callback_query is not None:
+        if CALLBACK_LIMITER.allow(user.id):
+            return
+        if (update.callback_query.data or '').startswith('toggle_'):
+            # Apply the toggle, but refresh the screen once later instead of now
+            context.coalesced = True
+            FLOOD_LIMITED.inc('coalesced_toggle')
+            return
+        FLOOD_LIMITED.inc('dropped_callback')
+        # Dropped, but answered (with one "slow down" notice), or the button keeps spinning
+        warn = CALLBACK_LIMITER.should_warn(user.id)
+        try:
+            await update.callback_query.answer(SLOW_DOWN_CALLBACK if warn else None)
+        except TelegramError as e:
+            logger.debug(f"Answering a dropped callback for {user.id} failed: {e}")
+        raise ApplicationHandlerStop
+
+    if update.message is not None:
+        if MESSAGE_LIMITER.allow(user.id):
+            return
+        FLOOD_LIMITED.inc('dropped_message')
+        if MESSAGE_LIMITER.should_warn(user.id):
+            FLOOD_LIMITED.inc('warned')
+            await update.message.reply_text(SLOW_DOWN_MESSAGE)
+        raise ApplicationHandlerStop
+
+
+def is_coalesced(context):
+    """Whether flood control asked this update to skip its screen refresh."""
+    return getattr(context, 'coalesced', False)
+
+
+def defer_refresh(user_id, make_coroutine):
+    """Run make_coroutine() once the user's callback bucket has a token again.
+
+    Only one refresh is pending per user; it renders whatever the state is
+    when it runs, so any number of coalesced toggles cost one Bot API call.
+    Webhook entry points wait for it with wait_for_refresh() before answering.
+    """
+    if user_id in _pending_refreshes:
+        return
+
+    async def refresh():
+        try:
+            await asyncio.sleep(CALLBACK_LIMITER.wait_time(user_id))
+            await make_coroutine()
+        except TelegramError as e:
+            # e.g. "message is not modified" when a later toggle already refreshed it
+            logger.debug(f"Deferred refresh for {user_id} failed: {e}")
+        finally:
+            _pending_refreshes.pop(user_id, None)
+
+    # Run outside the update's context (e.g. its webhook-reply capture, which ends before the refresh)
+    loop = asyncio.get_running_loop()
+    _pending_refreshes[user_id] = contextvars.Context().run(loop.create_task, refresh())
+
+
+def refresh_pending(update):
+    """Whether a deferred refresh is pending for the update's user."""
+    user = update.effective_user
+    return user is not None and user.id in _pending_refreshes
+
+
+async def wait_for_refresh(update):
+    """Wait until the deferred refresh (if any) of the update's user has run.
+
+    A webhook instance may be frozen or stopped once it has answered, so the
+    entry points that answer per update call this before responding.
+    """
+    user = update.effective_user
+    task = _pending_refreshes.get(user.id) if user is not None else None
+    if task is not None:
+        # wait() neither raises the refresh's errors nor cancels it if this waiter is cancelled
+        await asyncio.wait((task,))
@@ -0,0 +1,122 @@
+"""
+Indexes over conjugated forms.
+
+FormIndex maps every folded form to the table cells that produce it, and
+finds near misses (one-letter typos) among a given set of cells, e.g. the
+forms of the challenge's verb. PrefixIndex answers "starts with" lookups
+for inline queries.
+"""
+
+from bisect import bisect_left
+from operator import itemgetter
+
+
+def _pattern_bits(pattern):
+    """Bit mask of the positions of each character in pattern."""
+    bits = {}
+    for position, char in enumerate(pattern):
+        bits[char] = bits.get(char, 0) | (1 << position)
+    return bits
+
+
+def _distance_bits(bits, length, text):
+    """Levenshtein distance between a pattern (as _pattern_bits and its length) and text.
+
+    Bit-parallel algorithm (Myers 1999, Hyyrö 2001): one column of the
+    distance matrix is a pair of bit vectors, so each character of text costs
+    a handful of integer operations instead of a row of comparisons.
+    """
+    if not length:
+        return len(text)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive = full
+    negative = 0
+    score = length
+    for char in text:
+        equal = bits.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+    return score
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance between two strings.
+
+    With a limit, returns limit + 1 for any distance above it (and skips the
+    computation when the lengths alone rule it out).
+    """
+    if a == b:
+        return 0
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    distance = _distance_bits(_pattern_bits(a), len(a), b)
+    return distance if limit is None or distance <= limit else limit + 1
+
+
+class FormIndex:
+    """Folded form -> table cells, and table cell -> folded form."""
+
+    def __init__(self, folded_forms):
+        self.keys = tuple(folded_forms)
+        cells_by_key = {}
+        for cell, key in enumerate(self.keys):
+            cells_by_key.setdefault(key, []).append(cell)
+        self.cells_by_key = {key: tuple(cells) for key, cells in cells_by_key.items()}
+
+    def cells(self, key):
+        """Cells whose folded form is exactly key."""
+        return self.cells_by_key.get(key, ())
+
+    def near(self, key, cells, max_distance=1):
+        """(distance, cell) pairs for the given cells whose form is within max_distance of key, nearest first."""
+        bits = _pattern_bits(key)
+        length = len(key)
+        keys = self.keys
+        matches = []
+        for cell in cells:
+            form = keys[cell]
+            # Lengths alone rule most forms out
+            if abs(len(form) - length) > max_distance:
+                continue
+            distance = _distance_bits(bits, length, form)
+            if distance <= max_distance:
+                matches.append((distance, cell))
+        matches.sort()
+        return matches
+
+
+class PrefixIndex:
+    """Sorted array of (key, value) pairs searched by prefix with bisect."""
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs, key=itemgetter(0))
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit):
+        """Distinct values whose key starts with prefix, in key order, at most limit of them."""
+        keys, values = self.keys, self.values
+        found = []
+        seen = set()
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+            value = values[position]
+            if value not in seen:
+                seen.add(value)
+                found.append(value)
+            position += 1
+        return found
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Synthetic load test against a fake Bot API.
+
+Starts fake_bot_api.py in-process and drives N virtual users through
+/practice -> toggle -> start -> answers conversations, either through
+the webhook handler (api/webhook.py, served locally) or through a
+`main.py` polling process that gets its updates from the fake server.
+Each update's latency is measured from sending it until the bot's visible
+reply (sendMessage / editMessageText) reaches the fake API.
+
+Usage:
+    python load_test.py                                   # webhook, 50 users
+    python load_test.py --mode polling --users 200 --answers 10
+    python load_test.py --latency 0.05 --error-rate 0.01 --output load.json
+    python load_test.py --webhook-url http://127.0.0.1:8000/api/webhook   # a webhook already running
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from fake_bot_api import FakeBotAPI, LocalHTTPServer, serve
+
+FAKE_TOKEN = "123456:load-test-token"
+FIRST_USER_ID = 500000
+
+REPLY_METHODS = ('sendMessage', 'editMessageText')
+
+_update_ids = itertools.count(1)
+_update_id_lock = threading.Lock()
+
+# "**hablar** (говорить) en **Presente** para **yo**"
+CHALLENGE_PATTERN = re.compile(r"\*\*([^*]+)\*\* \([^)]*\) en \*\*([^*]+)\*\* para \*\*([^*]+)\*\*")
+
+
+class Results:
+    """Latencies and failures collected from all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.timeouts = 0
+        self.errors = 0
+
+    def add(self, step, latency):
+        with self.lock:
+            self.latencies.setdefault(step, []).append(latency)
+
+    def fail(self, timeout):
+        with self.lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+
+def percentiles(latencies):
+    """p50/p99/max in milliseconds."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "count": count,
+        "p50_ms": round(ordered[count // 2] * 1000, 2),
+        "p99_ms": round(ordered[min(count - 1, int(count * 0.99))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class Answerer:
+    """Answers challenges from their text, correctly with the given probability."""
+
+    def __init__(self, accuracy, seed):
+        from config import TENSES, PERSONS
+        from verb_engine import VerbEngine, TENSE_INDEX
+        self.engine = VerbEngine('verbs_data.json', 'verb_translations.json')
+        self.tenses = {display: TENSE_INDEX[key] for key, display in TENSES.items()}
+        self.persons = {display: index for index, display in PERSONS.items()}
+        self.accuracy = accuracy
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def answer(self, text):
+        match = None
+        for match in CHALLENGE_PATTERN.finditer(text or ''):
+            pass
+        if match is None:
+            return "hablo"
+        verb, tense, person = match.groups()
+        verb_idx = self.engine.verb_index.get(verb)
+        if verb_idx is None or tense not in self.tenses or person not in self.persons:
+            return "hablo"
+        person_index = self.persons[person]
+        with self.lock:
+            if self.random.random() >= self.accuracy:
+                # A plausible mistake: the right verb and tense, another person
+                person_index = (person_index + self.random.randrange(1, 6)) % 6
+        return self.engine.get_form(verb_idx, self.tenses[tense], person_index)
+
+
+class VirtualUser:
+    """One simulated user having practice conversations with the bot."""
+
+    def __init__(self, user_id, api, deliver, answerer, results, args):
+        self.user_id = user_id
+        self.api = api
+        self.deliver = deliver
+        self.answerer = answerer
+        self.results = results
+        self.args = args
+        self.last_text = ''
+
+    def _update(self, payload_key, payload):
+        with _update_id_lock:
+            update_id = next(_update_ids)
+        return {"update_id": update_id, payload_key: payload}
+
+    def _user(self):
+        return {"id": self.user_id, "is_bot": False, "first_name": f"User{self.user_id}", "language_code": "es"}
+
+    def message(self, text):
+        payload = {
+            "message_id": int(time.time() * 1000) % 10 ** 9,
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith('/'):
+            payload["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._update("message", payload)
+
+    def callback(self, data):
+        return self._update("callback_query", {
+            "id": f"{self.user_id}-{time.monotonic_ns()}",
+            "chat_instance": str(self.user_id),
+            "from": self._user(),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": self.user_id, "type": "private"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "Verb Master"},
+                "text": "practice",
+            },
+        })
+
+    def step(self, name, update):
+        """Send one update and wait for the bot's reply; False if the conversation can't go on."""
+        after = self.api.calls(self.user_id)
+        start = time.perf_counter()
+        try:
+            self.deliver(update)
+        except Exception:
+            self.results.fail(timeout=False)
+            return False
+        call = self.api.wait_for_call(self.user_id, after, REPLY_METHODS, self.args.timeout)
+        if call is None:
+            self.results.fail(timeout=True)
+            return False
+        self.results.add(name, time.perf_counter() - start)
+        self.last_text = call[2].get('text', '')
+        if self.args.think_time:
+            time.sleep(self.args.think_time)
+        return True
+
+    def run(self):
+        for _ in range(self.args.conversations):
+            if not (self.step('practice', self.message('/practice'))
+                    and self.step('toggle', self.callback('toggle_present'))
+                    and self.step('start', self.callback('start_practice'))):
+                continue
+            for _ in range(self.args.answers):
+                if not self.step('answer', self.message(self.answerer.answer(self.last_text))):
+                    break
+
+
+def webhook_deliverer(api, url):
+    """Deliver updates by POSTing them to a webhook; replies in the response go to the fake API."""
+    target = urlparse(url)
+    local = threading.local()
+
+    def deliver(update):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        body = json.dumps(update).encode('utf-8')
+        try:
+            connection.request('POST', target.path or '/', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            reply = json.loads(response.read() or b'{}')
+        except (OSError, http.client.HTTPException):
+            local.connection = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"Webhook returned HTTP {response.status}")
+        if 'method' in reply:
+            # Webhook-reply mode: Telegram would execute this call
+            method = reply.pop('method')
+            api.record(method, reply)
+
+    return deliver
+
+
+def start_local_webhook():
+    """Serve api/webhook.py on a free local port; returns its URL."""
+    from api import webhook
+    from bot_handlers import get_verb_engine
+
+    # Measure warm processing, not the first update's startup
+    webhook.get_or_create_application()
+    get_verb_engine().build_indexes()
+
+    # One log line per Bot API call would cost more than the calls themselves
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server = LocalHTTPServer(('127.0.0.1', 0), webhook.handler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/api/webhook"
+
+
+def start_polling_bot(env):
+    """Run main.py as a polling bot against the fake API; returns the process."""
+    return subprocess.Popen([sys.executable, 'main.py'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the bot against a fake Bot API")
+    parser.add_argument("--mode", choices=("webhook", "polling"), default="webhook", help="How updates reach the bot")
+    parser.add_argument("--webhook-url", help="Webhook to POST to (default: serve api/webhook.py in-process)")
+    parser.add_argument("--users", type=int, default=50, help="Virtual users")
+    parser.add_argument("--conversations", type=int, default=1, help="Practice conversations per user")
+    parser.add_argument("--answers", type=int, default=5, help="Answers per conversation")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="Fraction of correct answers")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a user waits between updates")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake Bot API latency per call in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Bot API calls failing with 429")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for a reply before giving up")
+    parser.add_argument("--port", type=int, default=0, help="Fake Bot API port (default: a free one)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.error_rate, seed=args.seed)
+    api_server = serve(api, port=args.port)
+    base_url = f"http://127.0.0.1:{api_server.server_address[1]}/bot"
+
+    # The bot reads these when config is imported (in-process) or started (polling)
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_BOT_TOKEN", FAKE_TOKEN)
+    env["TELEGRAM_API_BASE_URL"] = base_url
+    # Virtual users answer faster than people; test flood control only when asked to
+    env.setdefault("FLOOD_CONTROL", "false")
+    # Synthetic answers don't belong in the answer history
+    env.setdefault("ANSWER_LOG_PATH", "")
+    os.environ.update(env)
+
+    bot = None
+    if args.mode == "polling":
+        bot = start_polling_bot(env)
+        if not api.polled.wait(60):
+            print("❌ main.py didn't start polling the fake API")
+            bot.terminate()
+            return 1
+        deliver = api.push_update
+    else:
+        deliver = webhook_deliverer(api, args.webhook_url or start_local_webhook())
+
+    print(f"🚦 {args.users} users, {args.mode} mode, fake Bot API at {base_url}")
+    answerer = Answerer(args.accuracy, args.seed)
+    results = Results()
+    users = [VirtualUser(FIRST_USER_ID + n, api, deliver, answerer, results, args) for n in range(args.users)]
+    threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if bot is not None:
+        bot.terminate()
+        bot.wait(10)
+    api_server.shutdown()
+
+    all_latencies = [latency for latencies in results.latencies.values() for latency in latencies]
+    if not all_latencies:
+        print("❌ No update got a reply (is the bot running against the fake API?)")
+        return 1
+    report = {
+        "mode": args.mode,
+        "users": args.users,
+        "api_latency": args.latency,
+        "error_rate": args.error_rate,
+        "elapsed_s": round(elapsed, 3),
+        "updates": len(all_latencies),
+        "updates_per_sec": round(len(all_latencies) / elapsed, 1),
+        "timeouts": results.timeouts,
+        "errors": results.errors,
+        "bot_api_calls": api.call_count,
+        "rate_limited": api.rate_limited,
+        "latency": percentiles(all_latencies),
+        "steps": {step: percentiles(latencies) for step, latencies in results.latencies.items()},
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"✅ {report['updates']} updates in {report['elapsed_s']} s: {report['updates_per_sec']} updates/sec")
+    for step, stats in [("all", report["latency"]), *report["steps"].items()]:
+        print(f"   {step:10} p50 {stats['p50_ms']:>8.2f} ms   p99 {stats['p99_ms']:>8.2f} ms   ({stats['count']})")
+    if results.timeouts or results.errors or api.rate_limited:
+        print(f"⚠️  {results.timeouts} timeouts, {results.errors} delivery errors, {api.rate_limited} injected 429s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
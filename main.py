@@ -1,14 +1,24 @@
 import logging
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from config import BOT_TOKEN
+from telegram import Update
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, TypeHandler, filters
+from config import BOT_TOKEN, TELEGRAM_API_BASE_URL, METRICS_PORT, MAX_CONCURRENT_UPDATES
+import metrics
+import profiling
+from update_processor import PerUserUpdateProcessor
+from flood_control import flood_guard
 from bot_handlers import (
     start_command,
     help_command,
     practice_command,
+    stats_command,
     handle_message,
     handle_tense_group_selection,
-    error_handler
+    handle_inline_query,
+    error_handler,
+    get_verb_engine,
+    get_answer_log
 )
 
 # Enable logging
@@ -28,13 +38,26 @@ def main():
         logger.error("3. Install python-dotenv: pip install python-dotenv")
         return
     
-    # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Create the Application: different users are served concurrently,
+    # each user's updates in order
+    application = (
+        Application.builder()
+        .application_class(profiling.application_class())
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .request(metrics.instrumented_request(HTTPXRequest(connection_pool_size=MAX_CONCURRENT_UPDATES)))
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .build()
+    )
+    
+    # Flood control runs before all other handlers
+    application.add_handler(TypeHandler(Update, flood_guard), group=-1)
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("practice", practice_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     
     # Add callback query handler for inline keyboards
     application.add_handler(CallbackQueryHandler(handle_tense_group_selection))
@@ -42,12 +65,24 @@ def main():
     # Add message handler for text messages (answers)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    # Add inline query handler for conjugation lookup (@bot habl…)
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    
     # Add error handler
     application.add_error_handler(error_handler)
     
+    # Load verb data and build its indexes up front so the first user doesn't wait for them
+    get_verb_engine().build_indexes()
+    # Replay the answer log now rather than on the first answer
+    get_answer_log()
+    
+    # Expose Prometheus metrics if requested
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+    
     # Start the bot
     logger.info("Starting Spanish Verb Trainer Bot...")
-    application.run_polling(allowed_updates=["message", "callback_query"])
+    application.run_polling(allowed_updates=["message", "callback_query", "inline_query"])
 
 if __name__ == '__main__':
     main()
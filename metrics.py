@@ -0,0 +1,260 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import BOT_API_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = []
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with _lock:
+            self._values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets (seconds) and optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues):
+        series = self._values.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = []
+        for labelvalues, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), series):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Get or create a registered counter."""
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    """Get or create a registered gauge."""
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Get or create a registered histogram."""
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render():
+    """Render all registered metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        with _lock:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the handlers, the webhook and polling mode
+
+HANDLER_CALLS = counter('bot_handler_calls_total', 'Handler invocations', ('handler',))
+HANDLER_ERRORS = counter('bot_handler_errors_total', 'Handler invocations that raised', ('handler',))
+HANDLER_LATENCY = histogram('bot_handler_duration_seconds', 'Handler run time', ('handler',))
+CALLBACK_ACTIONS = counter('bot_callback_actions_total', 'Inline keyboard callbacks by action', ('action',))
+BOT_API_LATENCY = histogram('bot_api_request_duration_seconds', 'Bot API call latency', ('method',))
+BOT_API_ERRORS = counter('bot_api_request_errors_total', 'Bot API calls that failed', ('method',))
+STARTUP_LATENCY = histogram('bot_startup_duration_seconds', 'One-time startup cost per process by phase', ('phase',))
+
+
+def timed(name):
+    """Decorator that counts and times an async handler."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            HANDLER_CALLS.inc(name)
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(name)
+                raise
+            finally:
+                HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def _instrumented_request_class():
+    # Deferred so importing metrics does not pull in python-telegram-bot
+    from telegram.request import BaseRequest
+
+    class InstrumentedRequest(BaseRequest):
+        """Bot API request backend that records per-method latency around another backend."""
+
+        def __init__(self, inner=None):
+            if inner is None:
+                from telegram.request import HTTPXRequest
+                inner = HTTPXRequest(connection_pool_size=BOT_API_POOL_SIZE)
+            self.inner = inner
+
+        @property
+        def read_timeout(self):
+            return self.inner.read_timeout
+
+        async def initialize(self):
+            await self.inner.initialize()
+
+        async def shutdown(self):
+            await self.inner.shutdown()
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            api_method = url.rsplit('/', 1)[-1]
+            start = time.perf_counter()
+            try:
+                return await self.inner.do_request(
+                    url, method, request_data=request_data, read_timeout=read_timeout,
+                    write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout
+                )
+            except Exception:
+                BOT_API_ERRORS.inc(api_method)
+                raise
+            finally:
+                BOT_API_LATENCY.observe(time.perf_counter() - start, api_method)
+
+    return InstrumentedRequest
+
+
+def instrumented_request(inner=None):
+    """Wrap a Bot API request backend (default: HTTPXRequest with BOT_API_POOL_SIZE) with latency metrics."""
+    return _instrumented_request_class()(inner)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (and /profile) for polling mode."""
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/profile':
+            # Deferred: profiling imports this module
+            from urllib.parse import parse_qsl
+            from profiling import http_response
+            status, content_type, body = http_response(dict(parse_qsl(query)))
+        elif path == '/metrics':
+            status, content_type, body = 200, PROMETHEUS_CONTENT_TYPE, render().encode('utf-8')
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Serve /metrics from a background thread (used in polling mode)."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,271 @@
+"""
+Opt-in profiling of live traffic.
+
+With PROFILING=true the Application is built from ProfilingApplication:
+1 in PROFILE_SAMPLE_RATE updates runs under cProfile (only while that
+update's own code runs, not the other tasks on the loop) and the results
+are added up, and a tracemalloc snapshot is taken every
+PROFILE_TRACEMALLOC_INTERVAL seconds. The report is served by the webhook
+(?profile&token=...), the ASGI app and the polling metrics server
+(/profile?token=...), and written to PROFILE_DUMP_DIR on SIGUSR1.
+"""
+
+import cProfile
+import functools
+import hmac
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+import metrics
+from config import (
+    PROFILING, PROFILE_SAMPLE_RATE, PROFILE_TRACEMALLOC_INTERVAL, PROFILE_TOKEN, PROFILE_DUMP_DIR
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILED_UPDATES = metrics.counter('bot_profiled_updates_total', 'Updates run under cProfile')
+
+# Stack depth recorded per allocation (more frames cost more memory)
+TRACEMALLOC_FRAMES = 10
+
+# Allocations by the profiler itself are left out of the report
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'calls', 'time')
+
+
+@types.coroutine
+def _profiled(coroutine, profile):
+    """Run a coroutine with profile enabled only while the coroutine's own code runs."""
+    send, value = coroutine.send, None
+    while True:
+        profile.enable()
+        try:
+            yielded = send(value)
+        except StopIteration as e:
+            return e.value
+        finally:
+            profile.disable()
+        try:
+            value = yield yielded
+            send = coroutine.send
+        except GeneratorExit:
+            coroutine.close()
+            raise
+        except BaseException as e:
+            # Thrown in by the event loop (e.g. cancellation): pass it on
+            value = e
+            send = coroutine.throw
+
+
+class Profiler:
+    """Sampled cProfile aggregate and periodic tracemalloc snapshots."""
+
+    def __init__(self, sample_rate, tracemalloc_interval=0):
+        self.sample_rate = max(1, sample_rate)
+        self.tracemalloc_interval = tracemalloc_interval
+        self.updates = 0
+        self.profiled = 0
+        self._counter = itertools.count()
+        # Reentrant: the SIGUSR1 handler runs on the main thread, possibly while it holds the lock
+        self._lock = threading.RLock()
+        self._stats = None
+        # (time, snapshot) of the previous and latest snapshot
+        self._snapshots = deque(maxlen=2)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def should_sample(self):
+        """True for 1 in sample_rate calls."""
+        self.updates += 1
+        return next(self._counter) % self.sample_rate == 0
+
+    async def run(self, coroutine):
+        """Await a coroutine under cProfile and add its profile to the aggregate."""
+        profile = cProfile.Profile()
+        try:
+            return await _profiled(coroutine, profile)
+        finally:
+            self._add(profile)
+
+    def _add(self, profile):
+        with self._lock:
+            try:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            except TypeError:
+                # Nothing was recorded
+                return
+            self.profiled += 1
+        PROFILED_UPDATES.inc()
+
+    def reset(self):
+        """Drop the aggregated profile."""
+        with self._lock:
+            self._stats = None
+            self.profiled = 0
+
+    # tracemalloc
+
+    def start(self):
+        """Start tracemalloc and the snapshot thread (if an interval is set)."""
+        if not self.tracemalloc_interval or self._thread is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._snapshot_loop, name="tracemalloc-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop taking snapshots and tracing allocations."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        tracemalloc.stop()
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.tracemalloc_interval):
+            self.take_snapshot()
+
+    def take_snapshot(self):
+        """Take a tracemalloc snapshot now (tracemalloc must be running)."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        with self._lock:
+            self._snapshots.append((time.time(), snapshot))
+
+    # Reports
+
+    def report(self, sort='cumulative', limit=30):
+        """Text report of the aggregated profile and the latest allocation snapshot."""
+        if sort not in SORT_KEYS:
+            sort = 'cumulative'
+        out = io.StringIO()
+        with self._lock:
+            out.write(f"cProfile: {self.profiled} of {self.updates} updates profiled "
+                      f"(1 in {self.sample_rate})\n")
+            if self._stats is not None:
+                self._stats.stream = out
+                self._stats.sort_stats(sort).print_stats(limit)
+            snapshots = list(self._snapshots)
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            out.write(f"\ntracemalloc: {current / 2 ** 20:.1f} MiB traced, peak {peak / 2 ** 20:.1f} MiB\n")
+        if snapshots:
+            taken, latest = snapshots[-1]
+            out.write(f"\nTop allocation sites ({time.time() - taken:.0f} s ago):\n")
+            for stat in latest.statistics('lineno')[:limit]:
+                out.write(f"  {stat}\n")
+        if len(snapshots) == 2:
+            previous_taken, previous = snapshots[0]
+            out.write(f"\nGrowth over the {taken - previous_taken:.0f} s before that:\n")
+            for stat in latest.compare_to(previous, 'lineno')[:limit]:
+                if stat.size_diff <= 0:
+                    break
+                out.write(f"  {stat}\n")
+        return out.getvalue()
+
+    def pstats_data(self):
+        """Aggregated profile in the pstats file format (for pstats.Stats, snakeviz...), or None."""
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+    def dump(self, directory):
+        """Write the report (and the profile as .pstats) to directory; returns the report path."""
+        base = os.path.join(directory, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        data = self.pstats_data()
+        if data is not None:
+            with open(base + '.pstats', 'wb') as f:
+                f.write(data)
+        return base + '.txt'
+
+
+PROFILER = Profiler(PROFILE_SAMPLE_RATE, PROFILE_TRACEMALLOC_INTERVAL)
+
+
+def _dump_on_signal(signum, frame):
+    try:
+        logger.info(f"Profile written to {PROFILER.dump(PROFILE_DUMP_DIR)}")
+    except OSError as e:
+        logger.error(f"Could not write profile: {e}")
+
+
+def install_signal_handler():
+    """Write a report on SIGUSR1 (only possible from the main thread, on Unix)."""
+    if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGUSR1, _dump_on_signal)
+    return True
+
+
+def http_response(params):
+    """Answer a profile request; params maps query names to values. Returns (status, content type, body)."""
+    if not PROFILING or not PROFILE_TOKEN:
+        return 404, 'text/plain; charset=utf-8', b'Not found'
+    if not hmac.compare_digest(params.get('token', '').encode('utf-8'), PROFILE_TOKEN.encode('utf-8')):
+        return 403, 'text/plain; charset=utf-8', b'Forbidden'
+    if params.get('format') == 'pstats':
+        data = PROFILER.pstats_data()
+        if data is None:
+            return 404, 'text/plain; charset=utf-8', b'No updates profiled yet'
+        return 200, 'application/octet-stream', data
+    try:
+        limit = int(params.get('limit', 30))
+    except ValueError:
+        limit = 30
+    return 200, 'text/plain; charset=utf-8', PROFILER.report(params.get('sort', 'cumulative'), limit).encode('utf-8')
+
+
+@functools.lru_cache(maxsize=None)
+def _profiling_application_class():
+    # Deferred so importing profiling does not pull in python-telegram-bot
+    from telegram.ext import Application
+
+    class ProfilingApplication(Application):
+        """Application that runs a sample of updates under cProfile."""
+
+        async def initialize(self):
+            await super().initialize()
+            PROFILER.start()
+            install_signal_handler()
+
+        async def shutdown(self):
+            PROFILER.stop()
+            await super().shutdown()
+
+        async def process_update(self, update):
+            if not PROFILER.should_sample():
+                return await super().process_update(update)
+            return await PROFILER.run(super().process_update(update))
+
+    return ProfilingApplication
+
+
+def application_class():
+    """Application class to build: ProfilingApplication if PROFILING is on."""
+    if PROFILING:
+        return _profiling_application_class()
+    from telegram.ext import Application
+    return Application
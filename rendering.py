@@ -0,0 +1,182 @@
+import functools
+from itertools import combinations
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from config import TENSE_GROUPS
+
+# Groups offered on the selection screen ('all' is skipped for now)
+SELECTABLE_GROUPS = tuple(group_key for group_key in TENSE_GROUPS if group_key != 'all')
+
+STOP_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Parar práctica", callback_data="stop_practice")]])
+
+# Prefix of the stop button's callback data when it carries a signed challenge ID
+STOP_PREFIX = "stop_practice:"
+
+
+def stop_keyboard(token=None):
+    """Stop button for a challenge message, carrying the challenge's signed ID if given."""
+    if token is None:
+        return STOP_KEYBOARD
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Parar práctica", callback_data=STOP_PREFIX + token)]])
+
+
+def _build_selection_screen(selected, spaced_repetition=False):
+    """Build the text and keyboard of the tense selection screen for one set of groups and mode."""
+    # Create inline keyboard for tense group selection
+    keyboard = []
+    for group_key in SELECTABLE_GROUPS:
+        # Add checkmark if selected
+        prefix = "✅ " if group_key in selected else "☐ "
+        keyboard.append([InlineKeyboardButton(
+            f"{prefix}{TENSE_GROUPS[group_key]['name_es']}",
+            callback_data=f"toggle_{group_key}"
+        )])
+
+    # Practice mode toggle
+    prefix = "✅ " if spaced_repetition else "☐ "
+    keyboard.append([InlineKeyboardButton(f"{prefix}🧠 Repetición espaciada", callback_data="toggle_mode")])
+
+    # Add control buttons
+    keyboard.append([
+        InlineKeyboardButton("🎯 Empezar práctica", callback_data="start_practice"),
+        InlineKeyboardButton("🔄 Resetear", callback_data="reset_selection")
+    ])
+
+    selected_names = [TENSE_GROUPS[g]['name_es'] for g in SELECTABLE_GROUPS if g in selected]
+    selected_text = ", ".join(selected_names) if selected_names else "Nada seleccionado"
+
+    message = "🎯 **Selecciona tiempos para practicar:**\n\n"
+    message += f"Seleccionado: {selected_text}\n"
+    message += f"Modo: {'Repetición espaciada' if spaced_repetition else 'Aleatorio'}\n\n"
+    message += "Haz clic en los tiempos para seleccionar/deseleccionar, luego 'Empezar práctica'"
+
+    return message, InlineKeyboardMarkup(keyboard)
+
+
+def _build_selection_screens():
+    """Pre-build the selection screen for every subset of selectable groups, in both modes."""
+    screens = {}
+    for size in range(len(SELECTABLE_GROUPS) + 1):
+        for selected in combinations(SELECTABLE_GROUPS, size):
+            for spaced_repetition in (False, True):
+                screens[frozenset(selected), spaced_repetition] = _build_selection_screen(selected, spaced_repetition)
+    return screens
+
+
+SELECTION_SCREENS = _build_selection_screens()
+
+
+def selection_screen(selected_groups, spaced_repetition=False):
+    """Get the prebuilt (text, keyboard) for the selected tense groups and practice mode."""
+    selected = frozenset(selected_groups)
+    screen = SELECTION_SCREENS.get((selected, spaced_repetition))
+    if screen is None:
+        # Unknown group keys (e.g. 'all') are not shown on the screen
+        screen = SELECTION_SCREENS[selected.intersection(SELECTABLE_GROUPS), spaced_repetition]
+    return screen
+
+
+@functools.lru_cache(maxsize=4096)
+def challenge_message(verb, verb_translation, tense_display, person):
+    """Render the challenge prompt (cached per verb, tense and person)."""
+    message = "🔤 **Conjugar el verbo:**\n\n"
+    message += f"**{verb}** ({verb_translation}) "
+    message += f"en **{tense_display}** "
+    message += f"para **{person}**\n\n"
+    message += "Escribe tu respuesta:"
+    return message
+
+
+@functools.lru_cache(maxsize=4096)
+def correct_feedback(verb, verb_translation, correct_answer, has_next):
+    """Render the reply to a correct answer (cached per form)."""
+    response = "¡Correcto! ✅\n\n"
+    response += f"**{verb}** ({verb_translation}) → **{correct_answer}**\n\n"
+    if has_next:
+        response += "Siguiente pregunta:"
+    else:
+        response += "¿Quieres practicar otro verbo? Usa /practice"
+    return response
+
+
+def incorrect_feedback(user_answer, correct_answer, has_next, hint=None):
+    """Render the reply to an incorrect answer (depends on free text, so not cached)."""
+    response = "❌ Incorrecto.\n\n"
+    response += f"Tu respuesta: **{user_answer}**\n"
+    response += f"Respuesta correcta: **{correct_answer}**\n\n"
+    if hint:
+        response += f"{hint}\n\n"
+    if has_next:
+        response += "Siguiente pregunta:"
+    else:
+        response += "¿Quieres intentar otro verbo? Usa /practice"
+    return response
+
+
+@functools.lru_cache(maxsize=1024)
+def mistake_hint(kind, verb, tense_display, person):
+    """Render a hint explaining a wrong answer (see VerbEngine.diagnose); verb, tense and person describe the form typed."""
+    if kind == 'typo':
+        return "💡 Casi: revisa la ortografía."
+    if kind == 'wrong_person':
+        return f"💡 Esa es la forma de **{person}**."
+    if kind == 'wrong_tense':
+        return f"💡 Esa es la forma de **{tense_display}**."
+    if kind == 'wrong_form':
+        return f"💡 Esa es la forma de **{person}** en **{tense_display}**."
+    if kind == 'other_verb':
+        return f"💡 Esa es una forma de **{verb}**."
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def inline_verb_result(verb, verb_translation, tenses):
+    """Inline query result with the full conjugation of a verb.
+
+    tenses is a tuple of (tense_display, forms) pairs in table order.
+    """
+    message = f"📖 **{verb}** ({verb_translation})\n"
+    for tense_display, forms in tenses:
+        message += f"\n**{tense_display}:** {', '.join(forms)}"
+    present = tenses[0][1]
+    return InlineQueryResultArticle(
+        id=f"v:{verb}"[:64],
+        title=f"{verb} — {verb_translation}",
+        description=f"{tenses[0][0]}: {', '.join(present)}",
+        input_message_content=InputTextMessageContent(message, parse_mode='Markdown'),
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def inline_form_result(form, labels):
+    """Inline query result for a conjugated form.
+
+    labels is a tuple of (verb, verb_translation, tense_display, person) for
+    every table cell with this form.
+    """
+    description = "; ".join(f"{verb} · {tense_display} · {person}" for verb, _, tense_display, person in labels)
+    message = f"🔤 **{form}**\n"
+    for verb, verb_translation, tense_display, person in labels:
+        message += f"\n**{verb}** ({verb_translation}) — {tense_display}, {person}"
+    return InlineQueryResultArticle(
+        id=f"f:{form}"[:64],
+        title=form,
+        description=description,
+        input_message_content=InputTextMessageContent(message, parse_mode='Markdown'),
+    )
+
+
+def stats_message(stats):
+    """Render a user's /stats reply (stats is an answer_log.UserStats or None)."""
+    if stats is None or not stats.total:
+        return "📊 Todavía no has respondido ninguna pregunta. Usa /practice para empezar."
+    message = "📊 **Tus estadísticas**\n\n"
+    message += f"Respuestas: {stats.total} ({stats.accuracy:.0%} correctas)\n"
+    message += f"Racha actual: {stats.streak} · Mejor racha: {stats.best_streak}\n"
+    if stats.mean_latency is not None:
+        message += f"Tiempo medio de respuesta: {stats.mean_latency:.1f} s\n"
+    groups = stats.groups()
+    if groups:
+        message += "\n**Por grupo:**\n"
+        for group_key, total, correct in groups:
+            message += f"• {TENSE_GROUPS[group_key]['name_es']}: {correct}/{total} ({correct / total:.0%})\n"
+    return message.rstrip("\n")
@@ -0,0 +1,295 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Record kinds kept per user
+SESSION = 'session'
+CHALLENGE = 'challenge'
+SCHEDULE = 'schedule'
+
+# Cache marker for keys known to be absent from the database
+_ABSENT = object()
+
+
+class SessionStore:
+    """Interface for per-user practice sessions and current challenges."""
+
+    def get_session(self, user_id):
+        """Get the practice session for a user, or None."""
+        raise NotImplementedError
+
+    def set_session(self, user_id, session):
+        """Store the practice session for a user."""
+        raise NotImplementedError
+
+    def delete_session(self, user_id):
+        """Remove the practice session for a user."""
+        raise NotImplementedError
+
+    def get_challenge(self, user_id):
+        """Get the current challenge for a user, or None."""
+        raise NotImplementedError
+
+    def set_challenge(self, user_id, challenge):
+        """Store the current challenge for a user."""
+        raise NotImplementedError
+
+    def delete_challenge(self, user_id):
+        """Remove the current challenge for a user."""
+        raise NotImplementedError
+
+    def get_schedule(self, user_id):
+        """Get the spaced-repetition schedule for a user, or None."""
+        raise NotImplementedError
+
+    def set_schedule(self, user_id, schedule):
+        """Store the spaced-repetition schedule for a user."""
+        raise NotImplementedError
+
+    def delete_schedule(self, user_id):
+        """Remove the spaced-repetition schedule for a user."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write any buffered changes to durable storage."""
+
+    def close(self):
+        """Flush and release resources."""
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """Session store backed by plain dicts (state is lost on restart)."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.challenges = {}
+        self.schedules = {}
+
+    def get_session(self, user_id):
+        return self.sessions.get(user_id)
+
+    def set_session(self, user_id, session):
+        self.sessions[user_id] = session
+
+    def delete_session(self, user_id):
+        self.sessions.pop(user_id, None)
+
+    def get_challenge(self, user_id):
+        return self.challenges.get(user_id)
+
+    def set_challenge(self, user_id, challenge):
+        self.challenges[user_id] = challenge
+
+    def delete_challenge(self, user_id):
+        self.challenges.pop(user_id, None)
+
+    def get_schedule(self, user_id):
+        return self.schedules.get(user_id)
+
+    def set_schedule(self, user_id, schedule):
+        self.schedules[user_id] = schedule
+
+    def delete_schedule(self, user_id):
+        self.schedules.pop(user_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store backed by SQLite in WAL mode.
+
+    Reads go through a small LRU cache; writes update the cache immediately
+    and are written to the database in batches by a background thread, so
+    handlers never wait on a disk sync.
+
+    Schedules are encoded by that thread too, once per batch however often
+    they changed, so they must not be modified after set_schedule().
+    """
+
+    def __init__(self, path, encode_challenge=None, decode_challenge=None,
+                 cache_size=1024, flush_interval=0.05, batch_size=256,
+                 encode_schedule=None, decode_schedule=None):
+        self.path = path
+        self.encode_challenge = encode_challenge or (lambda challenge: challenge)
+        self.decode_challenge = decode_challenge or (lambda state: state)
+        self.encode_schedule = encode_schedule or (lambda schedule: schedule)
+        self.decode_schedule = decode_schedule or (lambda state: state)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            "user_id INTEGER NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, kind))"
+        )
+
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._cache = OrderedDict()
+        # (kind, user_id) -> encoded value (the schedule itself for schedules), or None for a pending delete
+        self._pending = {}
+        # Batch currently being written; still visible to readers until committed
+        self._inflight = {}
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._write_behind, name="session-store-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # Public interface
+
+    def get_session(self, user_id):
+        return self._get(SESSION, user_id)
+
+    def set_session(self, user_id, session):
+        self._set(SESSION, user_id, session, json.dumps(session))
+
+    def delete_session(self, user_id):
+        self._set(SESSION, user_id, _ABSENT, None)
+
+    def get_challenge(self, user_id):
+        return self._get(CHALLENGE, user_id)
+
+    def set_challenge(self, user_id, challenge):
+        self._set(CHALLENGE, user_id, challenge, json.dumps(self.encode_challenge(challenge)))
+
+    def delete_challenge(self, user_id):
+        self._set(CHALLENGE, user_id, _ABSENT, None)
+
+    def get_schedule(self, user_id):
+        return self._get(SCHEDULE, user_id)
+
+    def set_schedule(self, user_id, schedule):
+        # Encoded in the writer thread, off the handler's path
+        self._set(SCHEDULE, user_id, schedule, schedule)
+
+    def delete_schedule(self, user_id):
+        self._set(SCHEDULE, user_id, _ABSENT, None)
+
+    def flush(self):
+        self._drain()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._writer.join()
+        self.flush()
+        self._conn.close()
+
+    # Internals
+
+    def _decode(self, kind, raw):
+        value = json.loads(raw)
+        if kind == CHALLENGE:
+            return self.decode_challenge(value)
+        if kind == SCHEDULE:
+            return self.decode_schedule(value)
+        return value
+
+    def _remember(self, key, value):
+        """Put a value in the LRU cache (caller holds the lock)."""
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _get(self, kind, user_id):
+        key = (kind, user_id)
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                return None if value is _ABSENT else value
+            pending = self._pending if key in self._pending else self._inflight
+            if key in pending:
+                raw = pending[key]
+                if raw is None:
+                    value = _ABSENT
+                else:
+                    value = raw if kind == SCHEDULE else self._decode(kind, raw)
+                self._remember(key, value)
+                return None if value is _ABSENT else value
+
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT value FROM user_state WHERE user_id = ? AND kind = ?", (user_id, kind)
+            ).fetchone()
+        value = _ABSENT if row is None else self._decode(kind, row[0])
+
+        with self._lock:
+            # A concurrent write wins over what we just read
+            if key not in self._cache:
+                self._remember(key, value)
+            value = self._cache[key]
+        return None if value is _ABSENT else value
+
+    def _set(self, kind, user_id, value, raw):
+        key = (kind, user_id)
+        with self._lock:
+            self._remember(key, value)
+            self._pending[key] = raw
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def _write_behind(self):
+        """Background loop that writes pending changes in batches."""
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self._drain()
+            except Exception as e:
+                logger.error(f"Failed to write session batch: {e}")
+
+    def _drain(self):
+        """Write all pending changes, keeping them readable until committed."""
+        with self._db_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # Keep the failed batch for the next attempt unless it was overwritten meanwhile
+                with self._lock:
+                    for key, raw in batch.items():
+                        self._pending.setdefault(key, raw)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+    def _write_batch(self, batch):
+        """Write a batch of pending changes in a single transaction (caller holds the db lock)."""
+        upserts = [(user_id, kind, json.dumps(self.encode_schedule(raw)) if kind == SCHEDULE else raw)
+                   for (kind, user_id), raw in batch.items() if raw is not None]
+        deletes = [(user_id, kind) for (kind, user_id), raw in batch.items() if raw is None]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            if upserts:
+                self._conn.executemany(
+                    "INSERT INTO user_state (user_id, kind, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id, kind) DO UPDATE SET value = excluded.value",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany(
+                    "DELETE FROM user_state WHERE user_id = ? AND kind = ?", deletes
+                )
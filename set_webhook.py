@@ -1,3 +1,4 @@
+import json
 import requests
 import os
 from dotenv import load_dotenv
@@ -6,21 +7,30 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-WEBHOOK_URL = input("Enter your Vercel app URL (e.g., https://your-app.vercel.app/api/webhook): ")
 
-def set_webhook():
-    """Set webhook for Telegram bot."""
+def set_webhook(webhook_url, max_connections=None):
+    """Set webhook for Telegram bot.
+    
+    max_connections limits how many updates Telegram sends at the same time
+    (1-100, Telegram's default is 40). Returns True on success.
+    """
     if not BOT_TOKEN:
         print("❌ Error: TELEGRAM_BOT_TOKEN not found in .env file")
-        return
+        return False
     
-    if not WEBHOOK_URL:
+    if not webhook_url:
         print("❌ Error: Webhook URL not specified")
-        return
+        return False
     
     # Set webhook
     url = f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook"
-    data = {"url": WEBHOOK_URL}
+    data = {
+        "url": webhook_url,
+        # Same update types as polling mode (inline queries power the conjugation lookup)
+        "allowed_updates": json.dumps(["message", "callback_query", "inline_query"]),
+    }
+    if max_connections is not None:
+        data["max_connections"] = max_connections
     
     response = requests.post(url, data=data)
     
@@ -28,11 +38,15 @@ def set_webhook():
         result = response.json()
         if result.get("ok"):
             print("✅ Webhook successfully set!")
-            print(f"📍 URL: {WEBHOOK_URL}")
+            print(f"📍 URL: {webhook_url}")
+            if max_connections is not None:
+                print(f"🔀 Max connections: {max_connections}")
+            return True
         else:
             print(f"❌ Error setting webhook: {result.get('description')}")
     else:
         print(f"❌ HTTP error: {response.status_code}")
+    return False
 
 def get_webhook_info():
     """Get current webhook info."""
@@ -50,6 +64,7 @@ def get_webhook_info():
             print("\n📋 Webhook information:")
             print(f"URL: {webhook_info.get('url', 'Not set')}")
             print(f"Pending updates: {webhook_info.get('pending_update_count', 0)}")
+            print(f"Max connections: {webhook_info.get('max_connections', 40)}")
             if webhook_info.get('last_error_date'):
                 print(f"Last error: {webhook_info.get('last_error_message')}")
         else:
@@ -60,13 +75,14 @@ def get_webhook_info():
 if __name__ == "__main__":
     print("🤖 Setting up Telegram Bot Webhook for Vercel")
     print("=" * 50)
+    webhook_url = input("Enter your Vercel app URL (e.g., https://your-app.vercel.app/api/webhook): ")
     
     # Show current webhook info
     get_webhook_info()
     
     # Set new webhook
     print("\n🔧 Setting up new webhook...")
-    set_webhook()
+    set_webhook(webhook_url)
     
     # Show updated info
     print("\n📋 Updated information:")
@@ -0,0 +1,235 @@
+import base64
+import random
+import sys
+import time
+from array import array
+from session_store import MemorySessionStore
+from verb_engine import PERSON_COUNT, TENSE_LIST
+
+# Leitner boxes: seconds until a cell is due again after landing in each box
+BOX_INTERVALS = (30, 60, 10 * 60, 60 * 60, 24 * 60 * 60, 4 * 24 * 60 * 60)
+MAX_BOX = len(BOX_INTERVALS) - 1
+
+# Heap entries pack (due time, box, cell) into one unsigned 64-bit integer,
+# so comparing entries compares due times first
+CELL_BITS = 24
+BOX_BITS = 4
+CELL_MASK = (1 << CELL_BITS) - 1
+BOX_MASK = (1 << BOX_BITS) - 1
+
+# Random draws tried before scanning the pool for a cell the user hasn't seen
+NEW_CELL_ATTEMPTS = 16
+
+
+def pack_entry(due, box, cell):
+    """Pack a scheduled cell into a single sortable integer."""
+    return (due << (BOX_BITS + CELL_BITS)) | (box << CELL_BITS) | cell
+
+
+def unpack_entry(entry):
+    """Unpack an entry into (due, box, cell)."""
+    return entry >> (BOX_BITS + CELL_BITS), (entry >> CELL_BITS) & BOX_MASK, entry & CELL_MASK
+
+
+def entry_tense(entry):
+    """Tense index of an entry's cell."""
+    return ((entry & CELL_MASK) // PERSON_COUNT) % len(TENSE_LIST)
+
+
+def _encode_bytes(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+class UserSchedule:
+    """Per-user Leitner state: a binary min-heap of packed entries per tense plus a seen-cell bitmap."""
+
+    __slots__ = ('heaps', 'seen', 'pending', 'catalogue')
+
+    def __init__(self, cell_count, catalogue=b''):
+        self.heaps = tuple(array('Q') for _ in TENSE_LIST)
+        self.seen = bytearray((cell_count + 7) // 8)
+        # Entry handed out as a challenge and not answered yet
+        self.pending = None
+        # Verb catalogue the cell indices refer to
+        self.catalogue = catalogue
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps)
+
+    def copy(self):
+        """Copy the schedule (a memory copy of the heaps and bitmap, nothing is re-encoded)."""
+        schedule = UserSchedule.__new__(UserSchedule)
+        schedule.heaps = tuple(heap[:] for heap in self.heaps)
+        schedule.seen = self.seen[:]
+        schedule.pending = self.pending
+        schedule.catalogue = self.catalogue
+        return schedule
+
+    def is_seen(self, cell):
+        return self.seen[cell >> 3] & (1 << (cell & 7))
+
+    def mark_seen(self, cell):
+        self.seen[cell >> 3] |= 1 << (cell & 7)
+
+    def push(self, entry):
+        _heap_push(self.heaps[entry_tense(entry)], entry)
+
+    def pop_earliest(self, tenses):
+        """Remove and return the earliest entry among the given tenses, or None."""
+        earliest = None
+        for tense_idx in tenses:
+            heap = self.heaps[tense_idx]
+            if heap and (earliest is None or heap[0] < earliest[0]):
+                earliest = heap
+        return None if earliest is None else _heap_pop(earliest)
+
+    def to_state(self):
+        """Serialize to a JSON-friendly dict (the heaps in heap order, one after another)."""
+        entries = array('Q')
+        for heap in self.heaps:
+            entries.extend(heap)
+        if sys.byteorder != 'little':
+            entries.byteswap()
+        return {
+            'entries': _encode_bytes(entries.tobytes()),
+            'seen': _encode_bytes(self.seen),
+            'pending': self.pending,
+            'catalogue': self.catalogue.hex(),
+        }
+
+    @classmethod
+    def from_state(cls, state, cell_count):
+        """Rebuild a schedule from to_state() output."""
+        schedule = cls(cell_count, bytes.fromhex(state['catalogue']))
+        entries = array('Q', base64.b64decode(state['entries']))
+        if sys.byteorder != 'little':
+            entries.byteswap()
+        # Each heap was stored whole, so its entries are still in heap order
+        for entry in entries:
+            schedule.heaps[entry_tense(entry)].append(entry)
+        seen = base64.b64decode(state['seen'])[:len(schedule.seen)]
+        schedule.seen[:len(seen)] = seen
+        schedule.pending = state['pending']
+        return schedule
+
+
+def _heap_push(heap, entry):
+    """Add an entry to a binary min-heap stored in an array."""
+    heap.append(entry)
+    position = len(heap) - 1
+    while position:
+        parent = (position - 1) >> 1
+        if heap[parent] <= entry:
+            break
+        heap[position] = heap[parent]
+        position = parent
+    heap[position] = entry
+
+
+def _heap_pop(heap):
+    """Remove and return the smallest entry of a non-empty binary min-heap."""
+    last = heap.pop()
+    if not heap:
+        return last
+    top = heap[0]
+    size = len(heap)
+    position = 0
+    while True:
+        child = 2 * position + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap[child + 1] < heap[child]:
+            child += 1
+        if heap[child] >= last:
+            break
+        heap[position] = heap[child]
+        position = child
+    heap[position] = last
+    return top
+
+
+class SpacedRepetition:
+    """Spaced-repetition (Leitner) scheduler over (verb, tense, person) cells."""
+
+    def __init__(self, engine, store=None):
+        """Keep schedules in a session store (in memory if none is given)."""
+        self.engine = engine
+        self.store = store if store is not None else MemorySessionStore()
+
+    def get_schedule(self, user_id):
+        """Get a copy of the user's schedule to change, or an empty one if there is none for this verb catalogue.
+
+        The stored schedule is never changed in place, since a store may still
+        be encoding it on another thread.
+        """
+        schedule = self.store.get_schedule(user_id)
+        if schedule is None or schedule.catalogue != self.engine.catalogue_id:
+            return UserSchedule(len(self.engine.forms), self.engine.catalogue_id)
+        return schedule.copy()
+
+    def reset(self, user_id):
+        """Forget everything about a user."""
+        self.store.delete_schedule(user_id)
+
+    def next_challenge(self, user_id, tense_group_keys, now=None):
+        """Pick the next challenge: a due cell if any, otherwise a new one, otherwise the soonest due."""
+        now = int(time.time()) if now is None else now
+        schedule = self.get_schedule(user_id)
+        if schedule.pending is not None:
+            # The previous challenge was abandoned; keep it scheduled
+            schedule.push(schedule.pending)
+            schedule.pending = None
+
+        pool = self.engine.get_tense_pool(tense_group_keys)
+        # Earliest scheduled cell within the selected tenses: one heap per tense, so others aren't touched
+        entry = schedule.pop_earliest(pool)
+
+        if entry is None or unpack_entry(entry)[0] > now:
+            cell = self._new_cell(schedule, pool)
+            if cell is not None:
+                if entry is not None:
+                    schedule.push(entry)
+                schedule.mark_seen(cell)
+                entry = pack_entry(now, 0, cell)
+
+        if entry is None:
+            # Nothing scheduled and nothing new in these tenses
+            self.store.set_schedule(user_id, schedule)
+            return self.engine.get_random_challenge_by_groups(tense_group_keys)
+
+        schedule.pending = entry
+        self.store.set_schedule(user_id, schedule)
+        _, box, cell = unpack_entry(entry)
+        challenge = self.engine.challenge_from_cell(cell, selected_groups=tense_group_keys)
+        challenge.srs_box = box
+        return challenge
+
+    def record_answer(self, user_id, challenge, correct, now=None):
+        """Move the answered cell up a box (or back to the first) and reschedule it."""
+        now = int(time.time()) if now is None else now
+        schedule = self.get_schedule(user_id)
+        cell = self.engine.cell_index(challenge.verb_idx, challenge.tense_idx, challenge.person_index)
+        if schedule.pending is not None and unpack_entry(schedule.pending)[2] == cell:
+            schedule.pending = None
+        box = min((challenge.srs_box or 0) + 1, MAX_BOX) if correct else 0
+        schedule.mark_seen(cell)
+        schedule.push(pack_entry(now + BOX_INTERVALS[box], box, cell))
+        self.store.set_schedule(user_id, schedule)
+
+    def _new_cell(self, schedule, pool):
+        """Find a cell in the given tenses that the user has never seen, or None."""
+        verb_count = len(self.engine.verb_list)
+        for _ in range(NEW_CELL_ATTEMPTS):
+            cell = self.engine.cell_index(random.randrange(verb_count), random.choice(pool), random.randrange(PERSON_COUNT))
+            if not schedule.is_seen(cell):
+                return cell
+        # Most cells are seen: scan the pool in random verb order
+        verbs = list(range(verb_count))
+        random.shuffle(verbs)
+        for verb_idx in verbs:
+            for tense_idx in pool:
+                for person_index in range(PERSON_COUNT):
+                    cell = self.engine.cell_index(verb_idx, tense_idx, person_index)
+                    if not schedule.is_seen(cell):
+                        return cell
+        return None
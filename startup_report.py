@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Cold-start timing report.
+
+Imports a module in a fresh interpreter with `python -X importtime`, then
+reports the total import time, the slowest imports, and how long the
+deferred work (Application creation, verb engine load) takes on first use.
+
+Usage:
+    python startup_report.py                      # report for api.webhook
+    python startup_report.py --module main --top 20
+    python startup_report.py --output startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Runs in the child interpreter: import the module, then time the deferred phases
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+phases = {{"import": time.perf_counter() - start}}
+if {deferred}:
+    start = time.perf_counter()
+    import bot_handlers
+    phases["bot_handlers_import"] = time.perf_counter() - start
+    start = time.perf_counter()
+    bot_handlers.get_verb_engine()
+    phases["verb_engine"] = time.perf_counter() - start
+    if hasattr({module}, "create_application"):
+        start = time.perf_counter()
+        {module}.create_application("123456:startup-report")
+        phases["create_application"] = time.perf_counter() - start
+print(json.dumps(phases))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into (module, self_us, cumulative_us, depth) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def run_probe(module, deferred=True):
+    """Import the module in a fresh interpreter and collect timings."""
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:startup-report")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, deferred=deferred)],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{result.stderr[-2000:]}")
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    return phases, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold-start import and initialization times")
+    parser.add_argument("--module", default="api.webhook", help="Entry module to import")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to show")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    phases, rows = run_probe(args.module)
+    top_level = sorted((row for row in rows if row[3] == 0), key=lambda row: row[2], reverse=True)
+    slowest = sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]
+
+    print(f"🚀 Cold start report for {args.module}")
+    print("=" * 50)
+    for phase, seconds in phases.items():
+        print(f"{phase:25} {seconds * 1000:10.1f} ms")
+
+    print("\n📦 Top-level imports by cumulative time:")
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"{name:40} {cumulative_us / 1000:10.1f} ms")
+
+    print("\n🐢 Slowest individual modules (self time):")
+    for name, self_us, _, _ in slowest:
+        print(f"{name:40} {self_us / 1000:10.1f} ms")
+
+    if args.output:
+        report = {
+            "module": args.module,
+            "phases_ms": {phase: round(seconds * 1000, 3) for phase, seconds in phases.items()},
+            "imports": [
+                {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000, "depth": depth}
+                for name, self_us, cumulative_us, depth in rows
+            ],
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📍 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,33 @@ Test script for the Spanish Verb Trainer Bot
 Run this to test the core functionality without needing a Telegram bot token.
 """
 
-from verb_engine import VerbEngine
+from verb_engine import VerbEngine, TENSE_INDEX, TENSE_LIST, PERSON_COUNT, data_sources
+from session_store import SQLiteSessionStore
+from answer_log import AnswerLog, ShardedAnswerLog, iter_events, reshard, shard_path, user_shard
+from verb_db import VerbDB, VerbDBError, check_db, source_stamp, write_db
+from challenge_token import encode_token, decode_token, groups_to_mask, mask_to_groups
+from conjugator import Conjugator, conjugate_regular
+from form_index import FormIndex, PrefixIndex, edit_distance
+import metrics
+import rendering
+import webhook_reply
+from update_processor import PerUserUpdateProcessor
+from api import asgi
+from flood_control import TokenBucketLimiter
+from telegram.ext import ApplicationHandlerStop
+from fake_bot_api import FakeBotAPI, serve
+from profiling import Profiler
+from webhook_server import (shard_key, shard_key_from_body, shard_for, worker_shards, webhook_max_connections,
+                            answer_log_shards, make_proxy_handler, worker_handler_class)
+from srs import SpacedRepetition, UserSchedule, BOX_INTERVALS
 from config import PERSONS, TENSES
+import asyncio
 import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
 
 def test_verb_engine():
     """Test the verb engine functionality."""
@@ -44,6 +68,18 @@ def test_verb_engine():
     assert engine.check_answer("wrong", correct_answer) == False
     print("✅ Wrong answer test passed")
     
+    # Test pronoun-prefixed answers and extra whitespace
+    assert engine.check_answer("  Yo   hablo ", "hablo", 0) == True
+    assert engine.check_answer("usted habla", "habla", 2) == True
+    assert engine.check_answer("Tú hablas", "hablas", 1) == True
+    assert engine.check_answer("yo habla", "habla", 2) == False
+    assert engine.check_answer("nosotros  hemos hablado", "hemos hablado", 3) == True
+    # A form shared by persons takes only the pronouns of the person asked for
+    assert engine.check_answer("yo hablaba", "hablaba", 0) == True
+    assert engine.check_answer("ella hablaba", "hablaba", 0) == False
+    assert engine.check_answer("ella hablaba", "hablaba") == False
+    print("✅ Pronoun and whitespace variant test passed")
+    
     print("✅ All verb engine tests passed!\n")
 
 def test_verb_data():
@@ -65,6 +101,1143 @@ def test_verb_data():
     print(f"✅ Verified structure for {len(verbs_data)} verbs")
     print("✅ All verb data tests passed!\n")
 
+def test_verb_db():
+    """Test the compiled, memory-mapped verb database."""
+    print("🧪 Testing Compiled Verb Database...")
+    
+    engine = VerbEngine()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'verbs.vmdb')
+        sources = source_stamp(data_sources(None, 'verb_translations.json', 'verb_irregulars.json'))
+        write_db(path, TENSE_LIST, PERSON_COUNT, engine.verb_list, engine.translation_list, engine.forms, sources)
+        
+        db = VerbDB(path)
+        assert db.tenses == TENSE_LIST
+        assert list(db.verbs) == list(engine.verb_list)
+        assert list(db.translations) == list(engine.translation_list)
+        assert list(db.forms) == list(engine.forms)
+        assert check_db(path, engine) == []
+        print("✅ Round trip through the binary format")
+        
+        mapped = VerbEngine(db_file=path)
+        assert mapped.db is not None
+        challenge = mapped.make_challenge(mapped.verb_index['ser'], TENSE_INDEX['presente'], 0)
+        assert challenge.correct_answer == 'soy'
+        assert mapped.check_answer('Yo soy', 'soy', 0)
+        assert mapped.get_verb_info('ser') == engine.get_verb_info('ser')
+        print("✅ Engine runs on the memory-mapped tables")
+        
+        # A database compiled from other JSON files is not used
+        translations_file = os.path.join(directory, 'translations.json')
+        with open(translations_file, 'w', encoding='utf-8') as f:
+            json.dump({**engine.verb_translations, 'comer': 'есть'}, f, ensure_ascii=False)
+        fresh = VerbEngine(translations_file=translations_file, db_file=path)
+        assert fresh.db is None and 'comer' in fresh.verb_index
+        assert check_db(path, fresh) == [f"{path} has other verbs than the JSON data",
+                                         f"{path} has other translations than the JSON data",
+                                         f"{path} has other forms than the JSON data"]
+        print("✅ Stale database falls back to JSON")
+        
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        try:
+            VerbDB(path)
+            assert False, "corrupt database was accepted"
+        except VerbDBError:
+            pass
+        assert check_db(path, engine) == [f"{path} is corrupt (checksum mismatch)"]
+        
+        # The engine skips the checksum when opening, but not the table bounds
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+        assert VerbEngine(db_file=path).db is None
+        print("✅ Corrupt database is reported, truncated database falls back to JSON")
+    
+    # The committed database must match what the JSON sources compile to
+    if os.path.exists('verbs.vmdb'):
+        assert VerbEngine(db_file='verbs.vmdb').db is not None, "verbs.vmdb is stale, run: python verb_db.py"
+        assert check_db('verbs.vmdb', engine) == [], "verbs.vmdb is stale, run: python verb_db.py"
+        print("✅ verbs.vmdb is up to date")
+    
+    print("✅ All verb database tests passed!\n")
+
+def test_conjugation_table():
+    """Test that the engine's conjugation table matches the JSON regression data."""
+    print("🧪 Testing Conjugation Table...")
+    
+    engine = VerbEngine()
+    
+    with open('verbs_data.json', 'r', encoding='utf-8') as f:
+        verbs_data = json.load(f)
+    
+    # Every cell of the flat table (generated by the rules) must match the JSON tables
+    for verb, conjugations in verbs_data.items():
+        assert engine.get_verb_info(verb) == conjugations, f"Table mismatch for {verb}"
+    print(f"✅ Table matches JSON for {len(verbs_data)} verbs")
+    
+    # Challenges are slotted objects that still support dict-style access
+    challenge = engine.get_random_challenge_by_groups(['present'])
+    assert not hasattr(challenge, '__dict__')
+    assert challenge['tense'] == 'presente' == challenge.tense
+    assert challenge.correct_answer == verbs_data[challenge.verb][challenge.tense][challenge.person_index]
+    print("✅ Slotted challenge test passed")
+    
+    print("✅ All conjugation table tests passed!\n")
+
+def test_batch_challenges():
+    """Test batched challenge generation over cached tense pools."""
+    print("🧪 Testing Batch Challenges...")
+    
+    engine = VerbEngine()
+    
+    # Pools follow the fixed tense order and are cached per group combination
+    pool = engine.get_tense_pool(['future_conditional', 'present'])
+    assert [list(TENSES)[i] for i in pool] == ['presente', 'condicional', 'futuro']
+    assert engine.get_tense_pool(['present', 'future_conditional']) is pool
+    print("✅ Tense pool test passed")
+    
+    challenges = engine.get_challenges(['past'], 1000)
+    assert len(challenges) == 1000
+    for challenge in challenges:
+        assert challenge.tense.startswith('preterito')
+        assert challenge.correct_answer == engine.get_verb_info(challenge.verb)[challenge.tense][challenge.person_index]
+    print("✅ Generated 1000 challenges in one batch")
+    
+    cells = engine.sample_cells(['past'], 1000)
+    past_cells = {engine.cell_index(verb_idx, tense_idx, person_index)
+                  for verb_idx in range(len(engine.verb_list))
+                  for tense_idx in engine.get_tense_pool(['past'])
+                  for person_index in range(PERSON_COUNT)}
+    assert len(cells) == 1000 and set(cells) <= past_cells
+    assert len(set(engine.sample_cells(['past'], 20000))) == len(past_cells)
+    print("✅ Sampled 1000 cells without building challenges")
+    
+    print("✅ All batch challenge tests passed!\n")
+
+def test_conjugator():
+    """Test the rule-based conjugator against the stored conjugation tables."""
+    print("🧪 Testing Conjugator...")
+    
+    conjugator = Conjugator()
+    
+    with open('verbs_data.json', 'r', encoding='utf-8') as f:
+        verbs_data = json.load(f)
+    
+    # verbs_data.json is the regression set for rules plus irregular overrides
+    for verb, conjugations in verbs_data.items():
+        assert conjugator.get_paradigm(verb) == conjugations, f"Generated forms differ for {verb}"
+    print(f"✅ Generated paradigms match JSON for {len(verbs_data)} verbs")
+    
+    # Regular verbs outside the table need no stored data
+    assert not conjugator.is_irregular('comer')
+    assert conjugator.conjugate('comer', 'preterito_perfecto')[3] == "hemos comido"
+    assert conjugator.conjugate('buscar', 'preterito_indefinido')[0] == "busqué"
+    assert conjugator.conjugate('leer', 'preterito_indefinido')[2] == "leyó"
+    assert conjugate_regular('dormir', 'preterito_indefinido', 'o>ue')[5] == "durmieron"
+    assert conjugate_regular('dormir', 'presente', 'o>ue')[3] == "dormimos"
+    assert conjugator.conjugate('traducir', 'preterito_indefinido') == ("traduje", "tradujiste", "tradujo", "tradujimos", "tradujisteis", "tradujeron")
+    assert conjugator.conjugate('oír', 'preterito_indefinido')[2] == "oyó"
+    assert conjugator.conjugate('reír', 'futuro')[0] == "reiré"
+    print("✅ Regular rule test passed")
+    
+    # Spelling and stem-change classes outside the regression set
+    cases = [
+        ('construir', 'presente', None, ("construyo", "construyes", "construye", "construimos", "construís", "construyen")),
+        ('construir', 'preterito_indefinido', None, ("construí", "construiste", "construyó", "construimos", "construisteis", "construyeron")),
+        ('incluir', 'preterito_indefinido', None, ("incluí", "incluiste", "incluyó", "incluimos", "incluisteis", "incluyeron")),
+        ('huir', 'presente', None, ("huyo", "huyes", "huye", "huimos", "huis", "huyen")),
+        ('huir', 'preterito_indefinido', None, ("hui", "huiste", "huyó", "huimos", "huisteis", "huyeron")),
+        ('distinguir', 'presente', None, ("distingo", "distingues", "distingue", "distinguimos", "distinguís", "distinguen")),
+        ('averiguar', 'preterito_indefinido', None, ("averigüé", "averiguaste", "averiguó", "averiguamos", "averiguasteis", "averiguaron")),
+        ('cocer', 'presente', 'o>ue', ("cuezo", "cueces", "cuece", "cocemos", "cocéis", "cuecen")),
+        ('torcer', 'presente', 'o>ue', ("tuerzo", "tuerces", "tuerce", "torcemos", "torcéis", "tuercen")),
+        ('conocer', 'presente', None, ("conozco", "conoces", "conoce", "conocemos", "conocéis", "conocen")),
+        ('dormir', 'presente', 'o>ue', ("duermo", "duermes", "duerme", "dormimos", "dormís", "duermen")),
+        ('dormir', 'preterito_indefinido', 'o>ue', ("dormí", "dormiste", "durmió", "dormimos", "dormisteis", "durmieron")),
+        ('jugar', 'presente', 'u>ue', ("juego", "juegas", "juega", "jugamos", "jugáis", "juegan")),
+        ('jugar', 'preterito_indefinido', 'u>ue', ("jugué", "jugaste", "jugó", "jugamos", "jugasteis", "jugaron")),
+        ('elegir', 'presente', 'e>i', ("elijo", "eliges", "elige", "elegimos", "elegís", "eligen")),
+    ]
+    for verb, tense, stem_change, expected in cases:
+        assert conjugate_regular(verb, tense, stem_change) == expected, f"{verb} {tense}"
+    print(f"✅ {len(cases)} spelling and stem-change cases passed")
+    
+    # Forms are generated on first use and the memo cache stays bounded
+    engine = VerbEngine()
+    cache_info = engine.conjugator.conjugate.cache_info
+    assert cache_info().currsize == 0
+    assert engine.get_form(engine.verb_index['hablar'], TENSE_INDEX['futuro'], 0) == "hablaré"
+    assert cache_info().currsize == 1
+    small = Conjugator(cache_size=4)
+    for verb in ('hablar', 'comer', 'vivir', 'construir', 'huir', 'cocer'):
+        small.conjugate(verb, 'presente')
+    assert small.conjugate.cache_info().currsize == 4
+    print("✅ Lazy generation with a bounded memo cache")
+    
+    # A bad translation-only entry drops that verb, not the engine
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        translations_file = os.path.join(tmp_dir, 'translations.json')
+        with open(translations_file, 'w', encoding='utf-8') as f:
+            json.dump({"reír": "смеяться", "hablo": "говорю"}, f, ensure_ascii=False)
+        engine = VerbEngine(translations_file=translations_file)
+        assert 'reír' in engine.verb_index and 'hablo' not in engine.verb_index
+        assert engine.get_verb_info('reír')['preterito_perfecto'][0] == "he reído"
+    print("✅ Accented and invalid infinitives handled per verb")
+    
+    print("✅ All conjugator tests passed!\n")
+
+def test_diagnostics():
+    """Test the reverse form index and wrong-answer diagnosis."""
+    print("🧪 Testing Wrong-Answer Diagnostics...")
+    
+    assert edit_distance("hablo", "hablo") == 0
+    assert edit_distance("hablo", "habla") == 1
+    assert edit_distance("hablamos", "hablo") == 3
+    assert edit_distance("hablamos", "hablo", limit=1) == 2
+    
+    words = ["hablo", "hablas", "habla", "comes", "vivimos", "hablamos"]
+    index = FormIndex(words)
+    for query in ("habo", "comer", "hablamoss", "xyz"):
+        expected = sorted((edit_distance(query, word), cell) for cell, word in enumerate(words)
+                          if edit_distance(query, word) <= 1)
+        assert index.near(query, range(len(words)), 1) == expected, query
+    assert index.near("habo", range(1, len(words)), 1) == []  # only the given cells are searched
+    print("✅ Near-miss search matches a linear scan")
+    
+    engine = VerbEngine()
+    hablar = engine.verb_index['hablar']
+    challenge = engine.make_challenge(hablar, TENSE_INDEX['presente'], 0)  # hablo
+    assert engine.diagnose(challenge, "hablo") is None
+    assert engine.diagnose(challenge, "hablas").kind == 'wrong_person'
+    assert engine.diagnose(challenge, "tú hablas").kind == 'wrong_person'
+    assert engine.diagnose(challenge, "hablé").kind == 'wrong_tense'
+    assert engine.diagnose(challenge, "hablaste").kind == 'wrong_form'
+    assert engine.diagnose(challenge, "habo").kind == 'typo'
+    assert engine.diagnose(challenge, "vivimos").kind == 'other_verb'
+    assert engine.diagnose(challenge, "xyz") is None
+    
+    diagnosis = engine.diagnose(challenge, "hablamos")
+    typed = engine.challenge_from_cell(diagnosis.cell)
+    assert (typed.verb, typed.tense, typed.person_index) == ('hablar', 'presente', 3)
+    print("✅ Wrong answers classified")
+    
+    print("✅ All diagnostics tests passed!\n")
+
+def test_inline_lookup():
+    """Test the prefix indexes behind inline queries."""
+    print("🧪 Testing Inline Lookup...")
+    
+    index = PrefixIndex([("hablo", 1), ("hablas", 2), ("comes", 3), ("hablo", 1), ("habla", 4)])
+    assert index.search("habl", 10) == [4, 2, 1]
+    assert index.search("habl", 2) == [4, 2]
+    assert index.search("x", 10) == []
+    print("✅ Prefix search in key order with a cap")
+    
+    engine = VerbEngine()
+    results = engine.lookup("Habl", 20)
+    assert results[0] == ('verb', engine.verb_index['hablar'])
+    assert len(results) == 20
+    assert all(kind == 'verb' or engine.forms[cells[0]].startswith('habl') or 'hablado' in engine.forms[cells[0]]
+               for kind, cells in results)
+    assert ('verb', engine.verb_index['hablar']) in engine.lookup("говор")
+    fue = [cells for kind, cells in engine.lookup("fue") if kind == 'form' and engine.forms[cells[0]] == 'fue'][0]
+    assert {engine.challenge_from_cell(cell).verb for cell in fue} == {'ser', 'ir'}
+    assert engine.lookup("   ") == []
+    print("✅ Infinitives, translations and forms found by prefix")
+    
+    tenses = tuple((TENSES[tense], tuple(forms)) for tense, forms in engine.get_verb_info('hablar').items())
+    result = rendering.inline_verb_result('hablar', 'говорить', tenses)
+    assert result.id == 'v:hablar'
+    assert 'hablaríamos' in result.input_message_content.message_text
+    print("✅ Inline results rendered")
+    
+    print("✅ All inline lookup tests passed!\n")
+
+def test_challenge_token():
+    """Test signed, stateless challenge IDs."""
+    print("🧪 Testing Challenge Tokens...")
+    
+    assert mask_to_groups(groups_to_mask(['past', 'present'])) == ['present', 'past']
+    
+    token = encode_token(1234, 5, 3, ['present', 'future_conditional'], srs=True, srs_box=2, user_id=42, catalogue=b'v1')
+    assert len("stop_practice:" + token) <= 64  # Telegram's callback_data limit
+    assert decode_token(token, 42, b'v1') == (1234, 5, 3, ['present', 'future_conditional'], True, 2, 0)
+    
+    token = encode_token(7, 0, 0, ['past'], user_id=42, issued_ms=1_700_000_000_123)
+    assert decode_token(token, 42) == (7, 0, 0, ['past'], False, None, 1_700_000_000_123)
+    print("✅ Round trip")
+    
+    assert decode_token(token, 43) is None  # another user
+    assert decode_token(token, 42, b'other catalogue') is None
+    tampered = ('A' if token[0] != 'A' else 'B') + token[1:]
+    assert decode_token(tampered, 42) is None
+    assert decode_token("not a token!", 42) is None
+    print("✅ Tampered, foreign and stale tokens rejected")
+    
+    print("✅ All challenge token tests passed!\n")
+
+def test_reply_answers():
+    """Test that a reply to a challenge message counts once and not after Stop."""
+    print("🧪 Testing Reply Answers...")
+    import bot_handlers
+    from session_store import MemorySessionStore
+    from rendering import STOP_PREFIX
+    
+    store, answer_log = bot_handlers.session_store, bot_handlers._answer_log
+    bot_handlers.session_store = MemorySessionStore()
+    bot_handlers._answer_log = AnswerLog(None)
+    sent = []
+    
+    markups = []
+    
+    async def reply_text(text, reply_markup=None, **kwargs):
+        sent.append(text)
+        markups.append(reply_markup)
+    
+    def stop_markup(challenge):
+        # What the bot sends with a challenge issued now
+        keyboard = [[SimpleNamespace(callback_data=STOP_PREFIX + bot_handlers.challenge_token(challenge, 42))]]
+        return SimpleNamespace(inline_keyboard=keyboard)
+    
+    def reply_to(reply_markup, message_id, text):
+        replied = SimpleNamespace(message_id=message_id, date=SimpleNamespace(timestamp=time.time),
+                                  reply_markup=reply_markup)
+        message = SimpleNamespace(text=text, reply_to_message=replied, reply_text=reply_text)
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42), message=message)
+        asyncio.run(bot_handlers.handle_message(update, None))
+    
+    try:
+        engine = bot_handlers.get_verb_engine()
+        challenge = engine.make_challenge(engine.verb_index['hablar'], TENSE_INDEX['presente'], 0,
+                                          selected_groups=['present'])
+        # No session on this instance: the signed challenge is accepted, once
+        sent_challenge = stop_markup(challenge)
+        for _ in range(3):
+            reply_to(sent_challenge, 10, "hablo")
+        assert bot_handlers._answer_log.stats(42).total == 1
+        assert sent[-1].startswith("Ese desafío ya está respondido")
+        print("✅ Replayed reply answers rejected")
+    
+        # The reply started a session with a new current challenge; replying to that one works
+        current = bot_handlers.session_store.get_challenge(42)
+        reply_to(stop_markup(current), 12, current.correct_answer)
+        assert bot_handlers._answer_log.stats(42).total == 2
+    
+        # After Stop, replies to old challenges don't restart practice
+        session = bot_handlers.session_store.get_session(42)
+        session['active'] = False
+        bot_handlers.session_store.set_session(42, session)
+        bot_handlers.session_store.delete_challenge(42)
+        sent.clear()
+        reply_to(stop_markup(challenge), 20, "hablo")
+        assert bot_handlers._answer_log.stats(42).total == 2
+        assert "/practice" in sent[-1] and bot_handlers.session_store.get_challenge(42) is None
+        print("✅ Stopped practice stays stopped")
+        
+        # Two instances with their own stores: answers alternate between them and all count
+        bot_handlers._answer_log = AnswerLog(None)
+        instances = [MemorySessionStore(), MemorySessionStore()]
+        bot_handlers.session_store = instances[0]
+        reply_to(stop_markup(challenge), 30, "hablo")
+        for message_id in range(31, 37):
+            bot_handlers.session_store = instances[message_id % 2]
+            reply_to(markups[-1], message_id, "no sé")
+        assert bot_handlers._answer_log.stats(42).total == 7
+        # A replay is still rejected by the instance that counted it
+        reply_to(markups[-2], 36, "no sé")
+        assert bot_handlers._answer_log.stats(42).total == 7
+        # A challenge issued later but edited into an older message counts
+        time.sleep(0.002)
+        reply_to(stop_markup(challenge), 5, "hablo")
+        assert bot_handlers._answer_log.stats(42).total == 8
+        print("✅ Replies alternating between instances all count")
+    finally:
+        bot_handlers.session_store, bot_handlers._answer_log = store, answer_log
+    
+    print("✅ All reply answer tests passed!\n")
+
+def test_combined_reply():
+    """Test that an answer gets one reply holding the verdict and the next challenge."""
+    print("🧪 Testing Combined Reply...")
+    import bot_handlers
+    from rendering import STOP_PREFIX
+    from session_store import MemorySessionStore
+    
+    store, answer_log, combined = bot_handlers.session_store, bot_handlers._answer_log, bot_handlers.COMBINED_REPLY
+    bot_handlers.session_store = MemorySessionStore()
+    bot_handlers._answer_log = AnswerLog(None)
+    bot_handlers.COMBINED_REPLY = True
+    replies = []
+    
+    async def reply_text(text, reply_markup=None, **kwargs):
+        replies.append((text, reply_markup))
+    
+    def answer(text):
+        replies.clear()
+        message = SimpleNamespace(text=text, reply_to_message=None, reply_text=reply_text)
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=42), message=message)
+        asyncio.run(bot_handlers.handle_message(update, None))
+        return replies
+    
+    try:
+        bot_handlers.session_store.set_session(42, {'selected_groups': ['present'], 'active': True, 'mode': 'random'})
+        challenge = bot_handlers.create_challenge(42, ['present'])
+        for text, verdict in ((challenge.correct_answer, "¡Correcto!"), ("no sé", "Incorrecto")):
+            (reply, reply_markup), = answer(text)
+            following = bot_handlers.session_store.get_challenge(42)
+            assert verdict in reply and "Siguiente pregunta:" in reply
+            assert reply.endswith(rendering.challenge_message(following.verb, following.verb_translation,
+                                                              following.tense_display, following.person))
+            # The Stop button carries the next challenge, so replying to this message answers it
+            stop_data, = (button.callback_data for row in reply_markup.inline_keyboard for button in row)
+            replied = SimpleNamespace(reply_markup=reply_markup, message_id=1)
+            from_reply, mode, issued_ms = bot_handlers.challenge_from_reply(
+                SimpleNamespace(reply_to_message=replied), 42)
+            assert stop_data.startswith(STOP_PREFIX) and from_reply.correct_answer == following.correct_answer
+            challenge = following
+        print("✅ Verdict and next challenge sent as one reply")
+        
+        # Last challenge of a stopped practice: one reply with the verdict only
+        bot_handlers.session_store.set_session(42, {'selected_groups': ['present'], 'active': False, 'mode': 'random'})
+        (reply, reply_markup), = answer(challenge.correct_answer)
+        assert "¡Correcto!" in reply and "/practice" in reply and "Conjugar" not in reply
+        assert reply_markup is None and bot_handlers.session_store.get_challenge(42) is None
+        assert bot_handlers._answer_log.stats(42).total == 3
+        print("✅ Answer after Stop gets the verdict alone")
+    finally:
+        bot_handlers.session_store, bot_handlers._answer_log = store, answer_log
+        bot_handlers.COMBINED_REPLY = combined
+    
+    print("✅ All combined reply tests passed!\n")
+
+def test_spaced_repetition():
+    """Test the Leitner scheduler picks due cells first and reschedules answers."""
+    print("🧪 Testing Spaced Repetition...")
+    
+    engine = VerbEngine()
+    srs = SpacedRepetition(engine)
+    now = 1_000_000
+    
+    # New cells are introduced while nothing is due
+    first = srs.next_challenge(1, ['present'], now=now)
+    assert first.srs_box == 0 and first.tense == 'presente'
+    srs.record_answer(1, first, correct=False, now=now)
+    second = srs.next_challenge(1, ['present'], now=now + 1)
+    assert (second.verb, second.person_index) != (first.verb, first.person_index)
+    srs.record_answer(1, second, correct=True, now=now + 1)
+    print("✅ New cell introduction test passed")
+    
+    # Once due, the missed cell comes back before anything new
+    again = srs.next_challenge(1, ['present'], now=now + BOX_INTERVALS[0])
+    assert (again.verb, again.tense, again.person_index) == (first.verb, first.tense, first.person_index)
+    srs.record_answer(1, again, correct=True, now=now + BOX_INTERVALS[0])
+    print("✅ Due cell priority test passed")
+    
+    # Due cells from tenses outside the selection are skipped but kept
+    other = srs.next_challenge(1, ['past'], now=now + 10 ** 7)
+    assert other.tense.startswith('preterito')
+    assert len(srs.get_schedule(1)) == 2
+    print("✅ Tense filter test passed")
+    
+    # Schedules live in the session store and survive a restart
+    with tempfile.TemporaryDirectory() as directory:
+        def open_store():
+            return SQLiteSessionStore(os.path.join(directory, 'sessions.db'),
+                                      encode_schedule=lambda schedule: schedule.to_state(),
+                                      decode_schedule=lambda state: UserSchedule.from_state(state, len(engine.forms)))
+        store = open_store()
+        stored = SpacedRepetition(engine, store)
+        missed = stored.next_challenge(7, ['present'], now=now)
+        stored.record_answer(7, missed, correct=False, now=now)
+        stored.next_challenge(7, ['past'], now=now + 1)
+        store.close()
+        store = open_store()
+        restarted = SpacedRepetition(engine, store)
+        assert len(restarted.get_schedule(7)) == 1 and restarted.get_schedule(7).pending is not None
+        due = restarted.next_challenge(7, ['present'], now=now + BOX_INTERVALS[0])
+        assert (due.verb, due.tense, due.person_index) == (missed.verb, missed.tense, missed.person_index)
+        store.close()
+    print("✅ Schedules persist in the session store")
+    
+    # Schedules are encoded when a batch is written, not on every answer, and never change once stored
+    with tempfile.TemporaryDirectory() as directory:
+        encoded = []
+        store = SQLiteSessionStore(os.path.join(directory, 'sessions.db'), flush_interval=60,
+                                   encode_schedule=lambda schedule: encoded.append(schedule) or schedule.to_state(),
+                                   decode_schedule=lambda state: UserSchedule.from_state(state, len(engine.forms)))
+        stored = SpacedRepetition(engine, store)
+        for _ in range(5):
+            challenge = stored.next_challenge(8, ['present'], now=now)
+            kept = store.get_schedule(8)
+            stored.record_answer(8, challenge, correct=True, now=now)
+            assert store.get_schedule(8) is not kept and kept.pending is not None
+        assert encoded == []
+        store.flush()
+        assert encoded == [store.get_schedule(8)] and len(encoded[0]) == 5
+        store.close()
+    print("✅ Schedules are encoded once per batch by the writer")
+    
+    print("✅ All spaced repetition tests passed!\n")
+
+def test_session_store():
+    """Test that the SQLite session store persists sessions and challenges."""
+    print("🧪 Testing Session Store...")
+    
+    engine = VerbEngine()
+    challenge = engine.get_random_challenge_by_groups(['past'])
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'sessions.db')
+        
+        store = SQLiteSessionStore(path, lambda c: c.to_state(), engine.challenge_from_state)
+        store.set_session(1, {'selected_groups': ['past'], 'active': True})
+        store.set_challenge(1, challenge)
+        store.set_session(2, {'selected_groups': [], 'active': False})
+        store.delete_session(2)
+        # Reads are served from the cache before the batch is written
+        assert store.get_session(1)['active'] == True
+        store.close()
+        
+        # A fresh store (e.g. after a restart) sees the same state
+        store = SQLiteSessionStore(path, lambda c: c.to_state(), engine.challenge_from_state)
+        assert store.get_session(1) == {'selected_groups': ['past'], 'active': True}
+        assert store.get_session(2) is None
+        restored = store.get_challenge(1)
+        assert restored.correct_answer == challenge.correct_answer
+        assert restored.selected_groups == ['past']
+        store.close()
+    print("✅ Session persistence test passed")
+    
+    print("✅ All session store tests passed!\n")
+
+def test_answer_log():
+    """Test answer statistics, log rotation and replay after a restart."""
+    print("🧪 Testing Answer Log...")
+    
+    engine = VerbEngine()
+    present = engine.get_random_challenge_by_groups(['present'])
+    past = engine.get_random_challenge_by_groups(['past'])
+    answers = [(present, True), (present, True), (past, False), (present, True), (past, True)] * 4
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'answers.jsonl')
+        log = AnswerLog(path, fsync=False, max_bytes=600)
+        for challenge, correct in answers:
+            log.challenge_issued(1, time.time() - 2)
+            log.record(1, challenge, challenge.correct_answer if correct else "xxx", correct)
+            log.flush()
+        stats = log.stats(1)
+        assert (stats.total, stats.correct, stats.streak, stats.best_streak) == (20, 16, 2, 4)
+        assert dict((group, (total, correct)) for group, total, correct in stats.groups()) == {
+            'present': (12, 12), 'past': (8, 4)}
+        assert 1.9 < stats.mean_latency < 3
+        assert log.stats(2) is None
+        print("✅ Statistics updated per answer")
+        log.close()
+        
+        assert any(name.endswith('.jsonl.gz') for name in os.listdir(tmp_dir))
+        events = list(iter_events(path))
+        assert len(events) == 20 and events[2]['answer'] == "xxx" and 'answer' not in events[0]
+        
+        # After a restart: snapshot plus the events written since
+        log = AnswerLog(path, fsync=False, max_bytes=600)
+        assert log.stats(1).to_state() == stats.to_state()
+        log.close()
+        print("✅ Rotated, compacted and replayed after restart")
+        
+        # Per-user shards: reopened in another split of shards, each user keeps their log
+        sharded_path = os.path.join(tmp_dir, 'sharded.jsonl')
+        first, second = ShardedAnswerLog(sharded_path, 4, [0, 1], fsync=False), ShardedAnswerLog(sharded_path, 4, [2, 3], fsync=False)
+        for user_id in range(20):
+            (first if user_shard(user_id, 4) < 2 else second).record(user_id, present, present.correct_answer, True)
+        first.close()
+        second.close()
+        reopened = ShardedAnswerLog(sharded_path, 4, range(4), fsync=False)
+        assert all(reopened.stats(user_id).total == 1 for user_id in range(20))
+        reopened.close()
+        print("✅ Sharded log keeps users' statistics when shards move")
+        
+        # Another number of shards: every event moves, in order, to its user's new shard
+        assert reshard(sharded_path, 6) and not reshard(sharded_path, 6)
+        assert sorted(os.listdir(tmp_dir)) == sorted(
+            [name for name in os.listdir(tmp_dir) if '.shard' not in name] +
+            [os.path.basename(shard_path(sharded_path, shard)) for shard in range(6)])
+        for shard in range(6):
+            assert all(user_shard(event['user'], 6) == shard for event in iter_events(shard_path(sharded_path, shard)))
+        resharded = ShardedAnswerLog(sharded_path, 6, range(6), fsync=False)
+        assert all(resharded.stats(user_id).total == 1 for user_id in range(20))
+        resharded.close()
+        print("✅ Resharded log keeps users' statistics")
+        
+        # A swap cut short (here after two files) is finished by the next start
+        import answer_log
+        replace, calls = os.replace, []
+        def failing_replace(source, target):
+            calls.append(source)
+            if len(calls) > 2:
+                raise OSError("interrupted")
+            replace(source, target)
+        answer_log.os.replace = failing_replace
+        try:
+            reshard(sharded_path, 4)
+            assert False, "swap was not interrupted"
+        except OSError:
+            pass
+        finally:
+            answer_log.os.replace = replace
+        assert reshard(sharded_path, 4) and not reshard(sharded_path, 4)
+        resharded = ShardedAnswerLog(sharded_path, 4, range(4), fsync=False)
+        assert all(resharded.stats(user_id).total == 1 for user_id in range(20))
+        resharded.close()
+        print("✅ Interrupted reshard is completed on the next start")
+    
+    print("✅ All answer log tests passed!\n")
+
+def test_analytics():
+    """Test the columnar answer history analysis."""
+    print("🧪 Testing Analytics...")
+    
+    try:
+        import analytics
+    except ImportError:
+        reason = "NumPy not installed (pip install -r requirements-analytics.txt)"
+        if 'pytest' in sys.modules:
+            import pytest
+            pytest.skip(reason)
+        print(f"⚠️  {reason}, skipping analytics tests\n")
+        return
+    
+    engine = VerbEngine()
+    challenge = engine.make_challenge(engine.verb_index['hablar'], TENSE_INDEX['presente'], 0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'answers.jsonl')
+        log = AnswerLog(path, fsync=False)
+        for user_id in (1, 2, 3):
+            log.record(user_id, challenge, "hablo", True)
+            log.record(user_id, challenge, "hablas", False)
+        log.record(3, challenge, "zzzz", False)
+        log.close()
+        # Small chunks so counts are merged across passes
+        result, skipped = analytics.analyze([path], engine, chunk_size=3)
+    
+    report = result.report(engine, top=5, min_answers=1)
+    assert (report['answers'], report['users'], skipped) == (7, 3, 0)
+    assert report['verbs'][0]['verb'] == 'hablar' and report['verbs'][0]['errors'] == 4
+    assert report['tense_person']['presente'][0] == round(4 / 7, 4)
+    assert report['mistakes']['wrong_person'] == 3 and report['mistakes']['unknown'] == 1
+    print("✅ Error rates and mistake kinds test passed")
+    
+    confusion = report['confusions'][0]
+    assert (confusion['expected']['form'], confusion['typed']['form'], confusion['count']) == ('hablo', 'hablas', 3)
+    assert len(report['cohorts']) == 1 and report['cohorts'][0]['users'] == 3
+    assert report['experience'][0]['answers'] == 7
+    print("✅ Confusion pairs and cohorts test passed")
+    
+    print("✅ All analytics tests passed!\n")
+
+def test_metrics():
+    """Test Prometheus rendering of counters and histograms."""
+    print("🧪 Testing Metrics...")
+    
+    calls = metrics.counter('test_calls_total', 'Test calls', ('handler',))
+    latency = metrics.histogram('test_latency_seconds', 'Test latency', ('handler',), buckets=(0.01, 0.1))
+    calls.inc('practice')
+    calls.inc('practice')
+    latency.observe(0.005, 'practice')
+    latency.observe(0.5, 'practice')
+    
+    text = metrics.render()
+    assert '# TYPE test_calls_total counter' in text
+    assert 'test_calls_total{handler="practice"} 2' in text
+    assert 'test_latency_seconds_bucket{handler="practice",le="0.01"} 1' in text
+    assert 'test_latency_seconds_bucket{handler="practice",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{handler="practice"} 2' in text
+    print("✅ Prometheus text format test passed")
+    
+    print("✅ All metrics tests passed!\n")
+
+def test_rendering():
+    """Test prebuilt selection screens and cached challenge messages."""
+    print("🧪 Testing Rendering...")
+    
+    # Every subset of the three selectable groups is prebuilt
+    assert len(rendering.SELECTION_SCREENS) == 16
+    text, keyboard = rendering.selection_screen(['past', 'present'])
+    assert rendering.selection_screen(['present', 'past'])[1] is keyboard
+    assert "Seleccionado: Presente, Tiempos Pasados" in text
+    assert keyboard.inline_keyboard[0][0].text.startswith("✅")
+    assert keyboard.inline_keyboard[2][0].text.startswith("☐")
+    print("✅ Selection screen test passed")
+    
+    message = rendering.challenge_message("hablar", "говорить", "Presente", "tú")
+    assert rendering.challenge_message("hablar", "говорить", "Presente", "tú") is message
+    assert "**hablar** (говорить) en **Presente** para **tú**" in message
+    print("✅ Challenge message cache test passed")
+    
+    print("✅ All rendering tests passed!\n")
+
+def test_webhook_reply():
+    """Test that webhook-reply mode holds back the first Bot API call."""
+    print("🧪 Testing Webhook Reply...")
+    from telegram import Bot
+    from telegram.request import BaseRequest
+    
+    class RecordingRequest(BaseRequest):
+        def __init__(self):
+            self.sent = []
+        async def initialize(self):
+            pass
+        async def shutdown(self):
+            pass
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            self.sent.append(url.rsplit('/', 1)[-1])
+            if url.endswith('answerCallbackQuery'):
+                return 200, b'{"ok": true, "result": true}'
+            return 200, json.dumps({"ok": True, "result": {
+                "message_id": 1, "date": 0, "chat": {"id": 7, "type": "private"}, "text": "x"}}).encode()
+    
+    inner = RecordingRequest()
+    bot = Bot('1:test', request=webhook_reply.ReplyCaptureRequest(inner))
+    
+    async def one_message():
+        await bot.send_message(7, "hola")
+    
+    reply = asyncio.run(webhook_reply.capture_reply(one_message()))
+    assert reply == {"method": "sendMessage", "chat_id": 7, "text": "hola"}
+    assert inner.sent == []
+    print("✅ Single call returned in the response")
+    
+    async def two_messages():
+        await bot.send_message(7, "uno")
+        await bot.send_message(7, "dos")
+    
+    reply = asyncio.run(webhook_reply.capture_reply(two_messages()))
+    assert reply is None
+    assert inner.sent == ['sendMessage', 'sendMessage']
+    print("✅ Second call flushes the first in order")
+    
+    async def answer_and_edit():
+        await bot.answer_callback_query("42")
+        await bot.edit_message_text("nuevo", chat_id=7, message_id=1)
+    
+    inner.sent.clear()
+    reply = asyncio.run(webhook_reply.capture_reply(answer_and_edit()))
+    assert reply == {"method": "answerCallbackQuery", "callback_query_id": "42"}
+    assert inner.sent == ['editMessageText']
+    print("✅ Callback answer returned while the edit is sent directly")
+    
+    print("✅ All webhook reply tests passed!\n")
+
+def test_update_processor():
+    """Test that updates run concurrently across users and in order per user."""
+    print("🧪 Testing Update Processor...")
+    
+    processor = PerUserUpdateProcessor(4)
+    processed = []
+    running = [0, 0]  # current, peak
+    
+    async def handle(user_id, n):
+        running[0] += 1
+        running[1] = max(running)
+        # Later updates finish faster, so only the processor keeps them in order
+        await asyncio.sleep(0.001 * (5 - n))
+        processed.append((user_id, n))
+        running[0] -= 1
+    
+    async def run():
+        updates = [(user_id, n) for n in range(5) for user_id in range(3)]
+        await asyncio.gather(*(
+            processor.process_update(SimpleNamespace(effective_user=SimpleNamespace(id=user_id)), handle(user_id, n))
+            for user_id, n in updates
+        ))
+    
+    asyncio.run(run())
+    for user_id in range(3):
+        assert [n for uid, n in processed if uid == user_id] == list(range(5))
+    assert running[1] == 3
+    print("✅ Per-user order kept with 3 users in parallel")
+    
+    print("✅ All update processor tests passed!\n")
+
+def test_asgi():
+    """Test the ASGI entry point's per-user ordering and load shedding."""
+    print("🧪 Testing ASGI Entry Point...")
+    
+    processed = []
+    
+    async def process_update(update):
+        # Later updates finish faster, so only the per-user lock keeps them in order
+        await asyncio.sleep(0.001 * (3 - update.update_id % 3))
+        processed.append((update.effective_user.id, update.update_id))
+    
+    def request(update_id, user_id):
+        return json.dumps({"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U"}, "text": "hola"}}).encode()
+    
+    async def post(body):
+        sent = []
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        async def send(message):
+            sent.append(message)
+        await asgi.app({"type": "http", "method": "POST", "path": "/"}, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"])
+    
+    asgi.application = SimpleNamespace(bot=None, process_update=process_update)
+    try:
+        async def run():
+            return await asyncio.gather(*(post(request(n, n % 2)) for n in range(6)))
+        statuses = asyncio.run(run())
+        assert [status for status, _ in statuses] == [200] * 6
+        for user_id in range(2):
+            assert [n for uid, n in processed if uid == user_id] == list(range(user_id, 6, 2))
+        assert len(asgi._user_locks) == 0
+        print("✅ Updates processed concurrently, in order per user")
+        
+        asgi._in_flight = asgi.ASGI_MAX_IN_FLIGHT
+        status, headers = asyncio.run(post(request(6, 0)))
+        assert status == 503 and headers[b'retry-after'] == b'1'
+        print("✅ Saturated process answers 503 with Retry-After")
+        
+        # A client that disconnects mid-upload gets no response; an oversized body gets 413
+        asgi._in_flight = 0
+        async def upload(messages):
+            sent = []
+            async def receive():
+                return messages.pop(0)
+            async def send(message):
+                sent.append(message)
+            await asgi.app({"type": "http", "method": "POST", "path": "/"}, receive, send)
+            return [message.get("status") for message in sent if message["type"] == "http.response.start"]
+        part = {"type": "http.request", "body": b'{"update_id": 1', "more_body": True}
+        assert asyncio.run(upload([part, {"type": "http.disconnect"}])) == []
+        huge = {"type": "http.request", "body": b' ' * (asgi.MAX_BODY_SIZE + 1), "more_body": False}
+        assert asyncio.run(upload([huge])) == [413]
+        assert asgi._in_flight == 0
+        print("✅ Disconnects are not answered as oversized bodies")
+    finally:
+        asgi.application = None
+        asgi._in_flight = 0
+    
+    print("✅ All ASGI tests passed!\n")
+
+def test_asgi_bot_api_concurrency():
+    """Test that concurrent ASGI updates don't queue for Bot API connections."""
+    print("🧪 Testing ASGI Bot API Concurrency...")
+    from api import webhook
+    
+    api = FakeBotAPI(latency=0.3)
+    server = serve(api, port=0)
+    base_url = webhook.TELEGRAM_API_BASE_URL
+    webhook.TELEGRAM_API_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/bot"
+    
+    async def post(user_id):
+        body = json.dumps({"update_id": user_id, "message": {
+            "message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U"}, "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}).encode()
+        sent = []
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        async def send(message):
+            sent.append(message)
+        await asgi.app({"type": "http", "method": "POST", "path": "/"}, receive, send)
+        return sent[0]["status"]
+    
+    async def run():
+        app = asgi.create_application('1:test')
+        await app.initialize()
+        asgi.application = app
+        try:
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(post(user_id) for user_id in range(1, 21)))
+            return statuses, time.perf_counter() - start
+        finally:
+            await app.shutdown()
+    
+    try:
+        statuses, elapsed = asyncio.run(run())
+        assert statuses == [200] * 20
+        assert all(api.calls(user_id) == 1 for user_id in range(1, 21))
+        # 20 calls of 0.3 s each: ~6 s if they shared one connection
+        assert elapsed < 2, f"20 updates took {elapsed:.2f} s"
+        print(f"✅ 20 updates against a 300 ms Bot API in {elapsed:.2f} s")
+    finally:
+        asgi.application = None
+        webhook.TELEGRAM_API_BASE_URL = base_url
+        server.shutdown()
+    
+    print("✅ All ASGI concurrency tests passed!\n")
+
+def test_flood_control():
+    """Test the per-user token bucket limiter."""
+    print("🧪 Testing Flood Control...")
+    
+    limiter = TokenBucketLimiter(rate=1, burst=3, max_keys=100)
+    assert [limiter.allow(1, now=0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.should_warn(1)
+    assert not limiter.should_warn(1)  # only one warning per limited stretch
+    assert limiter.wait_time(1, now=0.5) == 0.5
+    assert limiter.allow(1, now=1.0)
+    assert not limiter.allow(1, now=1.5)
+    assert limiter.allow(2, now=1.5)  # other users are not affected
+    print("✅ Buckets refill lazily and are per user")
+    
+    for user_id in range(1000):
+        limiter.allow(user_id, now=2.0)
+    assert len(limiter) == 100
+    print("✅ Bucket table stays bounded")
+    
+    # Limited presses are still answered: dropped ones by the guard, coalesced toggles by the handler
+    import bot_handlers
+    import flood_control
+    from session_store import MemorySessionStore
+    store, enabled = bot_handlers.session_store, flood_control.FLOOD_CONTROL
+    bot_handlers.session_store = MemorySessionStore()
+    flood_control.FLOOD_CONTROL = True
+    answers, edits = [], []
+    
+    async def answer(text=None, **kwargs):
+        answers.append(text)
+    
+    async def edit_message_text(text, **kwargs):
+        edits.append(text)
+    
+    def press(data):
+        query = SimpleNamespace(data=data, answer=answer, edit_message_text=edit_message_text)
+        return SimpleNamespace(callback_query=query, message=None, effective_user=SimpleNamespace(id=777))
+    
+    async def flood():
+        outcomes = []
+        for data in ['toggle_present'] * flood_control.FLOOD_CALLBACK_BURST + ['toggle_past', 'start_practice', 'start_practice']:
+            update, context = press(data), SimpleNamespace()
+            try:
+                await flood_control.flood_guard(update, context)
+            except ApplicationHandlerStop:
+                outcomes.append('dropped')
+                continue
+            await bot_handlers.handle_tense_group_selection(update, context)
+            outcomes.append('coalesced' if flood_control.is_coalesced(context) else 'handled')
+        await asyncio.sleep(flood_control.CALLBACK_LIMITER.wait_time(777) + 0.1)
+        return outcomes
+    
+    try:
+        outcomes = asyncio.run(flood())
+    finally:
+        bot_handlers.session_store, flood_control.FLOOD_CONTROL = store, enabled
+    assert outcomes[-3:] == ['coalesced', 'dropped', 'dropped']
+    assert len(answers) == len(outcomes)
+    assert answers[-2:] == [flood_control.SLOW_DOWN_CALLBACK, None]
+    assert len(edits) == flood_control.FLOOD_CALLBACK_BURST + 1
+    print("✅ Coalesced and dropped presses are answered")
+    
+    # Webhook entry points answer only once the deferred refresh has run (the instance may stop after)
+    from api import webhook
+    refreshed = []
+    
+    async def refresh(update_id):
+        refreshed.append(update_id)
+    
+    async def process_coalesced(update):
+        flood_control.defer_refresh(update.effective_user.id, lambda: refresh(update.update_id))
+    
+    def body(update_id):
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "chat": {"id": 778, "type": "private"},
+            "from": {"id": 778, "is_bot": False, "first_name": "U"}, "text": "hola"}}
+    
+    fake = SimpleNamespace(bot=None, process_update=process_coalesced)
+    asgi.application = webhook.application = fake
+    try:
+        while flood_control.CALLBACK_LIMITER.allow(778):
+            pass
+        asyncio.run(asgi.process_update(body(1)))
+        assert refreshed == [1]
+        while flood_control.CALLBACK_LIMITER.allow(778):
+            pass
+        webhook.handler.process_update_sync(None, body(2))
+        assert refreshed == [1, 2]
+    finally:
+        asgi.application = webhook.application = None
+    print("✅ Deferred refresh runs before the webhook is answered")
+    
+    print("✅ All flood control tests passed!\n")
+
+def test_fake_bot_api():
+    """Test the fake Bot API server used for load tests."""
+    print("🧪 Testing Fake Bot API...")
+    from telegram import Bot
+    from telegram.error import RetryAfter
+    
+    api = FakeBotAPI(seed=1)
+    server = serve(api, port=0)
+    bot = Bot('1:test', base_url=f"http://127.0.0.1:{server.server_address[1]}/bot")
+    
+    async def run():
+        async with bot:
+            first = await bot.send_message(7, "hola")
+            second = await bot.send_message(7, "adiós")
+            await bot.edit_message_text("nuevo", chat_id=7, message_id=first.message_id)
+            return first.message_id, second.message_id
+    
+    try:
+        assert asyncio.run(run()) == (1, 2)
+        call = api.wait_for_call(7, 2, ('editMessageText',), timeout=1)
+        assert call[0] == 2 and call[2]['text'] == "nuevo"
+        print("✅ Calls answered and recorded per chat")
+        
+        api.error_rate = 1.0
+        try:
+            asyncio.run(run())
+            assert False, "expected a 429"
+        except RetryAfter as e:
+            assert e.retry_after == 1
+        assert api.rate_limited == 1
+        print("✅ Injected 429 surfaces as RetryAfter")
+    finally:
+        server.shutdown()
+    
+    print("✅ All fake Bot API tests passed!\n")
+
+def test_profiling():
+    """Test that sampled profiles only cover the profiled update's own code."""
+    print("🧪 Testing Profiling...")
+    
+    profiler = Profiler(sample_rate=2)
+    
+    def profiled_work():
+        return sum(range(100))
+    
+    def other_work():
+        return sum(range(100))
+    
+    async def update():
+        for _ in range(3):
+            profiled_work()
+            await asyncio.sleep(0)
+        return "done"
+    
+    async def other_task():
+        for _ in range(3):
+            other_work()
+            await asyncio.sleep(0)
+    
+    async def run():
+        results = []
+        for _ in range(4):
+            coroutine = update()
+            if profiler.should_sample():
+                coroutine = profiler.run(coroutine)
+            results.append((await asyncio.gather(coroutine, other_task()))[0])
+        return results
+    
+    assert asyncio.run(run()) == ["done"] * 4
+    assert (profiler.updates, profiler.profiled) == (4, 2)
+    report = profiler.report(limit=50)
+    assert "2 of 4 updates profiled" in report
+    assert "profiled_work" in report and "other_work" not in report
+    assert profiler.pstats_data()
+    print("✅ 1 in 2 updates profiled, other tasks left out")
+    
+    print("✅ All profiling tests passed!\n")
+
+def test_webhook_sharding():
+    """Test that a user's updates are always routed to the same worker."""
+    print("🧪 Testing Webhook Sharding...")
+    
+    message = {"update_id": 1, "message": {"message_id": 1, "date": 0, "text": "hola",
+                                           "chat": {"id": 42, "type": "private"}, "from": {"id": 42}}}
+    callback = {"update_id": 2, "callback_query": {"id": "1", "data": "start_practice", "from": {"id": 42},
+                                                   "message": {"chat": {"id": 42}}}}
+    inline = {"update_id": 3, "inline_query": {"id": "1", "query": "habl", "from": {"id": 42}}}
+    assert shard_key(message) == shard_key(callback) == shard_key(inline) == 42
+    assert shard_key({"update_id": 4}) is None
+    print("✅ Messages, callbacks and inline queries share the user's key")
+    
+    # The proxy finds the same key in the raw body without parsing it
+    reply = {"update_id": 5, "message": {"message_id": 2, "from": {"id": 7, "first_name": "\"from\":{\"id\":9"},
+                                         "chat": {"id": 7, "type": "private"}, "date": 0, "text": "hablo",
+                                         "reply_to_message": {"message_id": 1, "from": {"id": 99}}}}
+    channel = {"update_id": 6, "channel_post": {"message_id": 1, "sender_chat": {"id": -5},
+                                                "chat": {"id": -100, "type": "channel"}}}
+    for update in (message, callback, inline, reply, channel, {"update_id": 4}):
+        for separators in ((',', ':'), (', ', ': ')):
+            body = json.dumps(update, separators=separators).encode('utf-8')
+            assert shard_key_from_body(body) == shard_key(update), update
+    assert shard_key_from_body(b'not json') is None
+    print("✅ Routing key found by scanning the raw body")
+    
+    workers = [shard_for(user_id, 4) for user_id in range(1000)]
+    assert all(workers.count(worker) > 200 for worker in range(4))
+    assert shard_for(42, 4) == shard_for(42, 4) and shard_for(None, 4) == 0
+    print("✅ Users spread evenly over workers")
+    
+    # Whatever the worker count, each worker owns as many shards and a user goes to the owner of theirs
+    assert [answer_log_shards(workers) for workers in (1, 2, 4, 6, 12, 16, 20)] == [16, 16, 16, 18, 24, 16, 20]
+    for workers in (1, 3, 4, 6, 12, 20):
+        shard_count = answer_log_shards(workers)
+        owned = [worker_shards(index, workers) for index in range(workers)]
+        assert sorted(sum(owned, [])) == list(range(shard_count))
+        assert len({len(shards) for shards in owned}) == 1
+        for user_id in range(100):
+            assert user_shard(user_id, shard_count) in worker_shards(shard_for(user_id, workers), workers)
+        users = [shard_for(user_id, workers) for user_id in range(20000)]
+        assert max(map(users.count, range(workers))) < 1.25 * 20000 / workers
+    print("✅ Answer log shards follow their users and spread evenly across worker counts")
+    
+    assert webhook_max_connections(1) == 8 and webhook_max_connections(64) == 100
+    print("✅ max_connections follows the worker count")
+    
+    # The proxy reuses its connections to a worker, and replaces one the worker closed
+    from http.server import ThreadingHTTPServer
+    import http.client
+    import socket
+    import threading
+    connections = []
+    
+    class Worker(worker_handler_class()):
+        def setup(self):
+            super().setup()
+            connections.append(self.connection)
+        
+        def process_update_sync(self, body):
+            return {"method": "sendMessage", "chat_id": body["message"]["chat"]["id"], "text": "ok"}
+    
+    class Pool(list):
+        ports = property(lambda self: [server.server_address[1] for server in self])
+    
+    pool = Pool([ThreadingHTTPServer(('127.0.0.1', 0), Worker)])
+    proxy = ThreadingHTTPServer(('127.0.0.1', 0), make_proxy_handler(pool))
+    servers = [*pool, proxy]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = http.client.HTTPConnection('127.0.0.1', proxy.server_address[1], timeout=10)
+        def post():
+            client.request('POST', '/', json.dumps(message), {'Content-Type': 'application/json'})
+            response = client.getresponse()
+            return response.status, json.loads(response.read())
+        for _ in range(5):
+            assert post() == (200, {"method": "sendMessage", "chat_id": 42, "text": "ok"})
+        assert len(connections) == 1
+        # Like a restarted worker: the idle connection is closed from the worker's side
+        connections[0].shutdown(socket.SHUT_RDWR)
+        assert post()[0] == 200 and len(connections) == 2
+        client.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    print("✅ Proxy keeps its connections to the workers alive")
+    
+    print("✅ All webhook sharding tests passed!\n")
+
 def test_config():
     """Test configuration."""
     print("🧪 Testing Configuration...")
@@ -114,6 +1287,29 @@ if __name__ == "__main__":
         test_config()
         test_verb_data()
         test_verb_engine()
+        test_verb_db()
+        test_conjugation_table()
+        test_batch_challenges()
+        test_conjugator()
+        test_diagnostics()
+        test_inline_lookup()
+        test_challenge_token()
+        test_reply_answers()
+        test_combined_reply()
+        test_spaced_repetition()
+        test_session_store()
+        test_answer_log()
+        test_analytics()
+        test_metrics()
+        test_rendering()
+        test_webhook_reply()
+        test_update_processor()
+        test_asgi()
+        test_asgi_bot_api_concurrency()
+        test_flood_control()
+        test_fake_bot_api()
+        test_profiling()
+        test_webhook_sharding()
         demo_bot_interaction()
         
         print("\n🎉 All tests passed! The bot is ready to use.")
@@ -0,0 +1,109 @@
+"""
+Concurrent update processing with per-user ordering.
+
+Updates from different users are processed in parallel (up to a limit),
+while updates from the same user run one after another in arrival order,
+so handlers never race on one user's session or current challenge.
+"""
+
+import asyncio
+import contextlib
+from collections import deque
+from telegram.ext import BaseUpdateProcessor
+import metrics
+
+UPDATES_IN_FLIGHT = metrics.gauge('bot_updates_in_flight', 'Users whose updates are being processed right now')
+UPDATES_QUEUED = metrics.counter('bot_updates_queued_total', 'Updates that waited for an earlier update from the same user')
+
+
+def update_key(update):
+    """Serialization key of an update: the user, else the chat, else None (no ordering needed)."""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Update processor that runs different users concurrently and each user's updates in order.
+
+    Each user with work in progress has a queue. The first update of a user
+    runs immediately and then drains that user's queue; updates arriving
+    meanwhile are appended to it and return at once, so waiting updates don't
+    hold one of the max_concurrent_updates slots.
+    """
+
+    __slots__ = ('_queues',)
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # user key -> deque of coroutines waiting behind the one being processed
+        self._queues = {}
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # Another update of this user is running; it will process this one next
+            queue.append(coroutine)
+            UPDATES_QUEUED.inc()
+            return
+
+        queue = self._queues[key] = deque()
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            await coroutine
+            while queue:
+                await queue.popleft()
+        finally:
+            del self._queues[key]
+            UPDATES_IN_FLIGHT.dec()
+            # Only reached with work left on cancellation (shutdown)
+            while queue:
+                queue.popleft().close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class KeyedLocks:
+    """Per-key asyncio locks, dropped again once nobody holds or waits for them.
+
+    For callers that must process an update in their own task (e.g. one
+    HTTP request per update), where PerUserUpdateProcessor's hand-off of
+    queued updates doesn't fit. Waiters get the lock in arrival order.
+    """
+
+    def __init__(self):
+        # key -> [lock, holders and waiters]
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        if key is None:
+            yield
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Compiled verb database.
+
+The JSON verb data is compiled into one binary file that VerbEngine opens
+with mmap: loading is near-instant, the table pages are shared by every
+process on the machine, and the strings are only decoded when used.
+
+Layout (little-endian, every table is uint32):
+
+    header      magic, version, verb/tense/person/string counts, CRC32 of the rest,
+                stamp of the source files (names and sizes of the JSON data and rules)
+    tenses      string id of each tense key, in table order
+    verbs       string id of each infinitive
+    translations string id of each translation
+    forms       string id of each (verb, tense, person) cell
+    offsets     string_count + 1 byte offsets into the pool
+    pool        UTF-8 strings, deduplicated
+
+Usage:
+    python verb_db.py                     # compile verb_translations.json + verb_irregulars.json
+    python verb_db.py --output verbs.vmdb
+    python verb_db.py --check             # fail if verbs.vmdb doesn't match what would be compiled
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Sequence
+
+MAGIC = b'VMDB'
+VERSION = 3
+
+# magic, version, reserved, verb_count, tense_count, person_count, string_count, checksum, source stamp
+HEADER = struct.Struct('<4sHHIIIII8s')
+
+NO_SOURCE = bytes(8)
+
+
+class VerbDBError(Exception):
+    """The file is missing, corrupt, or not a verb database this code can read."""
+
+
+class StringColumn(Sequence):
+    """Read-only sequence of strings from the pool, decoded on access."""
+
+    def __init__(self, db, ids):
+        self._db = db
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._db.string(string_id) for string_id in self._ids[index]]
+        return self._db.string(self._ids[index])
+
+
+def source_stamp(paths):
+    """Cheap stamp of the files a database is compiled from (names and sizes, one stat each),
+    or None if one of them is missing. Same-size edits are caught by verb_db.py --check."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if not path:
+            continue
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return None
+        digest.update(os.path.basename(path).encode('utf-8') + b'\0' + str(size).encode('ascii') + b'\0')
+    return digest.digest()[:8]
+
+
+def write_db(path, tenses, person_count, verbs, translations, forms, sources=NO_SOURCE):
+    """Compile verb tables into a database file.
+
+    forms holds len(verbs) * len(tenses) * person_count strings in
+    (verb, tense, person) order; sources is the source_stamp() of the
+    files they came from.
+    """
+    if len(forms) != len(verbs) * len(tenses) * person_count:
+        raise ValueError(f"Expected {len(verbs) * len(tenses) * person_count} forms, got {len(forms)}")
+
+    string_ids = {}
+    pool = bytearray()
+    offsets = array('I', [0])
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(offsets) - 1
+            pool.extend(text.encode('utf-8'))
+            offsets.append(len(pool))
+        return string_id
+
+    tables = [array('I', (intern(text) for text in column)) for column in (tenses, verbs, translations, forms)]
+    tables.append(offsets)
+    if sys.byteorder != 'little':
+        for table in tables:
+            table.byteswap()
+
+    body = b''.join(table.tobytes() for table in tables) + bytes(pool)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(verbs), len(tenses), person_count,
+                         len(string_ids), zlib.crc32(body), sources)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+
+
+class VerbDB:
+    """A compiled verb database opened with mmap.
+
+    verify checks the CRC32 of the whole file, which reads every page; the
+    bot skips it when opening (the table bounds are still checked) and
+    verb_db.py checks it after compiling.
+    """
+
+    def __init__(self, path, verify=True):
+        if sys.byteorder != 'little':
+            raise VerbDBError("Compiled verb databases are only read on little-endian machines")
+        try:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise VerbDBError(f"Cannot open {path}: {e}") from e
+
+        if len(self._mmap) < HEADER.size:
+            raise VerbDBError(f"{path} is too short to be a verb database")
+        magic, version, _, verb_count, tense_count, person_count, string_count, checksum, sources = \
+            HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise VerbDBError(f"{path} is not a verb database")
+        if version != VERSION:
+            raise VerbDBError(f"{path} has format version {version}, expected {VERSION}")
+
+        data = memoryview(self._mmap)
+        body = data[HEADER.size:]
+        if verify and zlib.crc32(body) != checksum:
+            raise VerbDBError(f"{path} is corrupt (checksum mismatch)")
+
+        cell_count = verb_count * tense_count * person_count
+        table_sizes = (tense_count, verb_count, verb_count, cell_count, string_count + 1)
+        if len(body) < 4 * sum(table_sizes):
+            raise VerbDBError(f"{path} is truncated")
+        tables = []
+        position = 0
+        for size in table_sizes:
+            tables.append(body[position:position + 4 * size].cast('I'))
+            position += 4 * size
+        tense_ids, verb_ids, translation_ids, form_ids, self._offsets = tables
+        self._pool = body[position:]
+        if self._offsets[-1] > len(self._pool):
+            raise VerbDBError(f"{path} is truncated")
+
+        self.person_count = person_count
+        self.sources = sources
+        self.tenses = tuple(self.string(string_id) for string_id in tense_ids)
+        self.verbs = StringColumn(self, verb_ids)
+        self.translations = StringColumn(self, translation_ids)
+        self.forms = StringColumn(self, form_ids)
+
+    def string(self, string_id):
+        """Decode one string from the pool."""
+        return str(self._pool[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+
+def check_db(path, engine):
+    """List the differences between a database and the tables of a JSON-loaded engine (empty if none)."""
+    try:
+        db = VerbDB(path)
+    except VerbDBError as e:
+        return [str(e)]
+    problems = []
+    for name, column, expected in (('verbs', db.verbs, engine.verb_list),
+                                   ('translations', db.translations, engine.translation_list),
+                                   ('forms', db.forms, engine.forms)):
+        if list(column) != list(expected):
+            problems.append(f"{path} has other {name} than the JSON data")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the verb JSON data into a memory-mappable database")
+    parser.add_argument("--verbs", default="", help="Full conjugation tables JSON (e.g. verbs_data.json)")
+    parser.add_argument("--translations", default="verb_translations.json", help="Verb translations JSON")
+    parser.add_argument("--irregulars", default="verb_irregulars.json", help="Irregular overrides JSON")
+    parser.add_argument("--output", default="verbs.vmdb", help="Database file to write")
+    parser.add_argument("--check", action="store_true", help="Only check that the database is up to date")
+    args = parser.parse_args()
+
+    # Compile what the JSON loader and the conjugation rules produce
+    from verb_engine import VerbEngine, TENSE_LIST, PERSON_COUNT, data_sources
+    engine = VerbEngine(args.verbs, args.translations, args.irregulars, db_file=None)
+    if args.check:
+        problems = check_db(args.output, engine)
+        for problem in problems:
+            print(f"❌ {problem}; rebuild it with: python verb_db.py")
+        if problems:
+            sys.exit(1)
+        print(f"✅ {args.output} is up to date")
+        return
+
+    write_db(args.output, TENSE_LIST, PERSON_COUNT, engine.verb_list, engine.translation_list, engine.forms,
+             source_stamp(data_sources(args.verbs, args.translations, args.irregulars)))
+
+    db = VerbDB(args.output)
+    print(f"✅ Compiled {len(db.verbs)} verbs and {len(db.forms)} forms into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
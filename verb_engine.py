@@ -1,156 +1,553 @@
+import functools
+import hashlib
 import json
+import logging
+import operator
+import os
 import random
+import sys
+from array import array
 import unicodedata
+from collections.abc import Sequence
 from config import PERSONS, TENSES, PERSONS_RUSSIAN, TENSES_RUSSIAN, TENSE_GROUPS
+import conjugator
+from conjugator import Conjugator, split_infinitive
+from form_index import FormIndex, PrefixIndex
+from verb_db import VerbDB, VerbDBError, source_stamp
+
+logger = logging.getLogger(__name__)
+
+# Fixed tense order used for the index-based conjugation table
+TENSE_LIST = tuple(TENSES.keys())
+TENSE_INDEX = {tense: index for index, tense in enumerate(TENSE_LIST)}
+PERSON_COUNT = len(PERSONS)
+
+# Subject pronouns a learner may type in front of the form ("yo hablo"), already folded
+PERSON_PRONOUNS = {
+    0: ("yo",),
+    1: ("tu",),
+    2: ("el", "ella", "usted"),
+    3: ("nosotros", "nosotras"),
+    4: ("vosotros", "vosotras"),
+    5: ("ellos", "ellas", "ustedes"),
+}
+
+_ALL_PRONOUNS = frozenset(pronoun for pronouns in PERSON_PRONOUNS.values() for pronoun in pronouns)
+
+
+def _build_fold_table():
+    """Build a str.translate table that strips accents from Latin letters."""
+    table = {}
+    for code_point in range(0xC0, 0x250):
+        char = chr(code_point)
+        base = ''.join(c for c in unicodedata.normalize('NFD', char) if unicodedata.category(c) != 'Mn')
+        if base != char:
+            table[code_point] = base
+    # Drop stray combining marks (input typed in decomposed form)
+    for code_point in range(0x300, 0x370):
+        table[code_point] = None
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold_text(text):
+    """Fold text for answer comparison: lowercase, no accents, single spaces."""
+    return ' '.join(text.lower().translate(_FOLD_TABLE).split())
+
+
+# Folded forms of recent correct answers (bounded, so a large catalogue isn't copied to the heap)
+_fold_form = functools.lru_cache(maxsize=4096)(fold_text)
+
+
+class Challenge:
+    """A single conjugation challenge, stored as table indices plus interned strings."""
+
+    __slots__ = (
+        'verb_idx',
+        'tense_idx',
+        'person_index',
+        'verb',
+        'correct_answer',
+        'verb_translation',
+        'tense_group',
+        'selected_groups',
+        'srs_box',
+    )
+
+    def __init__(self, verb_idx, tense_idx, person_index, verb, correct_answer,
+                 verb_translation, tense_group=None, selected_groups=None, srs_box=None):
+        self.verb_idx = verb_idx
+        self.tense_idx = tense_idx
+        self.person_index = person_index
+        self.verb = verb
+        self.correct_answer = correct_answer
+        self.verb_translation = verb_translation
+        self.tense_group = tense_group
+        self.selected_groups = selected_groups
+        # Leitner box when the challenge comes from spaced repetition
+        self.srs_box = srs_box
+
+    @property
+    def tense(self):
+        return TENSE_LIST[self.tense_idx]
+
+    @property
+    def tense_display(self):
+        return TENSES[TENSE_LIST[self.tense_idx]]
+
+    @property
+    def tense_display_ru(self):
+        return TENSES_RUSSIAN[TENSE_LIST[self.tense_idx]]
+
+    @property
+    def person(self):
+        return PERSONS[self.person_index]
+
+    @property
+    def person_ru(self):
+        return PERSONS_RUSSIAN[self.person_index]
+
+    def to_state(self):
+        """Serialize the challenge to a JSON-friendly list."""
+        return [self.verb, self.tense, self.person_index, self.tense_group, self.selected_groups, self.srs_box]
+
+    def __getitem__(self, key):
+        """Allow dict-style access (challenge['verb']) for older callers."""
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        """Dict-style get() for older callers."""
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return (f"Challenge(verb={self.verb!r}, tense={self.tense!r}, "
+                f"person_index={self.person_index}, correct_answer={self.correct_answer!r})")
+
+
+class Diagnosis:
+    """Why a wrong answer is wrong: the kind of mistake and the table cell the answer matches."""
+
+    __slots__ = ('kind', 'cell', 'distance')
+
+    # Kinds of mistakes, from the challenge's point of view
+    TYPO = 'typo'                  # the right form, misspelled
+    WRONG_PERSON = 'wrong_person'  # right verb and tense, another person
+    WRONG_TENSE = 'wrong_tense'    # right verb and person, another tense
+    WRONG_FORM = 'wrong_form'      # right verb, another tense and person
+    OTHER_VERB = 'other_verb'      # a form of a different verb
+
+    def __init__(self, kind, cell, distance=0):
+        self.kind = kind
+        self.cell = cell
+        # Edit distance between the answer and the matched form
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Diagnosis(kind={self.kind!r}, cell={self.cell}, distance={self.distance})"
+
+
+def data_sources(verbs_file, translations_file, irregulars_file):
+    """Files the verb tables are built from: the JSON data and the conjugation rules."""
+    return (verbs_file, translations_file, irregulars_file, conjugator.__file__)
+
+
+class GeneratedForms(Sequence):
+    """Flat (verb, tense, person) table whose forms are conjugated on access.
+
+    Verbs with a full table use it; the rest go through the conjugator,
+    whose bounded memo cache keeps recently used (verb, tense) forms.
+    """
+
+    def __init__(self, verbs, tables, conjugator):
+        self._verbs = verbs
+        self._tables = tables
+        self._conjugator = conjugator
+        self._cells_per_verb = len(TENSE_LIST) * PERSON_COUNT
+
+    def __len__(self):
+        return len(self._verbs) * self._cells_per_verb
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[cell] for cell in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("form index out of range")
+        verb_idx, rest = divmod(index, self._cells_per_verb)
+        tense_idx, person_index = divmod(rest, PERSON_COUNT)
+        verb = self._verbs[verb_idx]
+        table = self._tables.get(verb)
+        if table is not None:
+            return table[TENSE_LIST[tense_idx]][person_index]
+        return self._conjugator.conjugate(verb, TENSE_LIST[tense_idx])[person_index]
+
 
 class VerbEngine:
-    def __init__(self, verbs_file='verbs_data.json', translations_file='verb_translations.json'):
-        """Initialize the verb engine with verb data and translations."""
-        with open(verbs_file, 'r', encoding='utf-8') as f:
-            self.verbs_data = json.load(f)
+    def __init__(self, verbs_file=None, translations_file='verb_translations.json',
+                 irregulars_file='verb_irregulars.json', db_file=None):
+        """Initialize the verb engine with verb translations and conjugation rules.
+
+        The verbs are those of the translations file, conjugated by the rules
+        plus irregular overrides (see conjugator.py) when first used. verbs_file
+        optionally gives full tables in the verbs_data.json format for verbs
+        the rules don't cover.
+
+        With db_file, the compiled database (see verb_db.py) is memory-mapped
+        instead; the JSON files are the fallback if it is missing, unreadable
+        or was compiled from source files of other sizes.
+        """
+        self.irregulars_file = irregulars_file
+        self._conjugator = None
+        # Tense index pools per combination of tense groups, filled on first use
+        self._tense_pools = {}
+        # Cell positions within a verb per tense pool, filled on first use
+        self._pool_offsets = {}
+
+        if db_file and os.path.exists(db_file):
+            try:
+                # Opening touches only the header; the full checks are done by verb_db.py --check
+                db = VerbDB(db_file, verify=False)
+                sources = source_stamp(data_sources(verbs_file, translations_file, irregulars_file))
+                # Without the JSON files there is nothing newer to fall back to
+                if sources is not None and db.sources != sources:
+                    raise VerbDBError(f"{db_file} is stale; rebuild it with verb_db.py")
+                self._open_db(db)
+                return
+            except VerbDBError as e:
+                logger.warning(f"Falling back to JSON verb data: {e}")
+
+        verbs_data = {}
+        if verbs_file:
+            with open(verbs_file, 'r', encoding='utf-8') as f:
+                verbs_data = json.load(f)
         with open(translations_file, 'r', encoding='utf-8') as f:
-            self.verb_translations = json.load(f)
-        self.verb_list = list(self.verbs_data.keys())
-    
+            translations = json.load(f)
+        self._compile(verbs_data, translations)
+
+    @property
+    def conjugator(self):
+        """Rule-based generator for verbs without a full conjugation table (loaded on first use)."""
+        if self._conjugator is None:
+            self._conjugator = Conjugator(self.irregulars_file)
+        return self._conjugator
+
+    def _open_db(self, db):
+        """Use the tables of a compiled database directly (strings are decoded on access)."""
+        if db.tenses != TENSE_LIST or db.person_count != PERSON_COUNT:
+            raise VerbDBError("compiled for a different tense/person layout; rebuild it with verb_db.py")
+        self.db = db
+        self.verb_list = db.verbs
+        self.translation_list = db.translations
+        self.forms = db.forms
+
+    def _compile(self, verbs_data, translations):
+        """Set up the flat (verb, tense, person) table: full tables first, then the translated verbs."""
+        self.db = None
+        for verb, conjugations in verbs_data.items():
+            for tense in TENSE_LIST:
+                if len(conjugations[tense]) != PERSON_COUNT:
+                    raise ValueError(f"Expected {PERSON_COUNT} forms for {verb} in {tense}, "
+                                     f"got {len(conjugations[tense])}")
+        verbs = list(verbs_data)
+        # Verbs that only have a translation are conjugated by rules; one bad entry only drops that verb
+        for verb in translations:
+            if verb not in verbs_data:
+                try:
+                    split_infinitive(verb)
+                except ValueError as e:
+                    logger.error(f"Skipping {verb!r} from the translations: {e}")
+                    continue
+                verbs.append(verb)
+        self.verb_list = [sys.intern(verb) for verb in verbs]
+        self.translation_list = [sys.intern(translations.get(verb, verb)) for verb in self.verb_list]
+        self.forms = GeneratedForms(self.verb_list, verbs_data, self.conjugator)
+
+    # Derived indexes are built on first use, so opening the engine stays cheap
+
+    @functools.cached_property
+    def verb_index(self):
+        """Infinitive -> verb index."""
+        return {verb: index for index, verb in enumerate(self.verb_list)}
+
+    @functools.cached_property
+    def verb_translations(self):
+        """Infinitive -> Russian translation."""
+        return dict(zip(self.verb_list, self.translation_list))
+
+    @functools.cached_property
+    def form_index(self):
+        """Reverse form index used to diagnose wrong answers."""
+        return FormIndex([fold_text(form) for form in self.forms])
+
+    @functools.cached_property
+    def verb_prefix_index(self):
+        """Prefix index over infinitives and the words of their translations, for lookup()."""
+        verb_keys = []
+        for verb_idx, (verb, translation) in enumerate(zip(self.verb_list, self.translation_list)):
+            verb_keys.append((fold_text(verb), verb_idx))
+            # Every word of the Russian translation ("помнить, вспоминать")
+            for word in translation.replace(',', ' ').split():
+                verb_keys.append((fold_text(word), verb_idx))
+        return PrefixIndex(verb_keys)
+
+    @functools.cached_property
+    def form_prefix_index(self):
+        """Prefix index over the distinct folded forms, for lookup()."""
+        form_keys = []
+        for key in self.form_index.cells_by_key:
+            form_keys.append((key, key))
+            # Compound forms are also found by the participle ("hablado" -> "he hablado")
+            for word in key.split()[1:]:
+                form_keys.append((word, key))
+        return PrefixIndex(form_keys)
+
+    @functools.cached_property
+    def catalogue_id(self):
+        """Short fingerprint of the verb order; changes whenever verb indices may mean other verbs."""
+        digest = hashlib.sha256()
+        for verb in self.verb_list:
+            digest.update(verb.encode('utf-8') + b'\n')
+        return digest.digest()[:8]
+
+    def build_indexes(self):
+        """Build all derived indexes now instead of on first use (for long-running processes)."""
+        for name in ('verb_index', 'verb_translations', 'form_index',
+                     'verb_prefix_index', 'form_prefix_index', 'catalogue_id'):
+            getattr(self, name)
+
+    def cell_index(self, verb_idx, tense_idx, person_index):
+        """Get the position of a (verb, tense, person) cell in the flat table."""
+        return (verb_idx * len(TENSE_LIST) + tense_idx) * PERSON_COUNT + person_index
+
+    def get_form(self, verb_idx, tense_idx, person_index):
+        """Get a single conjugated form by table indices."""
+        return self.forms[(verb_idx * len(TENSE_LIST) + tense_idx) * PERSON_COUNT + person_index]
+
+    def make_challenge(self, verb_idx, tense_idx, person_index, tense_group=None, selected_groups=None):
+        """Build a Challenge for the given table indices."""
+        return Challenge(
+            verb_idx,
+            tense_idx,
+            person_index,
+            self.verb_list[verb_idx],
+            self.get_form(verb_idx, tense_idx, person_index),
+            self.translation_list[verb_idx],
+            tense_group,
+            selected_groups,
+        )
+
+    def challenge_from_state(self, state):
+        """Rebuild a Challenge from Challenge.to_state() output."""
+        verb, tense, person_index, tense_group, selected_groups = state[:5]
+        challenge = self.make_challenge(self.verb_index[verb], TENSE_INDEX[tense], person_index,
+                                        tense_group=tense_group, selected_groups=selected_groups)
+        if len(state) > 5:
+            challenge.srs_box = state[5]
+        return challenge
+
     def get_random_challenge(self):
         """Generate a random verb conjugation challenge."""
-        # Select random verb
-        verb = random.choice(self.verb_list)
-        
-        # Select random tense
-        tense = random.choice(list(TENSES.keys()))
-        
-        # Select random person (0-5 for yo, tú, él/ella, nosotros, vosotros, ellos/ellas)
-        person_index = random.randint(0, 5)
-        person = PERSONS[person_index]
-        
-        # Get the correct answer
-        correct_answer = self.verbs_data[verb][tense][person_index]
-        
-        return {
-            'verb': verb,
-            'tense': tense,
-            'tense_display': TENSES[tense],
-            'person': person,
-            'person_index': person_index,
-            'correct_answer': correct_answer
-        }
-    
+        # Select random verb, tense and person (0-5 for yo, tú, él/ella, nosotros, vosotros, ellos/ellas)
+        verb_idx = random.randrange(len(self.verb_list))
+        tense_idx = random.randrange(len(TENSE_LIST))
+        person_index = random.randrange(PERSON_COUNT)
+
+        return self.make_challenge(verb_idx, tense_idx, person_index)
+
     def normalize_text(self, text):
         """Normalize text by removing accents and converting to lowercase."""
-        # Remove accents
-        text = unicodedata.normalize('NFD', text)
-        text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-        # Convert to lowercase and strip whitespace
-        return text.lower().strip()
-    
-    def check_answer(self, user_answer, correct_answer):
-        """Check if the user's answer is correct."""
-        # Normalize both answers for comparison
-        normalized_user = self.normalize_text(user_answer)
-        normalized_correct = self.normalize_text(correct_answer)
-        
-        # Check exact match first
-        if user_answer.strip().lower() == correct_answer.lower():
-            return True
-        
-        # Check normalized match (without accents)
-        if normalized_user == normalized_correct:
+        return fold_text(text)
+
+    def check_answer(self, user_answer, correct_answer, person_index=None):
+        """Check if the user's answer is correct.
+
+        A subject pronoun in front of the form is accepted only when person_index
+        (the challenge's person) is given and the pronoun belongs to it.
+        """
+        key = fold_text(user_answer)
+        correct_key = _fold_form(correct_answer)
+        if key == correct_key:
             return True
-        
-        return False
-    
+
+        # A form shared by persons ("hablaba") takes only the pronouns of the person asked for
+        pronoun, _, rest = key.partition(' ')
+        return rest == correct_key and pronoun in PERSON_PRONOUNS.get(person_index, ())
+
+    def lookup(self, query, limit=20):
+        """Find infinitives (also by Russian translation) and conjugated forms starting with query.
+
+        Returns at most limit results, infinitives first: ('verb', verb_idx)
+        or ('form', cells) where cells are all table cells with that form.
+        """
+        key = fold_text(query)
+        if not key:
+            return []
+        results = [('verb', verb_idx) for verb_idx in self.verb_prefix_index.search(key, limit)]
+        if len(results) < limit:
+            for form_key in self.form_prefix_index.search(key, limit - len(results)):
+                results.append(('form', self.form_index.cells(form_key)))
+        return results
+
+    def diagnose(self, challenge, user_answer):
+        """Classify a wrong answer to a challenge.
+
+        Returns a Diagnosis, or None if the answer is not (close to) any known form.
+        """
+        key = fold_text(user_answer)
+        # A leading pronoun doesn't change which form was typed
+        pronoun, _, rest = key.partition(' ')
+        if rest and pronoun in _ALL_PRONOUNS:
+            key = rest
+
+        target = self.cell_index(challenge.verb_idx, challenge.tense_idx, challenge.person_index)
+        cells_per_verb = len(TENSE_LIST) * PERSON_COUNT
+        verb_start = challenge.verb_idx * cells_per_verb
+
+        # Exactly another form of the same verb
+        exact = self.form_index.cells(key)
+        if target in exact:
+            return None
+        same_verb = [cell for cell in exact if verb_start <= cell < verb_start + cells_per_verb and cell != target]
+        if same_verb:
+            cell = min(same_verb, key=lambda cell: self._mistake_rank(cell, target))
+            return Diagnosis(self._mistake_kind(cell, target), cell)
+
+        # One edit away from the right form, or from another form of the same verb
+        near = self.form_index.near(key, range(verb_start, verb_start + cells_per_verb), 1)
+        if near:
+            distance, cell = min(near, key=lambda match: (match[1] != target, match[0],
+                                                          self._mistake_rank(match[1], target)))
+            if cell == target:
+                return Diagnosis(Diagnosis.TYPO, cell, distance)
+            return Diagnosis(self._mistake_kind(cell, target), cell, distance)
+
+        if exact:
+            return Diagnosis(Diagnosis.OTHER_VERB, exact[0])
+        return None
+
+    def _mistake_rank(self, cell, target):
+        # Prefer the closest explanation: same tense, then same person, then neither
+        return (cell // PERSON_COUNT != target // PERSON_COUNT, cell % PERSON_COUNT != target % PERSON_COUNT)
+
+    def _mistake_kind(self, cell, target):
+        same_tense = cell // PERSON_COUNT == target // PERSON_COUNT
+        if same_tense:
+            return Diagnosis.WRONG_PERSON
+        if cell % PERSON_COUNT == target % PERSON_COUNT:
+            return Diagnosis.WRONG_TENSE
+        return Diagnosis.WRONG_FORM
+
     def get_verb_info(self, verb):
         """Get all conjugations for a specific verb."""
-        if verb in self.verbs_data:
-            return self.verbs_data[verb]
-        return None
-    
+        verb_idx = self.verb_index.get(verb)
+        if verb_idx is None:
+            return None
+        start = verb_idx * len(TENSE_LIST) * PERSON_COUNT
+        return {
+            tense: list(self.forms[start + tense_idx * PERSON_COUNT:start + (tense_idx + 1) * PERSON_COUNT])
+            for tense_idx, tense in enumerate(TENSE_LIST)
+        }
+
     def get_total_verbs(self):
         """Get the total number of verbs in the database."""
         return len(self.verb_list)
-    
+
     def get_random_verb(self):
         """Get a random verb from the database."""
         return random.choice(self.verb_list)
-    
+
     def get_random_challenge_by_group(self, tense_group):
         """Generate a random verb conjugation challenge for a specific tense group."""
         # Get tenses for the group
         if tense_group not in TENSE_GROUPS:
             return self.get_random_challenge()
-        
+
         tenses = TENSE_GROUPS[tense_group]['tenses']
-        
-        # Select random verb
-        verb = random.choice(self.verb_list)
-        
-        # Select random tense from the group
-        tense = random.choice(tenses)
-        
-        # Select random person (0-5 for yo, tú, él/ella, nosotros, vosotros, ellos/ellas)
-        person_index = random.randint(0, 5)
-        person = PERSONS[person_index]
-        
-        # Get the correct answer
-        correct_answer = self.verbs_data[verb][tense][person_index]
-        
-        return {
-            'verb': verb,
-            'tense': tense,
-            'tense_display': TENSES[tense],
-            'tense_display_ru': TENSES_RUSSIAN[tense],
-            'person': person,
-            'person_ru': PERSONS_RUSSIAN[person_index],
-            'person_index': person_index,
-            'correct_answer': correct_answer,
-            'verb_translation': self.verb_translations.get(verb, verb),
-            'tense_group': tense_group
-        }
-    
+
+        verb_idx = random.randrange(len(self.verb_list))
+        tense_idx = TENSE_INDEX[random.choice(tenses)]
+        person_index = random.randrange(PERSON_COUNT)
+
+        return self.make_challenge(verb_idx, tense_idx, person_index, tense_group=tense_group)
+
     def get_verb_translation(self, verb):
         """Get Russian translation for a verb."""
         return self.verb_translations.get(verb, verb)
-    
+
     def get_tense_groups(self):
         """Get all available tense groups."""
         return TENSE_GROUPS
-    
+
+    def get_tense_pool(self, tense_group_keys):
+        """Get the frozen tuple of tense indices covered by a combination of tense groups."""
+        key = frozenset(group_key for group_key in tense_group_keys if group_key in TENSE_GROUPS)
+        pool = self._tense_pools.get(key)
+        if pool is None:
+            # Collect all tenses from selected groups, in table order and without duplicates
+            tenses = set()
+            for group_key in key:
+                tenses.update(TENSE_GROUPS[group_key]['tenses'])
+            # Fallback to all tenses if no valid groups
+            pool = tuple(TENSE_INDEX[tense] for tense in TENSE_LIST if tense in tenses) or tuple(range(len(TENSE_LIST)))
+            self._tense_pools[key] = pool
+        return pool
+
+    def pool_offsets(self, tense_group_keys):
+        """Get the positions within a verb's cells covered by a combination of tense groups.
+
+        A cell of the pool is verb_idx * len(TENSE_LIST) * PERSON_COUNT plus one
+        of these, so the table grows with the tenses and persons, not the verbs.
+        """
+        pool = self.get_tense_pool(tense_group_keys)
+        offsets = self._pool_offsets.get(pool)
+        if offsets is None:
+            offsets = self._pool_offsets[pool] = tuple(
+                tense_idx * PERSON_COUNT + person_index for tense_idx in pool for person_index in range(PERSON_COUNT)
+            )
+        return offsets
+
+    def sample_cells(self, tense_group_keys, n):
+        """Draw n random table cells for the given tense groups in one sampling pass.
+
+        The verb and the position within the verb are drawn independently and
+        combined with map(), so there is no per-item Python code. Returns an
+        array of flat table indices (see cell_index); bulk consumers should read
+        forms through these rather than build Challenge objects.
+        """
+        stride = len(TENSE_LIST) * PERSON_COUNT
+        verb_starts = map(stride.__mul__, random.choices(range(len(self.verb_list)), k=n))
+        return array('I', map(operator.add, verb_starts, random.choices(self.pool_offsets(tense_group_keys), k=n)))
+
+    def challenge_from_cell(self, cell, tense_group=None, selected_groups=None):
+        """Build a Challenge from a flat table index."""
+        rest, person_index = divmod(cell, PERSON_COUNT)
+        verb_idx, tense_idx = divmod(rest, len(TENSE_LIST))
+        return Challenge(
+            verb_idx,
+            tense_idx,
+            person_index,
+            self.verb_list[verb_idx],
+            self.forms[cell],
+            self.translation_list[verb_idx],
+            tense_group,
+            selected_groups,
+        )
+
+    def get_challenges(self, tense_group_keys, n):
+        """Generate n random challenges for multiple tense groups at once (one object each; see sample_cells)."""
+        return [
+            self.challenge_from_cell(cell, selected_groups=tense_group_keys)
+            for cell in self.sample_cells(tense_group_keys, n)
+        ]
+
     def get_random_challenge_by_groups(self, tense_group_keys):
         """Generate a random verb conjugation challenge for multiple tense groups."""
-        # Collect all tenses from selected groups
-        all_tenses = []
-        for group_key in tense_group_keys:
-            if group_key in TENSE_GROUPS:
-                all_tenses.extend(TENSE_GROUPS[group_key]['tenses'])
-        
-        # Remove duplicates
-        all_tenses = list(set(all_tenses))
-        
-        if not all_tenses:
-            # Fallback to all tenses if no valid groups
-            all_tenses = list(TENSES.keys())
-        
-        # Select random verb
-        verb = random.choice(self.verb_list)
-        
-        # Select random tense from collected tenses
-        tense = random.choice(all_tenses)
-        
-        # Select random person (0-5 for yo, tú, él/ella, nosotros, vosotros, ellos/ellas)
-        person_index = random.randint(0, 5)
-        person = PERSONS[person_index]
-        
-        # Get the correct answer
-        correct_answer = self.verbs_data[verb][tense][person_index]
-        
-        return {
-            'verb': verb,
-            'tense': tense,
-            'tense_display': TENSES[tense],
-            'person': person,
-            'person_index': person_index,
-            'correct_answer': correct_answer,
-            'verb_translation': self.verb_translations.get(verb, verb),
-            'selected_groups': tense_group_keys
-        }
+        cell = random.randrange(len(self.verb_list)) * len(TENSE_LIST) * PERSON_COUNT + random.choice(
+            self.pool_offsets(tense_group_keys))
+        return self.challenge_from_cell(cell, selected_groups=tense_group_keys)
@@ -0,0 +1,117 @@
+"""
+Webhook-reply mode.
+
+Telegram lets a webhook answer an update by returning one Bot API method call
+in the HTTP response body. ReplyCaptureRequest sits in front of the real
+request backend and, while an update is processed under capture_reply(),
+holds back the first outgoing call, answers the handler with a synthetic
+result, and hands the call to the webhook so it can be put in the response.
+Any further calls go over HTTP as usual.
+"""
+
+import contextvars
+import json
+import time
+from telegram.request import BaseRequest
+import metrics
+
+# Methods that can be returned in the webhook response
+REPLYABLE_METHODS = frozenset({'sendMessage', 'editMessageText', 'answerCallbackQuery', 'answerInlineQuery'})
+
+# Calls whose delivery order relative to other calls doesn't matter to the user
+ORDER_INDEPENDENT_METHODS = frozenset({'answerCallbackQuery', 'answerInlineQuery'})
+
+WEBHOOK_REPLIES = metrics.counter('webhook_replies_total', 'Bot API calls returned in the webhook response', ('method',))
+
+# Per-update capture state: None outside capture_reply()
+_capture = contextvars.ContextVar('webhook_reply_capture', default=None)
+
+
+class _Capture:
+    __slots__ = ('call', 'closed')
+
+    def __init__(self):
+        # (url, method, request_data, api_method) of the held-back call
+        self.call = None
+        # Set once a held-back call had to be sent over HTTP to keep ordering
+        self.closed = False
+
+
+async def capture_reply(coroutine):
+    """Run update processing, returning the held-back call as a webhook response dict (or None)."""
+    capture = _Capture()
+    token = _capture.set(capture)
+    try:
+        await coroutine
+    finally:
+        _capture.reset(token)
+
+    if capture.call is None or capture.closed:
+        return None
+    _, _, request_data, api_method = capture.call
+    WEBHOOK_REPLIES.inc(api_method)
+    reply = {"method": api_method}
+    reply.update(request_data.parameters)
+    return reply
+
+
+def _synthetic_result(api_method, parameters):
+    """Build a plausible successful result for a held-back call."""
+    if api_method in ('answerCallbackQuery', 'answerInlineQuery'):
+        return True
+    # sendMessage / editMessageText return the (new) message
+    chat_id = parameters.get('chat_id', 0)
+    return {
+        "message_id": parameters.get('message_id', 0),
+        "date": int(time.time()),
+        "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": "private"},
+        "text": parameters.get('text', ''),
+    }
+
+
+class ReplyCaptureRequest(BaseRequest):
+    """Request backend that can hold back one call per update for the webhook response."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        timeouts = dict(read_timeout=read_timeout, write_timeout=write_timeout,
+                        connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        capture = _capture.get()
+        if capture is None or capture.closed:
+            return await self.inner.do_request(url, method, request_data=request_data, **timeouts)
+
+        api_method = url.rsplit('/', 1)[-1]
+        replyable = (
+            api_method in REPLYABLE_METHODS
+            and request_data is not None
+            and not request_data.contains_files
+        )
+
+        if capture.call is None and replyable:
+            # Hold this call back for the webhook response
+            capture.call = (url, method, request_data, api_method)
+            result = _synthetic_result(api_method, request_data.parameters)
+            return 200, json.dumps({"ok": True, "result": result}).encode('utf-8')
+
+        if capture.call is not None and not (
+            capture.call[3] in ORDER_INDEPENDENT_METHODS or api_method in ORDER_INDEPENDENT_METHODS
+        ):
+            # A later call must not overtake the held-back one: send it now
+            held_url, held_method, held_data, _ = capture.call
+            capture.closed = True
+            await self.inner.do_request(held_url, held_method, request_data=held_data, **timeouts)
+
+        return await self.inner.do_request(url, method, request_data=request_data, **timeouts)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Pre-forked multi-process webhook server for self-hosting.
+
+The parent process loads the verb data and builds its indexes, then forks
+one worker per core; the workers share those pages copy-on-write. Each
+worker serves the api/webhook.py handler on a local port, and the parent
+forwards every update to the worker chosen by hashing its user (or chat)
+ID. A user's updates therefore always reach the same process, so the
+in-memory sessions in bot_handlers.py stay valid without a shared store.
+The parent finds the ID with a byte-level scan of the body instead of
+parsing it, and keeps keep-alive connections to the workers open.
+Users are hashed into answer log shards, as many for every worker, each
+owned by one worker; a worker count that needs another number of shards
+has the logs re-split before the workers start.
+
+Unix only (uses fork). Usage:
+    python webhook_server.py --port 8443 --workers 4
+    python webhook_server.py --port 8443 --url https://bot.example.com/   # also calls setWebhook
+"""
+
+import argparse
+import gc
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from answer_log import reshard, user_shard
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Updates Telegram may send at once per worker (setWebhook's max_connections is 1-100)
+CONNECTIONS_PER_WORKER = 8
+MAX_CONNECTIONS = 100
+
+# Seconds to wait for a worker to answer a forwarded update
+FORWARD_TIMEOUT = 60
+
+# Least number of answer log shards. The shard count is the smallest multiple of the
+# worker count from here, so every worker owns as many shards (and users); worker
+# counts that divide it share one layout and just move whole shards between workers.
+ANSWER_LOG_SHARDS = 16
+
+# The first user (or chat) object of a raw update. Telegram writes "from" before "chat" and
+# the update's own sender before any nested message's, and a quote inside a string value
+# is escaped, so this is the sender shard_key() would find
+_SENDER_ID = re.compile(rb'"(?:from|chat)"\s*:\s*\{\s*"id"\s*:\s*(-?\d+)')
+
+# Update fields that carry the sender, in the order they are checked
+_UPDATE_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'channel_post', 'edited_channel_post',
+)
+
+
+def shard_key(update):
+    """Routing key of a raw update: the sender's ID, else the chat's, else None.
+
+    Sessions are keyed by user ID, which is the chat ID in private chats.
+    """
+    for field in _UPDATE_FIELDS:
+        payload = update.get(field)
+        if not isinstance(payload, dict):
+            continue
+        sender = payload.get('from')
+        if isinstance(sender, dict) and 'id' in sender:
+            return sender['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+def answer_log_shards(workers):
+    """Number of answer log shards for a worker count: a multiple of it, at least ANSWER_LOG_SHARDS."""
+    return -(-ANSWER_LOG_SHARDS // workers) * workers
+
+
+def shard_key_from_body(body):
+    """Routing key of an update's raw JSON body without parsing it (falls back to shard_key())."""
+    match = _SENDER_ID.search(body)
+    if match:
+        return int(match.group(1))
+    try:
+        update = json.loads(body)
+    except ValueError:
+        return None
+    return shard_key(update) if isinstance(update, dict) else None
+
+
+def shard_for(key, workers):
+    """Worker index for a routing key: the worker that owns the user's answer log shard."""
+    if key is None:
+        return 0
+    return user_shard(key, answer_log_shards(workers)) % workers
+
+
+def worker_shards(index, workers):
+    """Answer log shards owned by a worker."""
+    return [shard for shard in range(answer_log_shards(workers)) if shard % workers == index]
+
+
+def webhook_max_connections(workers):
+    """setWebhook max_connections matched to the number of workers."""
+    return max(1, min(MAX_CONNECTIONS, workers * CONNECTIONS_PER_WORKER))
+
+
+def load_shared_state():
+    """Load everything the workers share before forking."""
+    start = time.perf_counter()
+    # Importing the handlers here puts python-telegram-bot in the shared pages too
+    from api import webhook  # noqa: F401
+    from bot_handlers import get_verb_engine
+    get_verb_engine().build_indexes()
+    # Keep the garbage collector from touching (and so copying) the shared objects in the workers
+    gc.freeze()
+    logger.info(f"Verb data loaded in {time.perf_counter() - start:.2f} s")
+
+
+def worker_handler_class():
+    """api/webhook.py's handler, writing each response with a single send."""
+    from api import webhook
+
+    class WorkerHandler(webhook.handler):
+        # Keep-alive, so the parent reuses its connections to this worker
+        protocol_version = 'HTTP/1.1'
+        # Buffered: headers and body go out together instead of waiting for a delayed ACK
+        wbufsize = -1
+
+        def log_message(self, format, *args):
+            pass
+
+    return WorkerHandler
+
+
+def run_worker(index, server, workers):
+    """Worker process body: serve the webhook handler until terminated."""
+    import bot_handlers
+    from api import webhook
+
+    # Every worker must draw its own challenges
+    random.seed()
+    # Connections opened by the parent (e.g. SQLite) must not be shared across processes
+    bot_handlers.session_store = bot_handlers.create_session_store()
+    # The answer logs of the shards routed to this worker
+    from config import ANSWER_LOG_PATH
+    if ANSWER_LOG_PATH:
+        bot_handlers._answer_log = bot_handlers.create_answer_log(
+            ANSWER_LOG_PATH, worker_shards(index, workers), answer_log_shards(workers))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        webhook.get_or_create_application()
+    except Exception as e:
+        # Retried on the first update
+        logger.warning(f"Worker {index} could not initialize the bot yet: {e}")
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving on port {server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        # WorkerPool.spawn leaves with os._exit(), which skips atexit: write buffered answers and sessions now
+        if bot_handlers._answer_log is not None:
+            bot_handlers._answer_log.close()
+        bot_handlers.session_store.close()
+
+
+class WorkerPool:
+    """Forked worker processes, each bound to a local port created by the parent."""
+
+    def __init__(self, workers):
+        handler = worker_handler_class()
+        self.servers = [ThreadingHTTPServer(('127.0.0.1', 0), handler) for _ in range(workers)]
+        for server in self.servers:
+            server.daemon_threads = True
+        self.ports = [server.server_address[1] for server in self.servers]
+        self.pids = {}
+        # Parent sockets a restarted worker must not keep open (e.g. the public listener)
+        self.close_in_workers = []
+
+    def __len__(self):
+        return len(self.servers)
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                for other, server in enumerate(self.servers):
+                    if other != index:
+                        server.server_close()
+                for server in self.close_in_workers:
+                    server.socket.close()
+                run_worker(index, self.servers[index], len(self.servers))
+            except SystemExit as e:
+                status = e.code or 0
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                status = 1
+            finally:
+                # Never return into the parent's code
+                os._exit(status)
+        self.pids[pid] = index
+
+    def start(self):
+        for index in range(len(self.servers)):
+            self.spawn(index)
+
+    def supervise(self, stopping):
+        """Restart workers that exit until stopping() is true (blocks)."""
+        while not stopping():
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                return
+            except InterruptedError:
+                continue
+            index = self.pids.pop(pid, None)
+            if index is not None and not stopping():
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+                self.spawn(index)
+
+    def stop(self):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids.clear()
+
+
+class UpstreamConnections:
+    """Idle keep-alive connections to each worker, shared by the proxy's threads."""
+
+    def __init__(self, ports):
+        self.ports = ports
+        self._idle = [[] for _ in ports]
+        self._lock = threading.Lock()
+
+    def request(self, worker, method, path, body=None, headers=None):
+        """Send a request to a worker and return (status, content type, body).
+
+        A reused connection the worker has closed meanwhile is replaced once.
+        """
+        while True:
+            with self._lock:
+                connection = self._idle[worker].pop() if self._idle[worker] else None
+            reused = connection is not None
+            if connection is None:
+                connection = http.client.HTTPConnection('127.0.0.1', self.ports[worker], timeout=FORWARD_TIMEOUT)
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle[worker].append(connection)
+            return response.status, response.getheader('Content-Type', 'application/json'), data
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle:
+                for connection in connections:
+                    connection.close()
+                connections.clear()
+
+
+def make_proxy_handler(pool):
+    """Front handler that forwards each update to its user's worker."""
+    upstream = UpstreamConnections(pool.ports)
+
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+
+        def log_message(self, format, *args):
+            pass
+
+        def _respond(self, status, content_type, body, headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _forward(self, worker, method, body=None):
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            try:
+                status, content_type, data = upstream.request(worker, method, self.path, body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                # Worker restarting: Telegram retries the update later
+                logger.error(f"Worker {worker} unavailable: {e}")
+                self._respond(503, 'application/json', b'{"error": "Worker unavailable"}',
+                              [('Retry-After', '1')])
+                return
+            self._respond(status, content_type, data)
+
+        def do_GET(self):
+            """Health check; ?metrics, ?profile etc. are answered by worker ?worker=N (default 0)."""
+            url = urlparse(self.path)
+            query = parse_qs(url.query, keep_blank_values=True)
+            if not query:
+                body = json.dumps({"status": "Telegram Bot Webhook is running", "workers": len(pool)})
+                self._respond(200, 'application/json', body.encode('utf-8'))
+                return
+            try:
+                worker = int(query.get('worker', ['0'])[0])
+            except ValueError:
+                worker = -1
+            if not 0 <= worker < len(pool):
+                self._respond(404, 'application/json', b'{"error": "No such worker"}')
+                return
+            self._forward(worker, 'GET')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            # The worker validates the JSON; here only the sender's ID is looked up
+            self._forward(shard_for(shard_key_from_body(body), len(pool)), 'POST', body)
+
+    return ProxyHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the webhook as a pre-forked multi-process server")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8443, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--url", help="Public webhook URL to register with setWebhook")
+    parser.add_argument("--max-connections", type=int,
+                        help=f"setWebhook max_connections (default: {CONNECTIONS_PER_WORKER} per worker, at most {MAX_CONNECTIONS})")
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        logger.error("webhook_server.py needs fork(); use api/asgi.py or main.py on this platform")
+        return 1
+
+    workers = max(1, args.workers)
+    from config import ANSWER_LOG_PATH
+    if ANSWER_LOG_PATH and reshard(ANSWER_LOG_PATH, answer_log_shards(workers)):
+        logger.info(f"Answer log split into {answer_log_shards(workers)} shards for {workers} workers")
+
+    load_shared_state()
+    pool = WorkerPool(workers)
+    pool.start()
+
+    proxy = ThreadingHTTPServer((args.host, args.port), make_proxy_handler(pool))
+    proxy.daemon_threads = True
+    pool.close_in_workers.append(proxy)
+    threading.Thread(target=proxy.serve_forever, name="webhook-proxy", daemon=True).start()
+    logger.info(f"Forwarding updates from {args.host}:{args.port} to {len(pool)} workers")
+
+    if args.url:
+        from set_webhook import set_webhook
+        set_webhook(args.url, args.max_connections or webhook_max_connections(len(pool)))
+
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+        # Wake os.wait() up by stopping the workers
+        pool.stop()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    pool.supervise(lambda: bool(stopping))
+    proxy.shutdown()
+    logger.info("Stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())